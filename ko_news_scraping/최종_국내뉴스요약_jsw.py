@@ -3,6 +3,7 @@ import pandas as pd
 import numpy as np
 import time
 import json
+import sys
 from datetime import timedelta
 import datetime
 ##뉴스스크랩
@@ -25,6 +26,21 @@ from google import genai
 from google.genai import types
 import pytz
 
+###########################################################
+# 0. 공용 모듈 (LLM 호출 기록, 동시 실행, 임베딩 캐시, 요약본 일괄 임베딩, 본문 압축, 일괄 요약)
+# 해외 뉴스 스크래퍼, 기업설명 노트북과 같은 코드를 사용하도록 저장소 루트의 scraping_common.py에서 가져온다
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # 저장소 루트 (Docker 이미지에서는 같은 폴더에 복사됨)
+from scraping_common import (
+    record_llm_call, RateLimiter, run_concurrently, save_failures, estimate_tokens, compress_article, summarize_articles,
+    get_summary_embeddings,
+)
+
+# 공급자별 분당 호출 제한 (스레드 간 공유)
+RATE_LIMITERS = {
+    "clova": RateLimiter(int(os.environ.get("CLOVA_RPM", "60"))),
+    "embedding": RateLimiter(int(os.environ.get("GEMINI_EMBEDDING_RPM", "100"))),
+}
+
 ##############################
 # 1. 연합뉴스 리스트 크롤링
 
@@ -201,12 +217,15 @@ class CompletionExecutor:
         self._host = host
         self._api_key = api_key
         self._request_id = request_id
+        self.last_usage = {} # 마지막 호출의 토큰 사용량 ('result' 이벤트의 usage)
 
     def execute(self, completion_request):
         """
         API를 실행하고 스트리밍 응답에서 [DONE] 직전의 최종 content를 추출하여 반환합니다.
+        토큰 사용량은 self.last_usage에 저장합니다.
         자세한 설명은 '주식 추출' 항목 참조
         """
+        self.last_usage = {}
         headers = {
             'Authorization': self._api_key,
             'X-NCP-CLOVASTUDIO-REQUEST-ID': self._request_id,
@@ -233,6 +252,8 @@ class CompletionExecutor:
                     try:
                         json_str = decoded_line[len('data:'):].strip()
                         data = json.loads(json_str)
+                        if data.get('usage'):
+                            self.last_usage = data['usage']
                         if 'message' in data and 'content' in data['message']:
                             if data['message']['content']:
                                 final_content = data['message']['content']
@@ -245,6 +266,7 @@ def analyze_news_content(content):
     """
     뉴스 본문을 받아 LLM API로 요약, 주요 기업, 이벤트를 JSON 형식으로 요청하고 파싱하여 반환합니다.
     자세한 설명은 '주식 추출' 항목 참조
+    호출 실패나 빈 응답은 예외로 전달하여 run_concurrently가 기사별 실패로 기록하도록 합니다.
     """
     if not isinstance(content, str) or not content.strip():
         return "내용 없음"
@@ -276,56 +298,155 @@ def analyze_news_content(content):
         'seed': 0
     }
 
+    started = time.perf_counter()
     try:
         result = completion_executor.execute(request_data)
-        time.sleep(0.5)
-        return result if result else "응답 없음"
+        record_llm_call(
+            "clova", "HCX-DASH-002", "ko_news_summary",
+            prompt_tokens=completion_executor.last_usage.get('promptTokens'),
+            completion_tokens=completion_executor.last_usage.get('completionTokens'),
+            latency_sec=time.perf_counter() - started, outcome="success" if result else "error",
+        )
+    except Exception:
+        record_llm_call("clova", "HCX-DASH-002", "ko_news_summary", latency_sec=time.perf_counter() - started, outcome="error")
+        raise
+
+    if not result:
+        raise ValueError("응답 없음")
+    return result
+
+#########################
+# 요약 전 본문 압축
+## 본문 압축(compress_article)은 scraping_common.py의 공용 함수를 사용하고, 여기서는 한국어 기사용 문장/단어 분리와 안내 문구만 정의한다
+## 본문이 비었거나(pd.NA, 수집 오류) 영상만 있는 페이지는 API 호출 전에 제외한다
+ARTICLE_TOKEN_BUDGET = int(os.environ.get("ARTICLE_TOKEN_BUDGET", "1200")) # 기사 하나의 최대 입력 토큰
+MIN_ARTICLE_CHARS = 100 # 이보다 짧은 본문은 요약할 내용이 없는 페이지로 본다
+VIDEO_ONLY_PATTERN = re.compile(r"(\[영상\]|\(영상\)|동영상|영상 보기|재생)")
+BOILERPLATE_PATTERN = re.compile(r"(무단 전재|재배포 금지|제보는 카톡|저작권자|[\w.]+@[\w.]+)")
+STOPWORDS = {"있다", "했다", "밝혔다", "있는", "것으로", "대한", "위해", "이번", "지난", "또한", "기자", "연합뉴스"}
+
+def is_empty_article(text):
+    """본문이 없거나(수집 오류 포함), 짧은 안내 문구와 영상만 있는 페이지인지 확인합니다."""
+    if not isinstance(text, str) or text.startswith("오류 발생") or len(text.strip()) < MIN_ARTICLE_CHARS:
+        return True
+    # 영상 기사는 본문 대신 짧은 소개 문구만 있다
+    return len(text) < MIN_ARTICLE_CHARS * 3 and bool(VIDEO_ONLY_PATTERN.search(text))
+
+def split_sentences(text):
+    return [s.strip() for s in re.split(r"(?<=[.!?])\s+", text) if s.strip()]
+
+def _words(sentence):
+    return [w for w in re.findall(r"[가-힣A-Za-z0-9]{2,}", sentence) if w not in STOPWORDS]
+
+#########################
+# 여러 기사 일괄 요약
+## 기사마다 호출하면 호출 수와 대기시간이 기사 수만큼 늘어나므로 여러 기사를 한 요청에 묶는다
+## 묶음 구성과 재시도(summarize_articles)는 scraping_common.py의 공용 함수를 사용하고, 여기서는 CLOVA X 일괄 요약 호출과 응답 파싱만 정의한다
+SUMMARY_BATCH_TOKEN_BUDGET = int(os.environ.get("SUMMARY_BATCH_TOKEN_BUDGET", "6000")) # 한 요청에 넣는 기사 본문의 토큰 상한
+SUMMARY_BATCH_MAX_ARTICLES = 8 # 한 요청에 넣는 최대 기사 수
+SUMMARY_TOKENS_PER_ARTICLE = 256 # 기사 하나의 요약에 할당하는 출력 토큰 수
+
+def parse_batch_summaries(text, batch_ids):
+    """응답에서 JSON 배열을 찾아 {기사 id: 요약문}으로 변환합니다. (배열이 없으면 빈 dict)"""
+    match = re.search(r"\[.*\]", text or "", re.DOTALL)
+    if not match:
+        return {}
+    try:
+        items = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+    summaries = {}
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        try:
+            article_id = int(item.get("id"))
+        except (TypeError, ValueError):
+            continue
+        summary = str(item.get("summary", "")).strip()
+        if article_id in batch_ids and summary:
+            summaries[article_id] = summary
+    return summaries
+
+def analyze_news_batch(batch):
+    """
+    여러 기사를 한 번의 CLOVA X 호출로 요약하여 {기사 id: 요약문}을 반환합니다.
+    batch는 (기사 id, 본문) 목록이며, 실패하면 빈 dict를 반환합니다. (호출 측에서 개별 재시도)
+    """
+    api_key_with_bearer = f'Bearer {os.environ.get("CLOVA_API_KEY")}'
+    completion_executor = CompletionExecutor(
+        host='https://clovastudio.stream.ntruss.com',
+        api_key=api_key_with_bearer,
+        request_id=os.environ.get("CLOVA_REQUEST_ID")
+    )
 
-    except Exception as e:
-        print(f"API 처리 중 오류 발생: {e}")
-        # 오류 발생 시에도 단일 문자열 반환
-        return "오류 발생"
-    
-# 함수 실행
-news_summary = news_df.copy()
-news_summary["summary"] = news_summary['content'].apply(analyze_news_content)
+    articles_text = "\n\n".join(f"### 기사 id={article_id} ###\n{text}" for article_id, text in batch)
+    preset_text = [
+        {"role":"system","content":(
+            "너는 증권 분석가야. 아래 여러 뉴스 본문을 각각 분석하고, 기사마다 금융 및 증권 분석에 필요한 핵심 정보만 담아서 "
+            "한국어 세 문장으로 요약해줘. (긍정, 부정, 중립적 뉘앙스 포함) "
+            '결과는 다른 설명 없이 기사마다 하나씩 [{"id": 기사 id, "summary": "요약문"}] 형태의 JSON 배열로만 답해줘.'
+        )},
+        {"role":"user","content": articles_text}
+    ]
 
-################################
-# 4. 벡터화 (임베딩)
-# 벡터화는 Google Gemini API를 사용하여 진행
-API_KEY = os.environ.get("GEMINI_API_KEY")
+    request_data = {
+        'messages': preset_text,
+        'topP': 0.8,
+        'topK': 0,
+        'maxTokens': min(4096, SUMMARY_TOKENS_PER_ARTICLE * len(batch)), # 기사 수에 비례한 출력 토큰
+        'temperature': 0.5,
+        'repetitionPenalty': 1.1,
+        'stop': [],
+        'includeAiFilters': True,
+        'seed': 0
+    }
 
-def get_summary_embedding(summary_text: str, client: genai.Client) -> list[float] | None:
-    """
-    하나의 요약본 텍스트를 받아 임베딩 벡터를 반환하는 함수.
-    자세한 설명은 '기업 설명 한글번역' 항목 참조
-    """
-    # 1. 요약본 내용이 비어있는지 확인
-    if not summary_text or pd.isna(summary_text):
-        return None
-    
+    started = time.perf_counter()
     try:
-        # 2. 'contents'가 아닌 'content' 파라미터로 단일 텍스트를 전달
-        result = client.models.embed_content(
-            model="models/text-embedding-004",
-            contents=summary_text,
-            config=types.EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT")
+        result = completion_executor.execute(request_data)
+        summaries = parse_batch_summaries(result, {article_id for article_id, _ in batch})
+        record_llm_call(
+            "clova", "HCX-DASH-002", "ko_news_summary_batch",
+            prompt_tokens=completion_executor.last_usage.get('promptTokens'),
+            completion_tokens=completion_executor.last_usage.get('completionTokens'),
+            latency_sec=time.perf_counter() - started, outcome="success" if summaries else "error",
         )
-        # 3. 결과 객체에서 .embedding 속성으로 벡터를 직접 반환
-        vectors = [obj.values for obj in result.embeddings]
-        vectors=vectors[0]
+        return summaries
 
-        return vectors
-    
     except Exception as e:
-        print(f"API Error embedding '{summary_text[:50]}...': {e}")
-        return None
+        print(f"일괄 요약 중 오류 발생: {e}")
+        record_llm_call("clova", "HCX-DASH-002", "ko_news_summary_batch", latency_sec=time.perf_counter() - started, outcome="error")
+        return {}
+
+# 함수 실행
+# 빈 페이지/영상 페이지 제외 후 압축한 본문으로 요약
+empty_mask = news_df['content'].apply(is_empty_article)
+if empty_mask.any():
+    print(f"본문이 없거나 영상만 있는 기사 {int(empty_mask.sum())}개를 제외합니다.")
+news_summary = news_df[~empty_mask].reset_index(drop=True)
+compressed = [compress_article(content, ARTICLE_TOKEN_BUDGET, split_sentences, _words, BOILERPLATE_PATTERN) for content in news_summary['content']]
+print(f"본문 압축: 약 {sum(estimate_tokens(c) for c in news_summary['content'])} → {sum(estimate_tokens(c) for c in compressed)} 토큰")
+summaries, failures = summarize_articles(
+    compressed, analyze_news_content, analyze_news_batch,
+    RATE_LIMITERS["clova"], "ko_news_summary", SUMMARY_BATCH_TOKEN_BUDGET, SUMMARY_BATCH_MAX_ARTICLES,
+)
+news_summary["summary"] = summaries
 
+################################
+# 4. 벡터화 (임베딩)
+# 벡터화는 Google Gemini API를 사용하여 진행
+API_KEY = os.environ.get("GEMINI_API_KEY")
+# 요약본 일괄 임베딩(get_summary_embeddings)은 scraping_common.py의 공용 함수를 사용한다
 
 # API 실행
 if __name__ == "__main__":
     client = genai.Client(api_key=API_KEY)
-    news_summary['embedding'] = news_summary['summary'].apply(lambda text: get_summary_embedding(text, client))
+    embeddings, embedding_failures = get_summary_embeddings(news_summary['summary'].tolist(), client, RATE_LIMITERS["embedding"], "ko_news_embedding")
+    news_summary['embedding'] = embeddings
+
+    # 요약/임베딩에 실패한 기사는 기록해두고 업로드에서 제외 (다음 실행에서 다시 수집됨)
+    news_summary = save_failures(news_summary, failures + embedding_failures)
 
 #######################################
 # 5. Supabase에 저장
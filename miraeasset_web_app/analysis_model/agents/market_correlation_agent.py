@@ -2,12 +2,13 @@
 # 3. 시장 데이터 분석 에이전트
 
 import pandas as pd
-from typing import Dict, Any, List, Set
+from typing import Dict, Any, List, Set, Tuple
 from datetime import datetime, timedelta
 
 from ..state import AnalysisState, MarketAnalysisResult, NewsImpactData, TickerPriceData
 from .data_prep_agent import supabase_client
 from .news_analyst_agent import METRICS_MAP # 뉴스 분석 에이전트에서 METRICS_MAP 파일 불러오기
+from ..prefetch import get_prefetched # 종목 선택 시 미리 조회해둔 가격 데이터
 
 ################################
 # 상관관계 설명 함수
@@ -27,26 +28,30 @@ def get_correlation_text(kor_name: str, metric_name: str, corr_value: float) ->
 
 ################################
 # 데이터베이스에서 주식 데이터를 조회하는 함수
-def get_stock_data_from_supabase(ticker: str, start_date_str: str, end_date_str: str) -> pd.DataFrame | None:
-    """Supabase DB에서 특정 기간의 시계열 데이터를 조회합니다."""
-    
-    table_name, time_col, price_col, ticker_filter_col = "", "time", "close_price", "ticker" # Default values
+def price_window() -> Tuple[str, str]:
+    """장기 주식 데이터 조회 기간 (오늘 기준 최대 2년)을 'YYYY-MM-DD' 문자열로 반환합니다."""
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=365 * 2)
+    return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+
+PRICE_PAGE_SIZE = 1000 # Supabase가 한 번의 요청에 반환하는 최대 행 수 (일괄 조회 시 이 단위로 나누어 조회)
 
+def _price_source(ticker: str) -> Tuple[str, str, str, str]:
+    """티커의 시계열 데이터가 저장된 (테이블, 날짜 컬럼, 가격 컬럼, 티커 컬럼)을 반환합니다."""
     if ticker.startswith('^') or ticker.endswith('=X'): # 주요지표
-        table_name = "financial_indices"
-        time_col = "date"
-        price_col = "value"
-        ticker_filter_col = "index_en"
+        return "financial_indices", "date", "value", "index_en"
     elif ticker.endswith('.KS') or ticker.endswith('.KQ'): # 한국 기업 주식
-        table_name = "korean_stocks"
-        time_col = "time"
-        price_col = "close_price"
-        ticker_filter_col = "ticker"
+        return "korean_stocks", "time", "close_price", "ticker"
     else: # 미국 기업 주식
-        table_name = "us_stocks"
-        time_col = "time"
-        price_col = "close_price"
-        ticker_filter_col = "ticker"
+        return "us_stocks", "time", "close_price", "ticker"
+
+def get_stock_data_from_supabase(ticker: str, start_date_str: str, end_date_str: str) -> pd.DataFrame | None:
+    """Supabase DB에서 특정 기간의 시계열 데이터를 조회합니다. (미리 조회해둔 결과가 있으면 사용)"""
+    prefetched = get_prefetched(ticker, "prices", (start_date_str, end_date_str))
+    if prefetched is not None:
+        return prefetched
+    
+    table_name, time_col, price_col, ticker_filter_col = _price_source(ticker)
 
     try:
         # 데이터 추출
@@ -68,6 +73,43 @@ def get_stock_data_from_supabase(ticker: str, start_date_str: str, end_date_str:
         print(f"    ⚠️ Supabase에서 '{ticker}' 데이터 조회 중 오류: {e}")
         return None
 
+def get_stock_data_batch(tickers: List[str], start_date_str: str, end_date_str: str) -> Dict[str, pd.DataFrame]:
+    """
+    여러 티커의 시계열 데이터를 테이블마다 한 번의 쿼리(in 필터)로 조회하여 {티커: 데이터프레임}으로 반환합니다. (포트폴리오 일괄 분석용)
+    데이터프레임 형식은 get_stock_data_from_supabase와 같으며, 데이터가 없는 티커는 결과에 포함하지 않습니다.
+    """
+    tickers_by_source: Dict[Tuple[str, str, str, str], List[str]] = {}
+    for ticker in dict.fromkeys(tickers):
+        tickers_by_source.setdefault(_price_source(ticker), []).append(ticker)
+
+    results: Dict[str, pd.DataFrame] = {}
+    for (table_name, time_col, price_col, ticker_filter_col), source_tickers in tickers_by_source.items():
+        rows: List[Dict[str, Any]] = []
+        try:
+            # 결과가 최대 행 수를 넘을 수 있으므로 (티커, 날짜) 순으로 정렬하여 페이지 단위로 조회
+            offset = 0
+            while True:
+                res = supabase_client.table(table_name).select(f"{ticker_filter_col}, {time_col}, {price_col}").in_(ticker_filter_col, source_tickers).gte(time_col, start_date_str).lte(time_col, end_date_str).order(ticker_filter_col).order(time_col).range(offset, offset + PRICE_PAGE_SIZE - 1).execute()
+                rows += res.data or []
+                if len(res.data or []) < PRICE_PAGE_SIZE:
+                    break
+                offset += PRICE_PAGE_SIZE
+        except Exception as e:
+            print(f"    ⚠️ Supabase에서 '{table_name}' 일괄 조회 중 오류: {e}")
+            continue
+        if not rows:
+            continue
+
+        df_all = pd.DataFrame(rows)
+        df_all.rename(columns={price_col: 'close', time_col: 'date'}, inplace=True)
+        df_all['date'] = pd.to_datetime(df_all['date']).dt.date.astype(str)
+        for ticker, df in df_all.groupby(ticker_filter_col, sort=False):
+            df = df[['date', 'close']].drop_duplicates(subset=['date'], keep='last').reset_index(drop=True)
+            results[ticker] = df
+
+    print(f"    -> {len(tickers_by_source)}개 테이블에서 {len(results)}/{len(set(tickers))}개 티커의 시계열 데이터를 일괄 조회했습니다.")
+    return results
+
 ################################
 # 상관관계 계산
 def run_market_correlation(state: AnalysisState) -> Dict[str, Any]:
@@ -124,14 +166,15 @@ def run_market_correlation(state: AnalysisState) -> Dict[str, Any]:
     print(f"분석 대상 전체 고유 지표: {all_analyzed_tickers}")
     
     # 장기 주식 데이터 조회 (최대 2년)
-    end_date = datetime.now()
-    start_date = end_date - timedelta(days=365 * 2)
-    fetch_start_date_str = start_date.strftime('%Y-%m-%d')
-    fetch_end_date_str = end_date.strftime('%Y-%m-%d')
+    fetch_start_date_str, fetch_end_date_str = price_window()
 
     historical_prices_data: Dict[str, List[Dict[str, Any]]] = {}
+    preloaded_prices = state.get("preloaded_prices") or {} # 포트폴리오 일괄 분석에서 함께 조회한 가격
     for ticker in all_analyzed_tickers:
-        df = get_stock_data_from_supabase(ticker, fetch_start_date_str, fetch_end_date_str)
+        if ticker in preloaded_prices:
+            df = preloaded_prices[ticker]
+        else:
+            df = get_stock_data_from_supabase(ticker, fetch_start_date_str, fetch_end_date_str)
         if df is not None and not df.empty:
             historical_prices_data[ticker] = df.to_dict(orient='records')
         else:
@@ -5,9 +5,8 @@
 # 이후 Gemini AI를 사용하여 가장 영향력 있는 뉴스 3개를 선택한다
 
 import os
-import json
 import timez
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
 from supabase import create_client, Client
 import pandas as pd
@@ -19,6 +18,11 @@ from google.genai import types
 
 # state.py 모듈에서 AnalysisState 클래스를 가져오기
 from ..state import AnalysisState, SelectedNews # 상위 폴더임을 입력해야함
+from ..llm_output import news_selection_schema, parse_json_response, record_fallback # 구조화 출력 스키마 및 공용 검증기
+from ..profiles import get_execution_profile # 실행 프로파일 (모델, 추론 예산, 후보 수)
+from ..prompt_cache import generate_with_prefix_cache # 고정 프롬프트 앞부분 컨텍스트 캐싱
+from ..prefetch import get_prefetched # 종목 선택 시 미리 검색해둔 RAG 후보
+from ..cancellation import AnalysisCancelled, CancelToken # 분석 취소 토큰
 
 print("=== news_analyst_agent.py 파일이 로드되었습니다! ===")
 print(f"=== 로드된 파일 경로: {__file__} ===")
@@ -470,12 +474,12 @@ METRICS_MAP = {
 # 1차 : RAG 유사도 검색
 ## 1차로 15개의 뉴스 후보를 검색
 ### 뉴스 요약문과 기업 설명문 임베딩 벡터를 사용
-def search_relevant_news_rag(company_name: str) -> List[Dict[str, str]]:
+def search_relevant_news_rag(company_name: str, top_k: int = 15) -> List[Dict[str, str]]:
     """
-    Supabase에 저장된 벡터를 사용하여, 특정 기업 설명과 가장 유사한 뉴스 15개를 검색합니다.
+    Supabase에 저장된 벡터를 사용하여, 특정 기업 설명과 가장 유사한 뉴스 top_k개(기본 15개)를 검색합니다.
     이때 검색 대상 기업의 티커를 모든 뉴스 결과에 포함하여 반환합니다.
     """
-    print(f"🔍 [News Analyst] Supabase 벡터 검색으로 '{company_name}' 관련 뉴스 15개를 검색합니다.")
+    print(f"🔍 [News Analyst] Supabase 벡터 검색으로 '{company_name}' 관련 뉴스 {top_k}개를 검색합니다.")
 
     try:
         # df_company 데이터프레임에서 분석할 기업의 행을 찾기
@@ -492,8 +496,8 @@ def search_relevant_news_rag(company_name: str) -> List[Dict[str, str]]:
         news_embeddings = np.vstack(df_news['embedding_array'].values)
         similarities = cosine_similarity(company_vec, news_embeddings)[0]
 
-        # 계산된 유사도 점수가 가장 높은 상위 15개 뉴스의 인덱스
-        top_indices = similarities.argsort()[-15:][::-1]
+        # 계산된 유사도 점수가 가장 높은 상위 top_k개 뉴스의 인덱스
+        top_indices = similarities.argsort()[-top_k:][::-1]
 
         # 해당 인덱스의 뉴스 정보(제목, 요약, URL 등)를 추출
         top_news_df = df_news.iloc[top_indices][['title', 'summary', 'url', 'publish_date']]
@@ -506,6 +510,40 @@ def search_relevant_news_rag(company_name: str) -> List[Dict[str, str]]:
         print(f"RAG 뉴스 검색 중 오류가 발생했습니다: {e}")
         return []
 
+def search_relevant_news_rag_batch(company_names: List[str], top_k: int = 15) -> Dict[str, List[Dict[str, str]]]:
+    """
+    여러 기업의 관련 뉴스 top_k개를 한 번에 검색하여 {기업명: 뉴스 후보 목록}으로 반환합니다. (포트폴리오 일괄 분석용)
+    기업 임베딩을 한 행렬로 묶어 뉴스 임베딩과의 유사도를 한 번의 행렬 연산으로 계산하며, 기업별 결과는 search_relevant_news_rag와 같습니다.
+    DB에서 찾지 못한 기업은 결과에 포함하지 않습니다.
+    """
+    print(f"🔍 [News Analyst] Supabase 벡터 검색으로 {len(company_names)}개 기업의 관련 뉴스 {top_k}개씩을 한 번에 검색합니다.")
+
+    try:
+        # 같은 이름의 기업이 여러 행이면 단건 검색과 같이 첫 번째 행을 사용
+        company_rows = df_company[df_company['company_name'].isin(company_names)].drop_duplicates(subset='company_name')
+        missing = set(company_names) - set(company_rows['company_name'])
+        if missing:
+            print(f"경고: DB에서 {sorted(missing)} 기업 정보를 찾을 수 없습니다.")
+        if company_rows.empty:
+            return {}
+
+        # (기업 수 x 뉴스 수) 유사도 행렬을 한 번에 계산
+        company_matrix = np.vstack(company_rows['embedding_array'].values)
+        news_embeddings = np.vstack(df_news['embedding_array'].values)
+        similarities = cosine_similarity(company_matrix, news_embeddings)
+
+        results: Dict[str, List[Dict[str, str]]] = {}
+        for row_similarities, (_, company_row) in zip(similarities, company_rows.iterrows()):
+            top_indices = row_similarities.argsort()[-top_k:][::-1]
+            top_news_df = df_news.iloc[top_indices][['title', 'summary', 'url', 'publish_date']].copy()
+            top_news_df['ticker'] = company_row['ticker']
+            results[company_row['company_name']] = top_news_df[['ticker', 'title', 'summary', 'url', 'publish_date']].to_dict('records')
+        return results
+
+    except Exception as e:
+        print(f"RAG 일괄 뉴스 검색 중 오류가 발생했습니다: {e}")
+        return {}
+
 
 
 
@@ -517,23 +555,27 @@ def select_top_news_with_gemini(
     company_name: str,
     company_description: str,
     news_list: List[Dict[str, str]],
-    us_entities_for_prompt: List[str] # 미국 기업/지표 저장용
+    us_entities_for_prompt: List[str], # 미국 기업/지표 저장용
+    use_grounding: bool = False, # Google 검색 도구 사용 여부
+    model: str = "gemini-2.5-flash", # 사용 모델
+    thinking_budget: int = -1, # 추론 토큰 예산 (-1: 모델 자동, 0: 추론 끔)
+    cancel_token: Optional[CancelToken] = None # 분석이 취소되면 스트리밍 중단
 ) -> List[Dict[str, Any]]:
     """
     Gemini AI를 사용하여 뉴스 3개를 선별하고, 관련된 미국 기업/지표의 티커를 추출합니다.
+    기본적으로 응답 스키마(구조화 출력) 모드로 호출하며, Gemini는 검색 도구와 JSON 응답 모드를
+    함께 지원하지 않으므로 use_grounding=True일 때만 일반 텍스트로 받아 파싱합니다.
     """
-    print("[News Analyst] Gemini AI를 호출하여 15개 뉴스 중 핵심 뉴스 3개를 선별합니다.")
+    print(f"[News Analyst] Gemini AI({model})를 호출하여 {len(news_list)}개 뉴스 중 핵심 뉴스 3개를 선별합니다.")
 
     # 티커 리스트를 프롬프트에 넣기 좋게 문자열로 변환
     entities_prompt_list = ", ".join(f'"{item}"' for item in us_entities_for_prompt)
 
     # 뉴스 분석 프롬프트
-    prompt_parts = [
+    ## 고정 앞부분 (역할, 지시사항, 엔티티 목록) - 요청마다 같으므로 컨텍스트 캐시로 재사용
+    prefix_parts = [
         f"You are a silent JSON-generating robot. Your sole purpose is to return a valid JSON object based on the instructions.",
-        f"Analyze news about the target company ({company_name}) and connect it to a predefined list of US entities.",
-        "\n### TARGET COMPANY INFORMATION ###",
-        f"Company Name: {company_name}",
-        f"Company Description: {company_description}",
+        "Analyze news about the target company and connect it to a predefined list of US entities.",
         "\n### INSTRUCTIONS ###",
         "1. From the 'TARGET COMPANY NEWS LIST' below, select the 3 most impactful news articles.",
         "2. For EACH of the 3 selected news, identify 1-2 MOST relevant tickers from the 'US ENTITY LIST'. The ticker is inside the parentheses `()`. ",
@@ -546,13 +588,21 @@ def select_top_news_with_gemini(
         ## json 문자열로 반환
         ### 나중에 파싱을 진행
         "{\"selected_news\": [{\"index\": 1, \"related_tickers\": [\"NVDA\"]}, {\"index\": 2, \"related_tickers\": [\"^NDX\", \"USDKRW=X\"]}, {\"index\": 8, \"related_tickers\": [\"MSFT\"]}]}",
+    ]
+    prompt_prefix = "\n".join(prefix_parts) + "\n"
+
+    ## 요청마다 바뀌는 뒷부분 (분석 대상 기업 정보, 후보 뉴스)
+    tail_parts = [
+        "\n### TARGET COMPANY INFORMATION ###",
+        f"Company Name: {company_name}",
+        f"Company Description: {company_description}",
         "\n--- TARGET COMPANY NEWS LIST ---\n"
     ]
 
-    # 15개의 뉴스 항목을 프롬프트에 추가합니다.
+    # 후보 뉴스 항목을 프롬프트에 추가합니다.
     for i, news in enumerate(news_list):
-        prompt_parts.append(f"[{i}] Title: {news['title']}\nSummary: {news['summary']}\n")
-    prompt = "\n".join(prompt_parts)
+        tail_parts.append(f"[{i}] Title: {news['title']}\nSummary: {news['summary']}\n")
+    prompt_tail = "\n".join(tail_parts)
 
     try:
         # Gemini 클라이언트
@@ -561,80 +611,48 @@ def select_top_news_with_gemini(
             raise ValueError("GEMINI_API_KEY_2 환경 변수가 설정되지 않았습니다.")
 
         client = genai.Client(api_key=api_key)
-        model = "gemini-2.5-flash" # 사용 모델
-        contents = [types.Content(role="user", parts=[types.Part.from_text(text=prompt)])] 
         
-        generate_content_config = types.GenerateContentConfig(
-            thinking_config = types.ThinkingConfig(
-                thinking_budget=-1,
-            ),
-            tools=[
-                types.Tool(googleSearch=types.GoogleSearch()),
-            ],
-            response_mime_type="text/plain", # 결과문 JSON을 텍스트로 받으므로 plain text
-        )
-
-        response_stream = client.models.generate_content_stream( 
-            model=model, 
-            contents=contents, 
-            config=generate_content_config,
+        if use_grounding:
+            # 검색 도구를 사용하는 경우: 결과문 JSON을 텍스트로 받으므로 plain text
+            generate_content_config = types.GenerateContentConfig(
+                thinking_config = types.ThinkingConfig(
+                    thinking_budget=thinking_budget,
+                ),
+                tools=[
+                    types.Tool(googleSearch=types.GoogleSearch()),
+                ],
+                response_mime_type="text/plain",
+            )
+        else:
+            # 응답 스키마를 지정하여 항상 유효한 JSON을 받는다
+            generate_content_config = types.GenerateContentConfig(
+                thinking_config = types.ThinkingConfig(
+                    thinking_budget=thinking_budget,
+                ),
+                response_mime_type="application/json",
+                response_schema=news_selection_schema("selected_news"),
+            )
+
+        # 고정 앞부분은 캐시로, 뒷부분만 전송 (캐시를 쓸 수 없으면 전체 프롬프트로 호출)
+        response_text = generate_with_prefix_cache(
+            client, model, prompt_prefix, prompt_tail, generate_content_config, display_name="us_news_selection",
+            cancel_token=cancel_token,
         )
-
-        # 토큰형태로 나오는 결과문을 합침   
-        response_text = ""
-        for chunk in response_stream:
-            response_text += chunk.text
             
         print("\n" + "="*40)
         print(">>> Gemini API Raw Response (for Debugging) <<<")
         print(response_text)
 
-        # json 파싱 로직
-        try:
-            # 모델이 응답 앞뒤에 ```json ... ``` 같은 마크다운을 붙이는 경우가 많습니다.
-            if '```json' in response_text:
-                # 마크다운 블록이 있다면 그 안의 내용만 추출합니다.
-                # rfind를 사용하여 마지막 ```json을 찾고, 그 이후 첫 ```을 찾습니다.
-                start_marker = '```json'
-                end_marker = '```'
-                start_index = response_text.rfind(start_marker)
-                
-                if start_index != -1:
-                    json_candidate = response_text[start_index + len(start_marker):]
-                    end_index = json_candidate.find(end_marker)
-                    if end_index != -1:
-                        json_string = json_candidate[:end_index].strip()
-                    else: # 닫는 마크다운이 없는 경우, 끝까지 사용
-                        json_string = json_candidate.strip()
-                else: # ```json 마커가 없는 경우
-                    json_string = response_text.strip()
-            else: # 마크다운이 없는 경우, 기존 로직 사용
-                start_index = response_text.find('{')
-                end_index = response_text.rfind('}') + 1
-                if start_index != -1 and end_index > start_index:
-                    json_string = response_text[start_index:end_index]
-                else:
-                    # 응답에서 JSON 객체의 시작과 끝을 찾을 수 없는 경우
-                    raise ValueError("Could not find a valid JSON object structure in the response.")
-
-            result = json.loads(json_string)
-            
-            # 응답 구조가 예상과 맞는지 한 번 더 확인합니다.
-            if 'selected_news' not in result or not isinstance(result['selected_news'], list):
-                 raise ValueError("JSON is valid, but the 'selected_news' key is missing or not a list.")
-
-            print(f"Gemini가 성공적으로 파싱한 뉴스 정보: {result['selected_news']}")
-            return result['selected_news']
-            
-        except (json.JSONDecodeError, IndexError, ValueError) as e:
-            # JSON 파싱 과정에서 어떤 종류의 에러가 발생했는지 명확히 출력합니다.
-            print(f"!!! [ERROR] Failed to parse JSON from Gemini's response. Reason: {e}")
-            # 여기서 에러를 다시 발생시켜 바깥쪽 except 블록이 비상 모드를 실행하도록 합니다.
-            raise
-        # --- [파싱 로직 수정 끝] ---
+        # json 파싱 및 스키마 검증 (실패 시 바깥쪽 except 블록이 비상 모드를 실행)
+        result = parse_json_response("us_news_selection", response_text, news_selection_schema("selected_news"), structured=not use_grounding)
+        print(f"Gemini가 성공적으로 파싱한 뉴스 정보: {result['selected_news']}")
+        return result['selected_news']
 
+    except AnalysisCancelled:
+        raise # 취소된 분석은 비상 모드로 이어가지 않음
     except Exception as e:
         print(f"Gemini API 호출 또는 응답 처리 중 에러 발생: {e}")
+        record_fallback("us_news_selection")
         fallback_result = [{"index": i, "related_tickers": []} for i in range(min(3, len(news_list)))]
         print(f"비상 모드: 가장 관련성 높은 뉴스 {len(fallback_result)}개를 임시로 선택합니다.")
         return fallback_result
@@ -651,8 +669,16 @@ def run_news_analyst(state: AnalysisState) -> Dict[str, Any]:
     company_name = state["company_name"] #기업 이름 가져오기
     company_description = state["company_description"] #기업 설명 가져오기
 
-    # 1. RAG를 통해 관련 뉴스 15개 검색
-    candidate_news = search_relevant_news_rag(company_name)
+    # 실행 프로파일에 따라 후보 수, 모델, 추론 예산, 검색 도구 사용 여부를 결정
+    settings = get_execution_profile(state.get("execution_profile"))["news_selection"]
+
+    # 1. RAG를 통해 관련 뉴스 후보 검색 (기본 15개)
+    ## 포트폴리오 일괄 분석에서 함께 검색한 후보, 또는 종목 선택 시 미리 검색해둔 후보가 있으면 사용
+    candidate_news = state.get("us_news_candidates")
+    if candidate_news is None:
+        candidate_news = get_prefetched(state["ticker"], "us_rag", (company_name, settings["candidate_count"]))
+    if candidate_news is None:
+        candidate_news = search_relevant_news_rag(company_name, top_k=settings["candidate_count"])
     if not candidate_news:
         return {"selected_news": []} # 검색된 뉴스 없으면 빈 리스트 반환
     
@@ -664,7 +690,11 @@ def run_news_analyst(state: AnalysisState) -> Dict[str, Any]:
     
      # 3. Gemini를 통해 뉴스 3개 선별 및 관련 미국 기업/지표 Ticker 추출
     selected_news_data = select_top_news_with_gemini(
-        company_name, company_description, candidate_news, us_entities_for_prompt
+        company_name, company_description, candidate_news, us_entities_for_prompt,
+        use_grounding=settings["use_grounding"],
+        model=settings["model"],
+        thinking_budget=settings["thinking_budget"],
+        cancel_token=state.get("cancel_token"),
     )
     if not selected_news_data:
         print("[News Analyst] Gemini로부터 유효한 뉴스 선택 결과를 받지 못했습니다.")
@@ -2,15 +2,41 @@
 
 import os
 import json
+import math
+import time
 import requests
-from typing import Dict, Any, Set
+import threading
+from typing import Dict, Any, Set, List, Callable, Optional
+from google import genai
+from google.genai import types
 
 from ..state import AnalysisState, FinalReport
+from ..llm_output import (
+    ENTITY_ANALYSIS_SCHEMA, BRIEFING_SUMMARY_SCHEMA, STRATEGY_SUGGESTION_SCHEMA,
+    batched_entity_analysis_schema, parse_json_response, validate_json, record_fallback
+)
+from ..profiles import get_execution_profile
+from ..hedging import hedged_call
+from ..llm_ledger import record_llm_call
+from ..entity_memo import (
+    make_entity_memo_key, lookup_entity_analysis, store_entity_analysis, get_or_compute_entity_analysis
+)
 from .news_analyst_agent import METRICS_MAP
 
+CLOVA_MODEL = "HCX-DASH-002" # 보고서 생성에 사용하는 Clova 모델 (구조화 출력(responseFormat) 미지원)
+GEMINI_HEDGE_MODEL = "gemini-2.5-flash" # 헤징 시 보조 공급자로 사용하는 Gemini 모델
+
 ########################################################
-def call_clova_api(prompt: str) -> str | None:
-    """Clova X API를 호출하고 최종 보고서 생성 함수"""
+def call_clova_api(prompt: str, on_token: Optional[Callable[[str], None]] = None, response_schema: Optional[Dict[str, Any]] = None, max_tokens: int = 4096, cancel_event: Optional[threading.Event] = None, stage: str = "report") -> str | None:
+    """
+    Clova X API를 호출하고 최종 보고서 생성 함수
+    on_token이 주어지면 스트리밍되는 토큰('token' 이벤트)을 받는 즉시 전달합니다.
+    response_schema는 call_gemini_api와 인자를 맞추기 위한 것으로, CLOVA_MODEL이 구조화 출력을 지원하지 않으므로 사용하지 않습니다.
+    (응답 형식은 프롬프트로 지시하고 parse_json_response로 검증)
+    max_tokens는 실행 프로파일의 출력 길이 상한입니다.
+    cancel_event가 설정되면 스트리밍을 중단하고 None을 반환합니다. (헤징에서 진 호출)
+    호출 결과(토큰 수, 지연시간)는 stage 이름으로 LLM 장부에 기록됩니다.
+    """
     # Clova X 환경변수
     host = 'https://clovastudio.stream.ntruss.com'
     api_key = os.environ.get("CLOVA_API_KEY")
@@ -22,28 +48,110 @@ def call_clova_api(prompt: str) -> str | None:
         'Content-Type': 'application/json; charset=utf-8', 'Accept': 'text/event-stream'
     }
     request_data = {
-        'messages': [{"role": "user", "content": prompt}], 'topP': 0.8, 'topK': 0, 'maxTokens': 4096, # 장문의 보고서를 작성해야하기 때문에 토큰수를 최대로 증가
+        'messages': [{"role": "user", "content": prompt}], 'topP': 0.8, 'topK': 0, 'maxTokens': max_tokens, # 장문의 보고서는 최대(4096)까지, 빠른 프로파일은 더 짧게
         'temperature': 0.5, 'repetitionPenalty': 1.1, 'stopBefore': [], 'includeAiFilters': True,
     }
+    started = time.perf_counter()
+    usage = {} # 'result' 이벤트의 토큰 사용량
     try:
-        with requests.post(host + '/testapp/v3/chat-completions/HCX-DASH-002',
+        with requests.post(host + f'/testapp/v3/chat-completions/{CLOVA_MODEL}',
                            headers=headers, json=request_data, stream=True) as r:
             r.raise_for_status()
             final_content = None
+            current_event = None # 'token'(증분 토큰) 또는 'result'(전체 응답)
             for line in r.iter_lines():
+                if cancel_event and cancel_event.is_set():
+                    record_llm_call("clova", CLOVA_MODEL, stage, latency_sec=time.perf_counter() - started, outcome="cancelled")
+                    return None
                 if not line or b'data: [DONE]' in line: continue
+                if line.startswith(b'event:'):
+                    current_event = line.decode('utf-8')[len('event:'):].strip()
+                    continue
                 if line.startswith(b'data:'):
                     try:
                         json_str = line.decode('utf-8')[len('data:'):].strip()
                         data = json.loads(json_str)
+                        if current_event == 'result' and data.get('usage'):
+                            usage = data['usage']
                         if 'message' in data and 'content' in data['message'] and data['message']['content']:
                             final_content = data['message']['content']
+                            if on_token and current_event == 'token':
+                                on_token(final_content)
                     except (json.JSONDecodeError, KeyError): continue
+            record_llm_call(
+                "clova", CLOVA_MODEL, stage,
+                prompt_tokens=usage.get('promptTokens'), completion_tokens=usage.get('completionTokens'),
+                latency_sec=time.perf_counter() - started, outcome="success" if final_content else "error",
+            )
             return final_content
     except Exception as e:
         print(f"API 호출/처리 중 오류 발생: {e}")
+        record_llm_call("clova", CLOVA_MODEL, stage, latency_sec=time.perf_counter() - started, outcome="error")
         return None
 
+def call_gemini_api(prompt: str, on_token: Optional[Callable[[str], None]] = None, response_schema: Optional[Dict[str, Any]] = None, max_tokens: int = 4096, cancel_event: Optional[threading.Event] = None, stage: str = "report") -> str | None:
+    """
+    헤징의 보조 공급자로 사용하는 Gemini 호출 함수 (call_clova_api와 같은 인자와 반환값)
+    response_schema가 주어지면 Gemini의 응답 스키마(구조화 출력) 모드로 호출합니다.
+    """
+    api_key = os.environ.get("GEMINI_API_KEY_2")
+    if not api_key:
+        raise EnvironmentError("GEMINI_API_KEY_2 환경 변수가 설정되지 않았습니다.")
+    client = genai.Client(api_key=api_key)
+    config = types.GenerateContentConfig(
+        thinking_config=types.ThinkingConfig(thinking_budget=0), # 헤징은 빠른 응답이 목적이므로 추론을 끔
+        max_output_tokens=max_tokens,
+        temperature=0.5,
+        response_mime_type="application/json" if response_schema else "text/plain",
+        response_schema=response_schema,
+    )
+    started = time.perf_counter()
+    usage = None
+    try:
+        response_stream = client.models.generate_content_stream(
+            model=GEMINI_HEDGE_MODEL,
+            contents=[types.Content(role="user", parts=[types.Part.from_text(text=prompt)])],
+            config=config,
+        )
+        response_text = ""
+        for chunk in response_stream:
+            if cancel_event and cancel_event.is_set():
+                record_llm_call("gemini", GEMINI_HEDGE_MODEL, stage, latency_sec=time.perf_counter() - started, outcome="cancelled")
+                return None
+            usage = chunk.usage_metadata or usage
+            if chunk.text:
+                response_text += chunk.text
+                if on_token:
+                    on_token(chunk.text)
+        record_llm_call(
+            "gemini", GEMINI_HEDGE_MODEL, stage,
+            prompt_tokens=usage.prompt_token_count if usage else None,
+            completion_tokens=usage.candidates_token_count if usage else None,
+            latency_sec=time.perf_counter() - started, outcome="success" if response_text else "error",
+        )
+        return response_text or None
+    except Exception as e:
+        print(f"Gemini API 호출/처리 중 오류 발생: {e}")
+        record_llm_call("gemini", GEMINI_HEDGE_MODEL, stage, latency_sec=time.perf_counter() - started, outcome="error")
+        return None
+
+def _call_report_llm(state: AnalysisState, stage: str, prompt: str, response_schema: Dict[str, Any], on_token: Optional[Callable[[str], None]] = None) -> str | None:
+    """
+    보고서 섹션 생성 호출 (주 공급자: Clova, 보조 공급자: Gemini)
+    Clova가 p95 기반 임계 시간 안에 첫 토큰을 내지 못하면 Gemini로도 호출하여 먼저 끝난 결과를 사용합니다.
+    """
+    max_tokens = _report_max_tokens(state)
+    secondary = None
+    if os.environ.get("GEMINI_API_KEY_2"):
+        secondary = ("gemini", lambda token_cb, cancel: call_gemini_api(prompt, token_cb, response_schema, max_tokens, cancel, stage))
+    return hedged_call(
+        stage,
+        ("clova", lambda token_cb, cancel: call_clova_api(prompt, token_cb, response_schema, max_tokens, cancel, stage)),
+        secondary,
+        on_token=on_token,
+        cancel_token=state.get("cancel_token"), # 분석이 취소되면 스트리밍 중단
+    )
+
 def _cleanup_string_values(data: Any) -> Any:
     """
     JSON 객체(dict, list) 내의 모든 문자열 값에서 줄바꿈을 제거하고 공백을 정리합니다.
@@ -56,6 +164,139 @@ def _cleanup_string_values(data: Any) -> Any:
         return ' '.join(data.replace('\n', ' ').split())
     return data
 
+########################################################
+# 프롬프트 입력 경량화
+## 엔티티별로 필요한 데이터만 잘라내고, 들여쓰기 없는 JSON으로 직렬화하여 입력 토큰을 줄인다
+## Clova 호출마다 입력 토큰이 줄어들면 생성 지연시간도 함께 줄어든다
+
+PROMPT_TOKEN_BUDGET = 6000 # 프롬프트 하나에 허용하는 입력 토큰 상한 (추정치 기준)
+FINANCIAL_HEALTH_TOKEN_BUDGET = 800 # 요약/전략 프롬프트에 넣는 기업건전성 보고서의 토큰 상한
+NEWS_SUMMARIES_TOKEN_BUDGET = 1200 # 요약/전략 프롬프트에 넣는 뉴스 요약문의 토큰 상한
+
+# 엔티티 분석 실행 방식
+## "per_entity" : 엔티티마다 개별 호출 (기본값)
+## "batched" : 한 번의 호출로 모든 엔티티를 분석하고, 누락된 엔티티만 개별 호출로 보완
+REPORT_SYNTHESIS_MODE = os.environ.get("REPORT_SYNTHESIS_MODE", "per_entity")
+
+def _report_max_tokens(state: AnalysisState) -> int:
+    """실행 프로파일에 지정된 Clova 출력 토큰 상한"""
+    return get_execution_profile(state.get("execution_profile"))["report"]["max_tokens"]
+
+def _report_mode(state: AnalysisState) -> str:
+    """
+    엔티티 분석 실행 방식
+    우선순위: state의 report_mode > 실행 프로파일의 mode > 환경변수 기본값
+    """
+    return (
+        state.get("report_mode")
+        or get_execution_profile(state.get("execution_profile"))["report"]["mode"]
+        or REPORT_SYNTHESIS_MODE
+    )
+
+def _report_settings(state: AnalysisState, mode: str) -> str:
+    """엔티티 분석 메모 키에 들어가는 보고서 설정 (실행 프로파일/분석 방식/출력 토큰 상한)"""
+    return f"{state.get('execution_profile') or '-'}/{mode}/{_report_max_tokens(state)}"
+
+def _estimate_tokens(text: str) -> int:
+    """
+    프롬프트의 토큰 수를 보수적으로 추정합니다.
+    영문/숫자/기호는 약 4글자당 1토큰, 한글 등 비ASCII 문자는 글자당 1토큰으로 계산합니다.
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    non_ascii_chars = len(text) - ascii_chars
+    return math.ceil(ascii_chars / 4) + non_ascii_chars
+
+def _trim_to_token_budget(text: str, max_tokens: int) -> str:
+    """텍스트가 토큰 상한을 넘으면 문장(또는 줄) 경계에서 잘라내고 생략 표시를 붙입니다."""
+    if not text or _estimate_tokens(text) <= max_tokens:
+        return text
+    trimmed = text
+    while trimmed and _estimate_tokens(trimmed) > max_tokens:
+        trimmed = trimmed[:int(len(trimmed) * 0.9)] # 10%씩 줄여가며 상한에 맞춘다
+    # 잘린 문장이 남지 않도록 마지막 문장/줄 경계까지 되돌린다
+    boundary = max(trimmed.rfind('. '), trimmed.rfind('다.'), trimmed.rfind('\n'))
+    if boundary > len(trimmed) // 2:
+        trimmed = trimmed[:boundary + 2]
+    return trimmed.rstrip() + " …(이하 생략)"
+
+def _compact_json(data: Any) -> str:
+    """들여쓰기와 공백 없이 JSON 문자열로 직렬화합니다."""
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+def _round_price(value: Any) -> Any:
+    """주가를 반올림합니다. (1000 이상은 정수, 그 외는 소수점 둘째 자리)"""
+    if not isinstance(value, (int, float)):
+        return value
+    if abs(value) >= 1000:
+        return int(round(value))
+    return round(float(value), 2)
+
+def _collapse_prices(prices: List[List[Any]]) -> Dict[str, Any]:
+    """
+    [[YYYY-MM-DD, 가격], ...] 형태의 일별 주가를 {MM-DD: 가격} 형태로 압축합니다.
+    연도는 뉴스 블록의 '기간'에 한 번만 표기하되, 기간이 연말을 넘어가면 날짜가 겹치거나
+    순서가 뒤바뀌지 않도록 {YYYY-MM-DD: 가격} 그대로 둡니다.
+    """
+    dates = [str(date)[:10] for date, _ in prices]
+    key_start = 5 if len({date[:4] for date in dates}) <= 1 else 0
+    return {date[key_start:]: _round_price(close) for date, (_, close) in zip(dates, prices)}
+
+def _entity_ticker(entity_key: str) -> str:
+    """'NVIDIA(NVDA)' 형태의 엔티티 키에서 티커를 추출합니다."""
+    if entity_key.endswith(')') and '(' in entity_key:
+        return entity_key.rsplit('(', 1)[1][:-1]
+    return entity_key
+
+def _compact_news_block(block: Dict, tickers: Set[str] | None = None) -> Dict | None:
+    """
+    뉴스 블록 하나를 프롬프트용으로 압축합니다.
+    tickers가 주어지면 해당 티커의 주가만 남기고, 남는 주가가 없으면 None을 반환합니다.
+    """
+    price_data = {
+        f"{name}({data['ticker']})": {
+            "변동": data.get("change_summary"),
+            "종가": _collapse_prices(data.get("prices", []))
+        }
+        for name, data in block.get("price_data_by_name", {}).items()
+        if tickers is None or data.get("ticker") in tickers
+    }
+    if not price_data:
+        return None
+    return {
+        "기간": f"{block.get('start_date')}~{block.get('end_date')}",
+        "뉴스": block.get("news_titles", []),
+        "주가": price_data
+    }
+
+def _slice_news_impact_for_entity(news_impact_data: List[Dict], entity_ticker: str, target_ticker: str | None) -> List[Dict]:
+    """
+    전체 뉴스 블록 중 해당 엔티티의 주가가 포함된 블록만 골라,
+    엔티티와 분석 대상 기업의 주가만 남긴 압축 데이터를 만듭니다.
+    엔티티의 주가가 어느 블록에도 없으면 분석 대상 기업의 주가만 담아 반환합니다.
+    """
+    sliced = []
+    for block in news_impact_data:
+        block_tickers = {d.get("ticker") for d in block.get("price_data_by_name", {}).values()}
+        if entity_ticker in block_tickers:
+            compact_block = _compact_news_block(block, {entity_ticker, target_ticker})
+            if compact_block:
+                sliced.append(compact_block)
+
+    if not sliced: # 엔티티의 주가 데이터가 없는 경우 분석 대상 기업의 주가만 사용
+        sliced = [b for b in (_compact_news_block(block, {target_ticker}) for block in news_impact_data) if b]
+    return sliced
+
+def _fit_blocks_to_budget(blocks: List[Dict], max_tokens: int) -> str:
+    """직렬화된 블록이 토큰 상한을 넘으면 오래된 블록부터 제외합니다. (최신 블록은 항상 유지)"""
+    blocks = list(blocks)
+    serialized = _compact_json(blocks)
+    while len(blocks) > 1 and _estimate_tokens(serialized) > max_tokens:
+        blocks.pop(0) # 뉴스 블록은 날짜순으로 정렬되어 있으므로 가장 오래된 블록부터 제거
+        serialized = _compact_json(blocks)
+    return serialized
+
 def _get_entities_to_analyze(state: AnalysisState) -> list[str]:
     """분석해야 할 모든 고유 엔티티(티커) 목록을 state에서 추출하는 헬퍼 함수"""
     target_ticker = state.get("ticker")
@@ -73,19 +314,31 @@ def _get_entities_to_analyze(state: AnalysisState) -> list[str]:
     return [f"{ticker_to_name_map.get(t, t)}({t})" for t in all_related_metrics]
 
 
-def _generate_single_entity_analysis(state: AnalysisState, entity_key: str) -> Dict | None:
+def _entity_memo_key(state: AnalysisState, entity_key: str, report_mode: str) -> tuple:
+    """엔티티 분석 메모 키 (엔티티, 분석 대상 티커, 뉴스 블록 구간, 데이터 버전, 보고서 설정)"""
+    target_ticker = state.get("ticker")
+    news_impact_data = state.get("market_analysis_result", {}).get("news_impact_data", [])
+    entity_blocks = _slice_news_impact_for_entity(news_impact_data, _entity_ticker(entity_key), target_ticker)
+    return make_entity_memo_key(entity_key, target_ticker, entity_blocks, _report_settings(state, report_mode))
+
+
+def _generate_single_entity_analysis(state: AnalysisState, entity_key: str, on_token: Optional[Callable[[str], None]] = None) -> Dict | None:
     """'분석가 LLM' - 단일 주체에 대한 심층 분석 JSON 생성"""
     target_name = state.get("company_name", "N/A")
+    target_ticker = state.get("ticker")
     news_impact_data = state.get("market_analysis_result", {}).get("news_impact_data", [])
 
-    prompt = f"""
+    # 이 엔티티와 관련된 뉴스 블록/주가만 압축하여 프롬프트에 넣는다
+    entity_blocks = _slice_news_impact_for_entity(news_impact_data, _entity_ticker(entity_key), target_ticker)
+
+    prompt_head = f"""
 ## GOAL
 Analyze how the single entity `{entity_key}` impacts the target company `{target_name}`, based on the provided financial data.
 
 ## CRITICAL INSTRUCTIONS
 1. Your entire response MUST be a single, valid JSON object.
 2. The JSON should contain your analysis under two keys: "내용" and "주가_반응".
-3. Your analysis ('내용') must specifically describe the impact on `{target_name}`, referencing the detailed daily price data (`상세 주가`) to find specific dates of influence.
+3. Your analysis ('내용') must specifically describe the impact on `{target_name}`, referencing the daily closing prices (`종가`, keyed by MM-DD within each block's `기간`, or by full YYYY-MM-DD when the block spans a year boundary) to find specific dates of influence.
 4. All string values inside the JSON must be a single line of text without newline characters (`\\n`).
 
 ## JSON OUTPUT FORMAT
@@ -97,23 +350,153 @@ Analyze how the single entity `{entity_key}` impacts the target company `{target
 ```
 
 ## DATA FOR ANALYSIS
-{json.dumps(news_impact_data, indent=2, ensure_ascii=False)}
+"""
+    prompt_tail = f"""
 
 ## TASK
 Now, generate the JSON object for `{entity_key}` based on all the instructions and data.
 """
-    response_str = call_clova_api(prompt)
+    # 고정 문구를 제외한 나머지 토큰 예산 안에서 데이터를 직렬화
+    data_budget = PROMPT_TOKEN_BUDGET - _estimate_tokens(prompt_head + prompt_tail)
+    prompt = prompt_head + _fit_blocks_to_budget(entity_blocks, data_budget) + prompt_tail
+    response_str = _call_report_llm(state, "entity_analysis", prompt, ENTITY_ANALYSIS_SCHEMA, on_token=on_token)
     if not response_str: return None
 
     try:
-        clean_str = response_str.strip().replace("```json", "").replace("```", "")
-        data = json.loads(clean_str)
+        data = parse_json_response("entity_analysis", response_str, ENTITY_ANALYSIS_SCHEMA)
         return _cleanup_string_values(data)
-    except json.JSONDecodeError:
-        print(f"[분석가 LLM] '{entity_key}' 분석 결과가 유효한 JSON이 아닙니다.")
+    except ValueError as e:
+        print(f"[분석가 LLM] '{entity_key}' 분석 결과가 유효한 JSON이 아닙니다. ({e})")
+        return None
+
+def generate_shared_entity_analysis(state: AnalysisState, entity_key: str, holdings: Dict[str, str], news_impact_data: List[Dict]) -> Dict | None:
+    """
+    포트폴리오 일괄 분석용: 공통 엔티티 하나가 보유 종목 전체(holdings: {티커: 이름})에 미치는 영향을 한 번의 호출로 분석합니다.
+    news_impact_data는 모든 보유 종목의 뉴스 블록을 합친 목록이며, 엔티티의 주가가 포함된 블록만 사용합니다.
+    결과는 각 종목 state의 shared_entity_analysis로 전달되어 종목별 보고서에서 다시 분석하지 않습니다.
+    """
+    entity_ticker = _entity_ticker(entity_key)
+    tickers = {entity_ticker, *holdings}
+    entity_blocks, seen = [], set()
+    for block in news_impact_data:
+        block_tickers = {d.get("ticker") for d in block.get("price_data_by_name", {}).values()}
+        if entity_ticker not in block_tickers:
+            continue
+        compact_block = _compact_news_block(block, tickers)
+        serialized = _compact_json(compact_block)
+        if serialized not in seen: # 여러 종목이 같은 뉴스 구간을 가지면 한 번만 포함
+            seen.add(serialized)
+            entity_blocks.append(compact_block)
+    if not entity_blocks:
         return None
+    entity_blocks.sort(key=lambda block: block["기간"])
+    holding_list = ", ".join(f"{name}({ticker})" for ticker, name in holdings.items())
+
+    prompt_head = f"""
+## GOAL
+Analyze how the single entity `{entity_key}` impacts each company in the portfolio: {holding_list}, based on the provided financial data.
+
+## CRITICAL INSTRUCTIONS
+1. Your entire response MUST be a single, valid JSON object.
+2. The JSON should contain your analysis under two keys: "내용" and "주가_반응".
+3. Your analysis ('내용') must describe the impact on the portfolio companies, referencing the daily closing prices (`종가`, keyed by MM-DD within each block's `기간`, or by full YYYY-MM-DD when the block spans a year boundary) to find specific dates of influence.
+4. All string values inside the JSON must be a single line of text without newline characters (`\\n`).
+
+## JSON OUTPUT FORMAT
+```json
+{{
+  "내용": "이 주체({entity_key})의 상황이 보유 종목들에 미치는 구체적인 영향과 전망을 분석한 내용을 서술.",
+  "주가_반응": "분석 기간 동안 이 주체({entity_key})의 주가 변동 요약"
+}}
+```
+
+## DATA FOR ANALYSIS
+"""
+    prompt_tail = f"""
+
+## TASK
+Now, generate the JSON object for `{entity_key}` based on all the instructions and data.
+"""
+    data_budget = PROMPT_TOKEN_BUDGET - _estimate_tokens(prompt_head + prompt_tail)
+    prompt = prompt_head + _fit_blocks_to_budget(entity_blocks, data_budget) + prompt_tail
+
+    def generate() -> Dict | None:
+        response_str = _call_report_llm(state, "entity_analysis", prompt, ENTITY_ANALYSIS_SCHEMA)
+        if not response_str: return None
+        try:
+            data = parse_json_response("entity_analysis", response_str, ENTITY_ANALYSIS_SCHEMA)
+            return _cleanup_string_values(data)
+        except ValueError as e:
+            print(f"[분석가 LLM] 공통 엔티티 '{entity_key}' 분석 결과가 유효한 JSON이 아닙니다. ({e})")
+            return None
+
+    # 같은 보유 종목 구성/구간의 공통 분석은 메모를 재사용 (분석 대상은 보유 종목 전체)
+    memo_key = make_entity_memo_key(entity_key, "portfolio:" + ",".join(sorted(holdings)), entity_blocks, _report_settings(state, "shared"))
+    analysis, _ = get_or_compute_entity_analysis(memo_key, generate)
+    return analysis
+
+def _is_valid_entity_analysis(data: Any) -> bool:
+    """엔티티 분석 결과가 스키마에 맞고, '내용'과 '주가_반응'이 비어있지 않은지 확인합니다."""
+    return not validate_json(data, ENTITY_ANALYSIS_SCHEMA) and all(data[k].strip() for k in ("내용", "주가_반응"))
+
+def _generate_all_entity_analyses(state: AnalysisState, entity_keys: List[str], on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Dict]:
+    """
+    '분석가 LLM' (일괄 호출) - 모든 주체에 대한 분석을 한 번의 호출로 생성
+    공통 데이터(기업, 뉴스, 주가)를 한 번만 보내므로 엔티티 수만큼의 요청 오버헤드와 중복 입력이 사라진다.
+    응답에서 누락되었거나 형식이 잘못된 엔티티는 결과에서 제외하며, 호출 측에서 개별 호출로 보완한다.
+    """
+    if not entity_keys:
+        return {}
+    target_name = state.get("company_name", "N/A")
+    news_impact_data = state.get("market_analysis_result", {}).get("news_impact_data", [])
+    all_blocks = [b for b in (_compact_news_block(block) for block in news_impact_data) if b]
+    entity_list_text = ", ".join(f'"{key}"' for key in entity_keys)
+
+    prompt_head = f"""
+## GOAL
+Analyze how each of the following entities impacts the target company `{target_name}`, based on the provided financial data.
+Entities: [{entity_list_text}]
+
+## CRITICAL INSTRUCTIONS
+1. Your entire response MUST be a single, valid JSON object.
+2. The JSON object MUST have exactly one key per entity, using the entity strings above verbatim as keys.
+3. Each value is an object with two keys: "내용" and "주가_반응".
+4. Each '내용' must specifically describe the impact on `{target_name}`, referencing the daily closing prices (`종가`, keyed by MM-DD within each block's `기간`, or by full YYYY-MM-DD when the block spans a year boundary) to find specific dates of influence.
+5. All string values inside the JSON must be a single line of text without newline characters (`\\n`).
+
+## JSON OUTPUT FORMAT
+```json
+{{
+  "{entity_keys[0]}": {{
+    "내용": "이 주체의 상황이 분석 대상 기업({target_name})에 미치는 구체적인 영향과 전망을 분석한 내용을 서술.",
+    "주가_반응": "분석 기간 동안 이 주체의 주가 변동 요약"
+  }}
+}}
+```
+
+## DATA FOR ANALYSIS
+"""
+    prompt_tail = f"""
+
+## TASK
+Now, generate the JSON object containing an analysis for every entity listed above.
+"""
+    data_budget = PROMPT_TOKEN_BUDGET - _estimate_tokens(prompt_head + prompt_tail)
+    prompt = prompt_head + _fit_blocks_to_budget(all_blocks, data_budget) + prompt_tail
+    response_str = _call_report_llm(state, "entity_analysis_batched", prompt, batched_entity_analysis_schema(entity_keys), on_token=on_token)
+    if not response_str: return {}
+
+    try:
+        # 일부 엔티티가 누락되어도 나머지는 사용하므로, 최상위 객체 여부만 검증하고 엔티티별로 다시 검증한다
+        data = parse_json_response("entity_analysis_batched", response_str, {"type": "object"})
+    except ValueError as e:
+        print(f"[분석가 LLM] 일괄 분석 결과가 유효한 JSON이 아닙니다. ({e})")
+        return {}
+
+    data = _cleanup_string_values(data)
+    return {key: data[key] for key in entity_keys if _is_valid_entity_analysis(data.get(key))}
 
-def _generate_briefing_summary(state: AnalysisState, entity_analysis: Dict, financial_health: str, news_summaries: str) -> str | None:
+def _generate_briefing_summary(state: AnalysisState, entity_analysis: Dict, financial_health: str, news_summaries: str, on_token: Optional[Callable[[str], None]] = None) -> str | None:
     """'요약가 LLM' - 전체 분석 내용을 요약하는 문단 생성"""
     target_name = state.get("company_name", "N/A")
     
@@ -138,25 +521,24 @@ You are a financial analyst summarizing a detailed report for a client. Your tas
 ** 1. Target Company's Financial Health (Pre-analyzed):**
 {financial_health}
 ** 2. In-depth Entity Analysis (Pre-analyzed)**: 
-{json.dumps(entity_analysis, indent=2, ensure_ascii=False)}
+{_compact_json(entity_analysis)}
 ** 3. Key News Summaries**: 
 {news_summaries}
 
 ## TASK
 Now, generate the summary JSON object based on the provided analysis.
 """
-    response_str = call_clova_api(prompt)
+    response_str = _call_report_llm(state, "briefing_summary", prompt, BRIEFING_SUMMARY_SCHEMA, on_token=on_token)
     if not response_str: return None
 
     try:
-        clean_str = response_str.strip().replace("```json", "").replace("```", "")
-        data = json.loads(clean_str)
+        data = parse_json_response("briefing_summary", response_str, BRIEFING_SUMMARY_SCHEMA)
         return _cleanup_string_values(data).get("briefing_summary")
-    except json.JSONDecodeError:
-        print("[요약가 LLM] 응답이 유효한 JSON 형식이 아닙니다.")
+    except ValueError as e:
+        print(f"[요약가 LLM] 응답이 유효한 JSON 형식이 아닙니다. ({e})")
         return None
 
-def _generate_strategy_suggestion(state: AnalysisState, entity_analysis: Dict, financial_health: str, news_summaries: str) -> str | None:
+def _generate_strategy_suggestion(state: AnalysisState, entity_analysis: Dict, financial_health: str, news_summaries: str, on_token: Optional[Callable[[str], None]] = None) -> str | None:
     """'전략가 LLM' - 최종 투자 전략 제안 문단 생성 (개인 투자자 관점으로 수정)"""
     target_name = state.get("company_name", "N/A")
     correlation_summary = state.get("market_analysis_result", {}).get("correlation_summary", [])
@@ -183,32 +565,115 @@ You are a top-tier securities analyst writing for a **personal investor** who is
 **2. Target Company's Financial Health**: 
 {financial_health}
 **3. Long-term Correlation Analysis**: 
-{json.dumps(correlation_summary, indent=2, ensure_ascii=False)}
+{_compact_json(correlation_summary)}
 **4. In-depth Entity Analysis (Pre-analyzed)**: 
-{json.dumps(entity_analysis, indent=2, ensure_ascii=False)}
+{_compact_json(entity_analysis)}
 **5. Key News Summaries**:
 {news_summaries}
 
 ## TASK
 Now, generate the investment strategy JSON object for a personal investor.
 """
-    response_str = call_clova_api(prompt)
+    response_str = _call_report_llm(state, "strategy_suggestion", prompt, STRATEGY_SUGGESTION_SCHEMA, on_token=on_token)
     if not response_str: return None
 
     try:
-        clean_str = response_str.strip().replace("```json", "").replace("```", "")
-        data = json.loads(clean_str)
+        data = parse_json_response("strategy_suggestion", response_str, STRATEGY_SUGGESTION_SCHEMA)
         return _cleanup_string_values(data).get("strategy_suggestion")
-    except json.JSONDecodeError:
-        print("[전략가 LLM] 응답이 유효한 JSON 형식이 아닙니다.")
+    except ValueError as e:
+        print(f"[전략가 LLM] 응답이 유효한 JSON 형식이 아닙니다. ({e})")
         return None
 
 
-def run_report_synthesizer(state: AnalysisState) -> Dict[str, Any]:
-    """개별 LLM 호출 구조를 사용하여 최종 투자 브리핑을 생성하는 메인 함수"""
+########################################################
+# 점진적 보고서 모드: 초안 생성
+## LLM 호출 없이 run_market_correlation이 이미 계산한 데이터(주가 변동 요약, 상관관계 설명)로
+## 최종 보고서와 같은 구조의 초안을 즉시 만든다. 최종 보고서가 완성되면 화면에서 대체된다
+
+def _latest_block_with_ticker(news_impact_data: List[Dict], ticker: str | None) -> tuple[Dict, Dict] | None:
+    """해당 티커의 주가가 포함된 가장 최근 뉴스 블록과 그 블록의 주가 데이터를 반환합니다."""
+    for block in reversed(news_impact_data):
+        for data in block.get("price_data_by_name", {}).values():
+            if data.get("ticker") == ticker:
+                return block, data
+    return None
+
+def build_draft_report(state: AnalysisState) -> FinalReport:
+    """시장 데이터 분석 결과만으로 템플릿 기반의 초안 보고서를 만듭니다."""
+    target_name = state.get("company_name", "N/A")
+    target_ticker = state.get("ticker")
+    market_analysis_result = state.get("market_analysis_result") or {}
+    news_impact_data = market_analysis_result.get("news_impact_data", [])
+    correlation_summary = market_analysis_result.get("correlation_summary", [])
+
+    # 엔티티별: 상관관계 설명 + 최근 관련 뉴스 / 최근 뉴스 구간의 주가 변동
+    entity_analysis = {}
+    for entity_key in _get_entities_to_analyze(state):
+        entity_name = entity_key.rsplit('(', 1)[0]
+        correlation_text = next((line for line in correlation_summary if f"'{entity_name}'의" in line), None)
+        latest = _latest_block_with_ticker(news_impact_data, _entity_ticker(entity_key))
+        content = correlation_text or f"'{target_name}'과(와) '{entity_name}'의 상관관계 데이터가 없습니다."
+        if latest:
+            block, data = latest
+            content += f" 관련 뉴스: {', '.join(block.get('news_titles', [])[:2])}"
+            price_reaction = f"{block.get('start_date')}~{block.get('end_date')} 기간 동안 {data.get('change_summary')}"
+        else:
+            price_reaction = "주가 데이터가 없습니다."
+        entity_analysis[entity_key] = {"내용": content, "주가_반응": price_reaction}
+
+    # 요약: 분석 대상 기업의 최근 주가 변동과 주요 뉴스 제목
+    latest_target = _latest_block_with_ticker(news_impact_data, target_ticker)
+    if latest_target:
+        block, data = latest_target
+        briefing_summary = (
+            f"{target_name}의 주가는 최근 뉴스 구간({block.get('start_date')}~{block.get('end_date')}) 동안 {data.get('change_summary')} "
+            f"주요 뉴스: {', '.join(block.get('news_titles', [])[:3])}. "
+        )
+    else:
+        briefing_summary = f"{target_name}의 최근 주가 데이터가 없습니다. "
+    briefing_summary += "AI 상세 분석을 생성 중이며, 완료되면 이 초안을 대체합니다."
+
+    return FinalReport(
+        report_title=f"[초안] {target_name} 기업 관련 주요 동향",
+        briefing_summary=briefing_summary,
+        news_analysis={"entity_analysis": entity_analysis},
+        strategy_suggestion="AI 투자 전략을 생성 중입니다. 잠시 후 최종 보고서로 대체됩니다."
+    )
+
+########################################################
+# 보고서 섹션 스트리밍
+## 섹션(엔티티 분석, 요약, 전략)별로 생성 중인 토큰과 완성된 내용을 호출 측(웹 서버)에 전달한다
+SectionDeltaCallback = Callable[[str, str], None] # (섹션 이름, 증분 토큰)
+SectionDoneCallback = Callable[[str, Any], None] # (섹션 이름, 완성된 내용)
+
+def _raise_if_cancelled(state: AnalysisState) -> None:
+    """분석이 취소되었으면 AnalysisCancelled를 발생시킵니다. (취소된 섹션을 실패로 기록하거나 다음 섹션을 시작하지 않도록)"""
+    cancel_token = state.get("cancel_token")
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+
+def _section_token_callback(on_section_delta: Optional[SectionDeltaCallback], section: str) -> Optional[Callable[[str], None]]:
+    """call_clova_api에 넘길 토큰 콜백에 섹션 이름을 붙여 반환합니다."""
+    if not on_section_delta:
+        return None
+    return lambda delta: on_section_delta(section, delta)
+
+def run_report_synthesizer(
+    state: AnalysisState,
+    on_section_delta: Optional[SectionDeltaCallback] = None,
+    on_section_done: Optional[SectionDoneCallback] = None,
+) -> Dict[str, Any]:
+    """
+    개별 LLM 호출 구조를 사용하여 최종 투자 브리핑을 생성하는 메인 함수
+    on_section_delta / on_section_done이 주어지면 각 섹션을 생성되는 대로 전달합니다.
+    분석이 취소되면 기본 문구로 대체하지 않고 AnalysisCancelled를 그대로 발생시킵니다.
+    """
     print("\n--- 최종 투자 브리핑 생성 에이전트 (개별 호출 구조) 실행 ---")
     
     target_name = state.get("company_name", "N/A")
+    report_title = f"[오늘의 투자 브리핑] {target_name} 기업 관련 주요 동향 및 전략"
+    notify_done = on_section_done or (lambda section, content: None)
+    notify_done("report_title", report_title)
     # State에서 financial_health 값을 가져옵니다.
     financial_health = state.get("financial_health", "재무 건전성 보고서 정보가 없습니다.")
 
@@ -220,39 +685,115 @@ def run_report_synthesizer(state: AnalysisState) -> Dict[str, Any]:
     if not news_summaries_text:
         news_summaries_text = "분석된 주요 뉴스가 없습니다."
 
-    # 각 엔티티에 대해 개별적으로 LLM을 호출하여 분석을 수행합니다.
+    # 요약/전략 프롬프트에 반복해서 들어가는 긴 텍스트는 토큰 상한에 맞춰 미리 잘라둔다
+    financial_health = _trim_to_token_budget(financial_health, FINANCIAL_HEALTH_TOKEN_BUDGET)
+    news_summaries_text = _trim_to_token_budget(news_summaries_text, NEWS_SUMMARIES_TOKEN_BUDGET)
+
     full_entity_analysis = {}
     entities_to_analyze = _get_entities_to_analyze(state)
-    print("  - [1단계] 개별 엔티티 분석 시작...")
-    for entity_key in entities_to_analyze:
+    # 포트폴리오 일괄 분석: 공통 거시 지표는 한 번 분석한 결과를 모든 종목의 보고서에 그대로 사용
+    shared_entity_analysis = state.get("shared_entity_analysis") or {}
+    if shared_entity_analysis:
+        print(f"  - [1단계] 포트폴리오 공통 엔티티 {len(shared_entity_analysis)}개 분석 결과를 사용합니다.")
+    for entity_key, analysis in shared_entity_analysis.items():
+        full_entity_analysis[entity_key] = analysis
+        notify_done(entity_key, analysis)
+    shared_tickers = {_entity_ticker(key) for key in shared_entity_analysis}
+    entities_to_analyze = [key for key in entities_to_analyze if _entity_ticker(key) not in shared_tickers]
+    report_mode = _report_mode(state)
+    memo_keys = {entity_key: _entity_memo_key(state, entity_key, report_mode) for entity_key in entities_to_analyze}
+
+    # 일괄 모드: 한 번의 호출로 모든 엔티티를 분석하고, 누락된 엔티티만 개별 호출로 보완합니다.
+    if report_mode == "batched" and entities_to_analyze:
+        # 메모 캐시에 있는 엔티티는 재사용하고, 나머지만 일괄 분석한다
+        for entity_key in entities_to_analyze:
+            cached = lookup_entity_analysis(memo_keys[entity_key])
+            if cached:
+                full_entity_analysis[entity_key] = cached
+                notify_done(entity_key, cached)
+        uncached_entities = [key for key in entities_to_analyze if key not in full_entity_analysis]
+        if full_entity_analysis:
+            print(f"  - [1단계] 메모 캐시에서 엔티티 {len(full_entity_analysis)}개 분석 결과를 재사용합니다.")
+
+        batched_analysis = {}
+        if uncached_entities:
+            print(f"  - [1단계] 엔티티 {len(uncached_entities)}개 일괄 분석 중...")
+            batched_analysis = _generate_all_entity_analyses(
+                state, uncached_entities, on_token=_section_token_callback(on_section_delta, "entity_analysis")
+            )
+        for entity_key, analysis in batched_analysis.items():
+            store_entity_analysis(memo_keys[entity_key], analysis)
+            full_entity_analysis[entity_key] = analysis
+            notify_done(entity_key, analysis)
+        missing_count = len(uncached_entities) - len(batched_analysis)
+        _raise_if_cancelled(state)
+        if missing_count:
+            record_fallback("entity_analysis_batched")
+            print(f"    - 일괄 응답에서 누락된 엔티티 {missing_count}개는 개별 호출로 분석합니다.")
+
+    # 나머지 엔티티에 대해 개별적으로 LLM을 호출하여 분석을 수행합니다.
+    remaining_entities = [key for key in entities_to_analyze if key not in full_entity_analysis]
+    if remaining_entities:
+        print("  - [1단계] 개별 엔티티 분석 시작...")
+    for entity_key in remaining_entities:
+        _raise_if_cancelled(state)
         print(f"    - '{entity_key}' 분석 중...")
-        single_analysis = _generate_single_entity_analysis(state, entity_key)
+        # 같은 엔티티/구간/데이터의 분석 결과가 메모에 있거나 다른 요청이 계산 중이면 그 결과를 사용
+        single_analysis, from_memo = get_or_compute_entity_analysis(
+            memo_keys[entity_key],
+            lambda: _generate_single_entity_analysis(
+                state, entity_key, on_token=_section_token_callback(on_section_delta, entity_key)
+            ),
+        )
+        if from_memo:
+            print(f"    - '{entity_key}' 메모 캐시의 분석 결과를 재사용합니다.")
+        _raise_if_cancelled(state)
         if single_analysis:
             full_entity_analysis[entity_key] = single_analysis
         else:
+            record_fallback("entity_analysis")
             full_entity_analysis[entity_key] = {
                 "내용": f"{entity_key}에 대한 분석 생성에 실패했습니다.",
                 "주가_반응": "데이터 분석 오류"
             }
             print(f"'{entity_key}' 분석에 실패하여 기본값으로 대체합니다.")
+        notify_done(entity_key, full_entity_analysis[entity_key])
     
     if not full_entity_analysis:
         print("모든 엔티티 분석에 실패했습니다. 프로세스를 중단합니다.")
         return {}
 
     # 분석된 모든 내용을 바탕으로 요약 및 최종 투자 전략을 각각 생성합니다.
+    _raise_if_cancelled(state)
     print("  - [2단계] 브리핑 요약 생성 중...")
-    briefing_summary = _generate_briefing_summary(state, full_entity_analysis, financial_health, news_summaries_text)
+    briefing_summary = _generate_briefing_summary(
+        state, full_entity_analysis, financial_health, news_summaries_text,
+        on_token=_section_token_callback(on_section_delta, "briefing_summary")
+    )
+    _raise_if_cancelled(state)
+    if not briefing_summary:
+        record_fallback("briefing_summary")
+        briefing_summary = "분석 요약 생성에 실패했습니다."
+    notify_done("briefing_summary", briefing_summary)
     
+    _raise_if_cancelled(state)
     print("  - [3단계] 최종 투자 전략 생성 중...")
-    strategy_suggestion = _generate_strategy_suggestion(state, full_entity_analysis, financial_health, news_summaries_text)
+    strategy_suggestion = _generate_strategy_suggestion(
+        state, full_entity_analysis, financial_health, news_summaries_text,
+        on_token=_section_token_callback(on_section_delta, "strategy_suggestion")
+    )
+    _raise_if_cancelled(state)
+    if not strategy_suggestion:
+        record_fallback("strategy_suggestion")
+        strategy_suggestion = "전략 제안 생성에 실패했습니다."
+    notify_done("strategy_suggestion", strategy_suggestion)
 
     # 분석 결과를 종합하여 최종 리포트 객체를 만듭니다.
     final_report_structured = FinalReport(
-        report_title=f"[오늘의 투자 브리핑] {target_name} 기업 관련 주요 동향 및 전략",
-        briefing_summary=briefing_summary if briefing_summary else "분석 요약 생성에 실패했습니다.",
+        report_title=report_title,
+        briefing_summary=briefing_summary,
         news_analysis={"entity_analysis": full_entity_analysis},
-        strategy_suggestion=strategy_suggestion if strategy_suggestion else "전략 제안 생성에 실패했습니다."
+        strategy_suggestion=strategy_suggestion
     )
     
     print("[Report Synthesizer] 개별 호출 기반 최종 브리핑 생성을 완료했습니다.")
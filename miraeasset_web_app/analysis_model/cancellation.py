@@ -0,0 +1,49 @@
+# analysis_model/cancellation.py
+# 진행 중인 분석을 협조적으로(cooperative) 취소하기 위한 취소 토큰
+# 분석을 요청한 브라우저가 모두 연결을 끊으면 app.py가 토큰을 취소하고,
+# 파이프라인은 다음 단계를 시작하기 전에, LLM 호출은 스트리밍 루프 안에서 토큰을 확인하여 가능한 빨리 멈춘다
+# 스레드를 강제로 종료하지 않으므로 이미 보낸 요청의 응답은 받지 않고 버리는 방식이다
+
+import threading
+from typing import List, Optional
+
+
+class AnalysisCancelled(Exception):
+    """취소된 분석에서 다음 작업을 진행하려 할 때 발생시키는 예외"""
+
+
+class CancelToken:
+    """분석 하나의 취소 여부를 스레드 간에 공유하는 토큰"""
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._linked: List[threading.Event] = [] # 취소 시 함께 설정할 이벤트 (헤징 호출의 cancel_event 등)
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str) -> None:
+        """분석을 취소하고 연결된 이벤트를 모두 설정합니다. (여러 번 호출해도 처음 사유만 유지)"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            linked, self._linked = self._linked, []
+        for event in linked:
+            event.set()
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        """취소되었으면 AnalysisCancelled를 발생시킵니다."""
+        if self._event.is_set():
+            raise AnalysisCancelled(self.reason or "분석이 취소되었습니다.")
+
+    def link(self, event: threading.Event) -> None:
+        """토큰이 취소되면 event도 설정되도록 연결합니다. (이미 취소되었으면 바로 설정)"""
+        with self._lock:
+            if not self._event.is_set():
+                self._linked.append(event)
+                return
+        event.set()
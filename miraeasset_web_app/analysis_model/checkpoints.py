@@ -0,0 +1,54 @@
+# analysis_model/checkpoints.py
+# 분석 단계별 결과(체크포인트)를 저장해두었다가, 실패한 분석을 다시 실행할 때 처음으로 결과가 없는 단계부터 이어서 실행하게 하는 모듈
+# 최종 보고서 생성(Clova)이 실패해도 데이터 준비, 해외/국내 뉴스 선별(Gemini), 시장 데이터 분석을 다시 하지 않아도 된다
+# 키는 (티커, 실행 프로파일, 데이터 버전)이므로 뉴스/가격 데이터가 바뀌면 이전 체크포인트는 사용되지 않고 만료된다
+# 분석이 성공하면 결과는 분석 결과 캐시(result_cache.py)가 보관하므로 체크포인트는 지운다
+
+import os
+import copy
+import threading
+from typing import Any, Dict, Tuple
+
+from cachetools import TTLCache
+
+CHECKPOINT_TTL_SEC = int(os.environ.get("ANALYSIS_CHECKPOINT_TTL_SEC", "1800")) # 체크포인트 유지 시간 (기본 30분)
+CHECKPOINT_MAX_SIZE = 64 # 체크포인트를 보관할 최대 분석 수
+
+CheckpointKey = Tuple[str, str, str] # (티커, 실행 프로파일, 데이터 버전)
+
+_cache: TTLCache = TTLCache(maxsize=CHECKPOINT_MAX_SIZE, ttl=CHECKPOINT_TTL_SEC) # 키 -> {단계 이름: 단계 결과}
+_lock = threading.Lock()
+_stats = {"saved_stages": 0, "resumed_runs": 0, "restored_stages": 0}
+
+#######################################################
+# 저장 / 조회
+
+def save_checkpoint(key: CheckpointKey, stage: str, update: Dict[str, Any]) -> None:
+    """단계 하나의 결과를 저장합니다. (이후 단계가 결과를 수정해도 바뀌지 않도록 복사)"""
+    snapshot = copy.deepcopy(update)
+    with _lock:
+        stages = _cache.get(key) or {}
+        stages[stage] = snapshot
+        _cache[key] = stages # 다시 넣어서 유지 시간 갱신
+        _stats["saved_stages"] += 1
+
+def load_checkpoints(key: CheckpointKey) -> Dict[str, Dict[str, Any]]:
+    """저장된 단계별 결과의 복사본을 반환합니다. (없으면 빈 사전)"""
+    with _lock:
+        stages = _cache.get(key)
+        if stages:
+            _stats["resumed_runs"] += 1
+            _stats["restored_stages"] += len(stages)
+        return copy.deepcopy(stages) if stages else {}
+
+def clear_checkpoints(key: CheckpointKey) -> None:
+    """분석이 성공하면 더 이상 필요 없는 체크포인트를 지웁니다."""
+    with _lock:
+        _cache.pop(key, None)
+
+def get_checkpoint_stats() -> Dict[str, Any]:
+    """체크포인트 저장/복원 횟수와 현재 보관 중인 분석 수를 반환합니다."""
+    with _lock:
+        stats: Dict[str, Any] = dict(_stats)
+        stats["size"] = len(_cache)
+    return stats
@@ -0,0 +1,115 @@
+# analysis_model/entity_memo.py
+# 엔티티 분석 결과 메모 캐시
+# USDKRW=X, ^KS11, NVDA 같은 거시 엔티티는 여러 사용자/종목의 분석에서 같은 뉴스 구간으로 반복 분석되므로
+# (엔티티, 분석 대상 티커, 뉴스 블록 구간, 데이터 버전, 보고서 설정)을 키로 완성된 분석 결과를 TTL 동안 재사용한다
+# 보고서 설정(실행 프로파일, 엔티티 분석 방식, 출력 토큰 상한)이 다르면 분석 결과도 달라지므로 공유하지 않는다
+# 같은 키를 동시에 계산하려는 요청은 먼저 시작한 계산이 끝나기를 기다렸다가 결과를 공유한다
+
+import os
+import json
+import hashlib
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from cachetools import TTLCache
+
+ENTITY_MEMO_TTL_SEC = int(os.environ.get("ENTITY_MEMO_TTL_SEC", "21600")) # 메모 유지 시간 (기본 6시간)
+ENTITY_MEMO_MAX_SIZE = int(os.environ.get("ENTITY_MEMO_MAX_SIZE", "512")) # 최대 저장 개수
+ENTITY_MEMO_WAIT_SEC = 120 # 동시 계산 중인 결과를 기다리는 최대 시간
+
+EntityMemoKey = Tuple[str, str, str, str, str] # (엔티티 키, 분석 대상 티커, 뉴스 블록 구간, 데이터 버전, 보고서 설정)
+
+_memo: TTLCache = TTLCache(maxsize=ENTITY_MEMO_MAX_SIZE, ttl=ENTITY_MEMO_TTL_SEC)
+_lock = threading.Lock()
+_in_flight: Dict[EntityMemoKey, threading.Event] = {} # 계산 중인 키 -> 완료 이벤트
+_stats = {"hits": 0, "misses": 0, "shared_in_flight": 0, "stores": 0}
+
+#######################################################
+# 키 생성
+
+def make_entity_memo_key(entity_key: str, target_ticker: str | None, blocks: List[Dict[str, Any]], settings: str) -> EntityMemoKey:
+    """
+    엔티티 분석에 사용되는 뉴스 블록으로 메모 키를 만듭니다.
+    구간은 첫 블록의 시작일 ~ 마지막 블록의 종료일이며, 데이터 버전은 블록 내용(뉴스 제목, 주가)의 해시입니다.
+    settings는 분석 결과에 영향을 주는 보고서 설정 문자열입니다. (예: "balanced/per_entity/4096")
+    """
+    if blocks:
+        window = f"{blocks[0].get('기간', '').split('~')[0]}~{blocks[-1].get('기간', '').split('~')[-1]}"
+    else:
+        window = ""
+    serialized = json.dumps(blocks, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    version = hashlib.sha256(serialized.encode("utf-8")).hexdigest()[:16]
+    return (entity_key, target_ticker or "", window, version, settings)
+
+#######################################################
+# 조회 / 저장
+
+def lookup_entity_analysis(key: EntityMemoKey) -> Optional[Dict[str, Any]]:
+    """메모에 저장된 엔티티 분석 결과를 반환합니다. (없거나 만료되었으면 None)"""
+    with _lock:
+        cached = _memo.get(key)
+        if cached is not None:
+            _stats["hits"] += 1
+            return dict(cached)
+        _stats["misses"] += 1
+        return None
+
+def store_entity_analysis(key: EntityMemoKey, analysis: Dict[str, Any]) -> None:
+    """성공한 엔티티 분석 결과를 메모에 저장합니다. (실패 시 기본값은 저장하지 않음)"""
+    with _lock:
+        _memo[key] = dict(analysis)
+        _stats["stores"] += 1
+
+def get_or_compute_entity_analysis(
+    key: EntityMemoKey,
+    compute: Callable[[], Optional[Dict[str, Any]]],
+) -> Tuple[Optional[Dict[str, Any]], bool]:
+    """
+    메모에 결과가 있으면 반환하고, 없으면 compute()로 계산하여 저장합니다.
+    다른 요청이 같은 키를 계산 중이면 그 결과를 기다렸다가 공유합니다.
+    반환값: (분석 결과, 메모에서 가져왔는지 여부)
+    """
+    with _lock:
+        cached = _memo.get(key)
+        if cached is not None:
+            _stats["hits"] += 1
+            return dict(cached), True
+        event = _in_flight.get(key)
+        is_owner = event is None
+        if is_owner:
+            event = threading.Event()
+            _in_flight[key] = event
+            _stats["misses"] += 1
+        else:
+            _stats["shared_in_flight"] += 1
+
+    if not is_owner:
+        # 먼저 시작한 계산을 기다린다. 그 계산이 실패했으면 직접 계산한다.
+        event.wait(timeout=ENTITY_MEMO_WAIT_SEC)
+        with _lock:
+            cached = _memo.get(key)
+        if cached is not None:
+            return dict(cached), True
+        return compute(), False
+
+    result = None
+    try:
+        result = compute()
+    finally:
+        with _lock:
+            if result:
+                _memo[key] = dict(result)
+                _stats["stores"] += 1
+            _in_flight.pop(key, None)
+        event.set()
+    return result, False
+
+def get_entity_memo_stats() -> Dict[str, Any]:
+    """메모 적중/미스 횟수와 현재 저장 개수를 반환합니다."""
+    with _lock:
+        stats = dict(_stats)
+        stats["size"] = len(_memo)
+        stats["in_flight"] = len(_in_flight)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    return stats
@@ -0,0 +1,187 @@
+# analysis_model/hedging.py
+# 지연시간이 중요한 LLM 호출을 위한 헤징(Hedged Request)
+# 주 공급자가 p95 기반 임계 시간 안에 첫 토큰을 내지 못하면, 같은 작업을 보조 공급자에게도 보내고
+# 먼저 끝난 쪽의 결과를 사용한 뒤 나머지 호출은 취소한다
+# 파이프라인의 꼬리 지연시간은 가끔 발생하는 매우 느린 스트림이 대부분을 차지하기 때문
+
+import os
+import time
+import threading
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from .cancellation import CancelToken
+
+HEDGING_ENABLED = os.environ.get("LLM_HEDGING", "on").lower() != "off"
+HEDGE_DEFAULT_THRESHOLD_SEC = float(os.environ.get("LLM_HEDGE_DEFAULT_THRESHOLD_SEC", "8")) # 표본이 부족할 때의 임계 시간
+HEDGE_MIN_THRESHOLD_SEC = 1.0 # p95가 아무리 작아도 이 시간보다 빨리 헤징하지 않음
+HEDGE_MIN_SAMPLES = 20 # p95를 계산하기 위한 최소 표본 수
+HEDGE_SAMPLE_WINDOW = 200 # 공급자별로 보관하는 최근 첫 토큰 지연시간 개수
+
+# 헤징 대상 작업: (공급자 이름, fn(on_token, cancel_event) -> 응답 문자열 또는 None)
+## fn은 스트리밍 중 cancel_event가 설정되면 가능한 빨리 중단해야 한다
+HedgeTask = Tuple[str, Callable[[Callable[[str], None], threading.Event], Optional[str]]]
+
+_lock = threading.Lock()
+_first_token_samples: Dict[str, Deque[float]] = {}
+_stats = {"calls": 0, "hedged": 0, "secondary_wins": 0, "failures": 0}
+
+#######################################################
+# 첫 토큰 지연시간 기록 및 임계 시간 계산
+
+def record_first_token_latency(provider: str, seconds: float) -> None:
+    """공급자의 첫 토큰 지연시간 표본을 기록합니다."""
+    with _lock:
+        _first_token_samples.setdefault(provider, deque(maxlen=HEDGE_SAMPLE_WINDOW)).append(seconds)
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+def hedge_threshold(provider: str) -> float:
+    """공급자의 첫 토큰 p95 지연시간을 헤징 임계 시간으로 사용합니다. (표본이 부족하면 기본값)"""
+    with _lock:
+        samples = list(_first_token_samples.get(provider, []))
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        return HEDGE_DEFAULT_THRESHOLD_SEC
+    return max(HEDGE_MIN_THRESHOLD_SEC, _percentile(samples, 0.95))
+
+def get_hedging_stats() -> Dict[str, object]:
+    """헤징 발생 횟수와 공급자별 첫 토큰 p50/p95, 현재 임계 시간을 반환합니다."""
+    with _lock:
+        stats: Dict[str, object] = dict(_stats)
+        samples = {provider: list(values) for provider, values in _first_token_samples.items()}
+    stats["providers"] = {
+        provider: {
+            "samples": len(values),
+            "first_token_p50": round(_percentile(values, 0.5), 3) if values else None,
+            "first_token_p95": round(_percentile(values, 0.95), 3) if values else None,
+            "threshold_sec": round(hedge_threshold(provider), 3),
+        }
+        for provider, values in samples.items()
+    }
+    return stats
+
+#######################################################
+# 헤징 실행
+
+class _Attempt:
+    """공급자 하나에 대한 백그라운드 호출 (첫 토큰/완료 시 signal을 설정)"""
+
+    def __init__(self, task: HedgeTask, signal: threading.Event, forward: Callable[["_Attempt", str], None]):
+        self.provider, self._fn = task
+        self.cancel_event = threading.Event()
+        self.first_token = threading.Event()
+        self.done = threading.Event()
+        self.result: Optional[str] = None
+        self._signal = signal
+        self._forward = forward
+        self._started = time.perf_counter()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _on_token(self, delta: str) -> None:
+        if not self.first_token.is_set():
+            record_first_token_latency(self.provider, time.perf_counter() - self._started)
+            self.first_token.set()
+            self._signal.set()
+        self._forward(self, delta)
+
+    def _run(self) -> None:
+        try:
+            self.result = self._fn(self._on_token, self.cancel_event)
+        except Exception as e:
+            print(f"[Hedging] {self.provider} 호출 중 오류 발생: {e}")
+            self.result = None
+        finally:
+            self.done.set()
+            self._signal.set()
+
+def hedged_call(
+    stage: str,
+    primary: HedgeTask,
+    secondary: Optional[HedgeTask] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    cancel_token: Optional[CancelToken] = None,
+) -> Optional[str]:
+    """
+    주 공급자로 호출하고, 임계 시간 안에 첫 토큰이 없거나 결과 없이 끝나면 보조 공급자로도 호출합니다.
+    먼저 유효한 결과를 낸 쪽을 반환하고 다른 쪽은 취소합니다.
+    on_token에는 가장 먼저 토큰을 낸 공급자의 토큰만 전달됩니다.
+    cancel_token이 취소되면 진행 중인 호출의 스트림을 중단하고 AnalysisCancelled를 발생시킵니다.
+    (취소로 중단된 부분 응답을 결과로 반환하거나 실패로 집계하지 않음)
+    """
+    def check_cancelled() -> None:
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+
+    check_cancelled()
+    signal = threading.Event()
+    if cancel_token:
+        cancel_token.link(signal) # 취소되면 기다리던 곳을 바로 깨운다
+    stream_lock = threading.Lock()
+    leader: List[_Attempt] = [] # 토큰을 화면에 전달하는 공급자 (처음 토큰을 낸 쪽)
+
+    def forward(attempt: _Attempt, delta: str) -> None:
+        with stream_lock:
+            if not leader:
+                leader.append(attempt)
+            is_leader = leader[0] is attempt
+        if is_leader and on_token and not attempt.cancel_event.is_set():
+            on_token(delta)
+
+    with _lock:
+        _stats["calls"] += 1
+    first = _Attempt(primary, signal, forward)
+    if cancel_token:
+        cancel_token.link(first.cancel_event)
+    if not HEDGING_ENABLED or secondary is None:
+        first.done.wait()
+        check_cancelled()
+        return first.result
+
+    # 첫 토큰, 완료, 임계 시간 중 가장 먼저 오는 것을 기다린다
+    threshold = hedge_threshold(first.provider)
+    deadline = time.perf_counter() + threshold
+    while not (first.first_token.is_set() or first.done.is_set()):
+        remaining = deadline - time.perf_counter()
+        if remaining <= 0:
+            break
+        signal.wait(remaining)
+        signal.clear()
+        check_cancelled()
+
+    if first.first_token.is_set() or (first.done.is_set() and first.result):
+        first.done.wait()
+        check_cancelled()
+        return first.result
+
+    check_cancelled() # 임계 시간을 기다리는 동안 취소되었으면 보조 공급자를 호출하지 않음
+    reason = "결과 없이 종료" if first.done.is_set() else f"첫 토큰 {threshold:.1f}s 초과"
+    print(f"[Hedging] {stage}: {first.provider} {reason} → {secondary[0]} 동시 호출")
+    with _lock:
+        _stats["hedged"] += 1
+    second = _Attempt(secondary, signal, forward)
+    if cancel_token:
+        cancel_token.link(second.cancel_event)
+
+    attempts = [first, second]
+    while True:
+        winner = next((a for a in attempts if a.done.is_set() and a.result), None)
+        finished = all(a.done.is_set() for a in attempts)
+        check_cancelled() # 취소로 끝난 호출은 결과도 실패도 아님 (두 호출의 스트림은 토큰에 연결되어 이미 중단됨)
+        if winner:
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancel_event.set() # 진 쪽의 스트림을 중단
+            if winner is second:
+                with _lock:
+                    _stats["secondary_wins"] += 1
+            print(f"[Hedging] {stage}: {winner.provider} 결과를 사용합니다.")
+            return winner.result
+        if finished:
+            with _lock:
+                _stats["failures"] += 1
+            return None
+        signal.wait(0.5)
+        signal.clear()
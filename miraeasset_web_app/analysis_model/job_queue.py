@@ -0,0 +1,121 @@
+# analysis_model/job_queue.py
+# 분석 작업을 정해진 수의 작업자 스레드로만 실행하는 대기열
+# 요청마다 스레드를 새로 만들면 요청이 몰릴 때 수십 개의 파이프라인이 동시에 LLM 할당량과 메모리를 소모하므로,
+# 작업자 수(ANALYSIS_MAX_WORKERS)만큼만 동시에 실행하고 나머지는 대기열(ANALYSIS_QUEUE_SIZE)에서 기다리게 한다
+# 대기열이 가득 차면 새 작업을 받지 않고, 대기 중인 작업에는 순번이 바뀔 때마다 순번과 예상 대기 시간을 알린다
+
+import os
+import math
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+ANALYSIS_MAX_WORKERS = int(os.environ.get("ANALYSIS_MAX_WORKERS", "2")) # 동시에 실행하는 최대 분석 수
+ANALYSIS_QUEUE_SIZE = int(os.environ.get("ANALYSIS_QUEUE_SIZE", "8")) # 실행을 기다릴 수 있는 최대 분석 수
+DEFAULT_JOB_SEC = 60.0 # 완료된 분석이 없을 때 사용하는 분석 1건의 예상 소요 시간
+DURATION_WINDOW = 20 # 예상 대기 시간 계산에 사용하는 최근 분석 수
+
+# (작업 이름, 실행 함수, 순번 알림 함수(순번, 예상 대기 초))
+QueuedJob = Tuple[str, Callable[[], None], Callable[[int, int], None]]
+
+_waiting: Deque[QueuedJob] = deque()
+_running: Dict[str, float] = {} # 실행 중인 작업 이름 -> 시작 시각
+_durations: Deque[float] = deque(maxlen=DURATION_WINDOW)
+_condition = threading.Condition()
+_workers: List[threading.Thread] = []
+_stats = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0}
+
+#######################################################
+# 예상 대기 시간
+
+def _average_job_sec() -> float:
+    return sum(_durations) / len(_durations) if _durations else DEFAULT_JOB_SEC
+
+def _estimate_wait_sec(position: int) -> int:
+    """대기 순번(1부터)의 예상 대기 시간(초)입니다. 작업자 수만큼씩 묶어서 평균 소요 시간만큼 걸린다고 봅니다."""
+    return int(math.ceil(position / ANALYSIS_MAX_WORKERS) * _average_job_sec())
+
+def _queue_snapshot() -> List[Tuple[Callable[[int, int], None], int, int]]:
+    """대기 중인 작업별 (알림 함수, 순번, 예상 대기 초) 목록입니다. (_condition을 잡은 상태에서 호출)"""
+    snapshot = []
+    for index, (_, _, notify) in enumerate(_waiting, start=1):
+        position = len(_running) + index - ANALYSIS_MAX_WORKERS # 쉬고 있는 작업자가 곧 가져갈 작업은 제외
+        if position > 0:
+            snapshot.append((notify, position, _estimate_wait_sec(position)))
+    return snapshot
+
+def _notify_positions(snapshot: List[Tuple[Callable[[int, int], None], int, int]]) -> None:
+    # 알림 함수(socketio.emit 등)는 잠금 밖에서 호출
+    for notify, position, eta_sec in snapshot:
+        try:
+            notify(position, eta_sec)
+        except Exception as e:
+            print(f"[Job Queue] 대기 순번 알림 실패: {e}")
+
+#######################################################
+# 작업자
+
+def _worker_loop() -> None:
+    while True:
+        with _condition:
+            while not _waiting:
+                _condition.wait()
+            name, run, _ = _waiting.popleft()
+            _running[name] = time.perf_counter()
+            snapshot = _queue_snapshot()
+        _notify_positions(snapshot) # 한 칸씩 앞당겨진 순번 알림
+
+        failed = False
+        try:
+            run()
+        except Exception as e:
+            # 분석 함수가 오류를 직접 클라이언트에 알리므로, 여기서는 작업자가 멈추지 않도록만 함
+            print(f"[Job Queue] '{name}' 작업 실패: {e}")
+            failed = True
+
+        with _condition:
+            _durations.append(time.perf_counter() - _running.pop(name))
+            _stats["failed" if failed else "completed"] += 1
+
+def _ensure_workers() -> None:
+    """작업자 스레드를 처음 작업이 들어올 때 만듭니다. (_condition을 잡은 상태에서 호출)"""
+    while len(_workers) < ANALYSIS_MAX_WORKERS:
+        worker = threading.Thread(target=_worker_loop, name=f"analysis-worker-{len(_workers)}", daemon=True)
+        _workers.append(worker)
+        worker.start()
+
+#######################################################
+# 작업 제출
+
+def submit_job(name: str, run: Callable[[], None], on_position: Callable[[int, int], None]) -> Optional[int]:
+    """
+    분석 작업을 대기열에 넣고 대기 순번을 반환합니다. (0이면 바로 실행, 대기열이 가득 차면 None)
+    대기하는 동안 순번이 바뀔 때마다 on_position(순번, 예상 대기 초)을 호출합니다.
+    """
+    with _condition:
+        if len(_running) + len(_waiting) >= ANALYSIS_MAX_WORKERS + ANALYSIS_QUEUE_SIZE:
+            _stats["rejected"] += 1
+            return None
+        _ensure_workers()
+        _waiting.append((name, run, on_position))
+        _stats["accepted"] += 1
+        # 쉬고 있는 작업자가 있으면 바로 실행되므로 순번 0
+        position = max(0, len(_running) + len(_waiting) - ANALYSIS_MAX_WORKERS)
+        eta_sec = _estimate_wait_sec(position)
+        _condition.notify()
+
+    if position:
+        _notify_positions([(on_position, position, eta_sec)])
+    return position
+
+def get_job_queue_stats() -> Dict[str, Any]:
+    """작업자 수, 실행/대기 중인 작업, 대기열 크기, 평균 분석 시간과 처리/거절 횟수를 반환합니다."""
+    with _condition:
+        stats: Dict[str, Any] = dict(_stats)
+        stats["running"] = list(_running)
+        stats["waiting"] = [name for name, _, _ in _waiting]
+        stats["avg_job_sec"] = round(_average_job_sec(), 1)
+    stats["max_workers"] = ANALYSIS_MAX_WORKERS
+    stats["queue_size"] = ANALYSIS_QUEUE_SIZE
+    return stats
@@ -0,0 +1,163 @@
+# analysis_model/llm_ledger.py
+# 모든 LLM 호출의 토큰, 지연시간, 결과를 기록하는 장부(ledger)
+# 호출마다 공급자, 모델, 단계, 입력/출력 토큰, 지연시간, 결과(success / error / cancelled / fallback)를
+# JSON Lines 파일에 한 줄씩 추가하고, 일별 집계와 남은 일일 할당량 추정치를 계산한다
+# 배치 보고서 생성(batch_reports.py)은 has_quota로 공급자별 요청 예산을 확인한 뒤 새 종목을 시작한다
+# 스크래퍼(news_scraping, ko_news_scraping)도 같은 형식으로 기록하므로 LLM_LEDGER_PATH를 공유하면 함께 집계된다
+
+import os
+import json
+import threading
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from typing import Any, Dict, List, Optional
+
+LLM_LEDGER_PATH = os.environ.get(
+    "LLM_LEDGER_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "llm_ledger.jsonl")
+)
+
+# 공급자/모델별 일일 요청 할당량 (무료 등급 기준, LLM_DAILY_QUOTAS 환경변수로 덮어쓰기 가능)
+## 예: LLM_DAILY_QUOTAS='{"gemini/gemini-2.5-flash": 250}'
+DAILY_REQUEST_QUOTAS: Dict[str, int] = {
+    "gemini/gemini-2.5-flash": 250,
+    "gemini/gemini-2.5-flash-lite": 1000,
+    "gemini/text-embedding-004": 1500,
+}
+DAILY_REQUEST_QUOTAS.update(json.loads(os.environ.get("LLM_DAILY_QUOTAS", "{}")))
+
+REPORT_TIMEZONE = ZoneInfo("Asia/Seoul") # 일별 집계 기준 시간대
+QUOTA_TIMEZONE = ZoneInfo("America/Los_Angeles") # Gemini 일일 할당량은 태평양 시간 자정에 초기화됨
+
+_lock = threading.Lock()
+
+#######################################################
+# 기록
+
+def record_llm_call(
+    provider: Optional[str],
+    model: Optional[str],
+    stage: str,
+    prompt_tokens: Optional[int] = None,
+    completion_tokens: Optional[int] = None,
+    latency_sec: Optional[float] = None,
+    outcome: str = "success",
+    cached_tokens: Optional[int] = None,
+) -> None:
+    """LLM 호출 한 건을 장부에 추가합니다. (기록 실패는 분석을 중단시키지 않음)"""
+    entry = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "provider": provider,
+        "model": model,
+        "stage": stage,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "cached_tokens": cached_tokens,
+        "latency_sec": round(latency_sec, 3) if latency_sec is not None else None,
+        "outcome": outcome,
+    }
+    try:
+        with _lock, open(LLM_LEDGER_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"[LLM Ledger] 기록 실패: {e}")
+
+#######################################################
+# 집계
+
+def _read_entries(since: datetime) -> List[Dict[str, Any]]:
+    if not os.path.exists(LLM_LEDGER_PATH):
+        return []
+    entries = []
+    with _lock, open(LLM_LEDGER_PATH, encoding="utf-8") as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                entry["_ts"] = datetime.fromisoformat(entry["ts"])
+            except (json.JSONDecodeError, KeyError, ValueError):
+                continue
+            if entry["_ts"] >= since:
+                entries.append(entry)
+    return entries
+
+def _p95(values: List[float]) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(0.95 * (len(ordered) - 1) + 0.5))], 3)
+
+def get_daily_usage(days: int = 7) -> Dict[str, Any]:
+    """
+    최근 days일의 일별(한국 시간) 집계와 오늘(태평양 시간 기준)의 남은 할당량 추정치를 반환합니다.
+    일별 집계는 날짜 -> "공급자/모델/단계" -> 호출 수, 결과별 횟수, 토큰 합계, 평균/p95 지연시간 입니다.
+    """
+    now = datetime.now(timezone.utc)
+    entries = _read_entries(now - timedelta(days=days + 1))
+
+    daily: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    latencies: Dict[tuple, List[float]] = {}
+    oldest_day = (now.astimezone(REPORT_TIMEZONE) - timedelta(days=days - 1)).date().isoformat()
+    for entry in entries:
+        day = entry["_ts"].astimezone(REPORT_TIMEZONE).date().isoformat()
+        if day < oldest_day:
+            continue
+        group = f"{entry.get('provider') or '-'}/{entry.get('model') or '-'}/{entry.get('stage')}"
+        bucket = daily.setdefault(day, {}).setdefault(group, {
+            "calls": 0, "outcomes": {}, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+        })
+        bucket["calls"] += 1
+        bucket["outcomes"][entry.get("outcome")] = bucket["outcomes"].get(entry.get("outcome"), 0) + 1
+        for field in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+            bucket[field] += entry.get(field) or 0
+        if entry.get("latency_sec") is not None:
+            latencies.setdefault((day, group), []).append(entry["latency_sec"])
+
+    for (day, group), values in latencies.items():
+        daily[day][group]["avg_latency_sec"] = round(sum(values) / len(values), 3)
+        daily[day][group]["p95_latency_sec"] = _p95(values)
+
+    # 남은 할당량 추정: 오늘(태평양 시간) 공급자/모델별 요청 수 (비상 모드 기록은 실제 요청이 아니므로 제외)
+    quota_day = now.astimezone(QUOTA_TIMEZONE).date()
+    used: Dict[str, int] = {}
+    for entry in entries:
+        if entry.get("outcome") == "fallback" or entry["_ts"].astimezone(QUOTA_TIMEZONE).date() != quota_day:
+            continue
+        key = f"{entry.get('provider')}/{entry.get('model')}"
+        used[key] = used.get(key, 0) + 1
+    quota = {
+        key: {
+            "daily_limit": DAILY_REQUEST_QUOTAS.get(key),
+            "used_today": count,
+            "remaining_estimate": max(0, DAILY_REQUEST_QUOTAS[key] - count) if key in DAILY_REQUEST_QUOTAS else None,
+        }
+        for key, count in used.items()
+    }
+    for key, limit in DAILY_REQUEST_QUOTAS.items():
+        quota.setdefault(key, {"daily_limit": limit, "used_today": 0, "remaining_estimate": limit})
+
+    return {"ledger_path": LLM_LEDGER_PATH, "daily": dict(sorted(daily.items(), reverse=True)), "quota": quota}
+
+#######################################################
+# 할당량 확인
+
+def count_requests(since: datetime) -> Dict[str, int]:
+    """since 이후 공급자별 요청 수를 반환합니다. (비상 모드 기록은 실제 요청이 아니므로 제외)"""
+    counts: Dict[str, int] = {}
+    for entry in _read_entries(since):
+        if entry.get("outcome") == "fallback" or not entry.get("provider"):
+            continue
+        counts[entry["provider"]] = counts.get(entry["provider"], 0) + 1
+    return counts
+
+def has_quota(provider: str, budget: int, since: datetime, reserve: int = 0) -> bool:
+    """
+    since 이후 provider 요청 수에 앞으로 쓸 reserve건을 더해도 budget을 넘지 않고,
+    장부 기준 오늘 남은 일일 할당량(같은 공급자의 모든 모델)도 reserve건 이상인지 확인합니다.
+    """
+    if count_requests(since).get(provider, 0) + reserve > budget:
+        return False
+    quota = get_daily_usage(1)["quota"]
+    return all(
+        info["remaining_estimate"] is None or info["remaining_estimate"] >= reserve
+        for key, info in quota.items() if key.startswith(f"{provider}/")
+    )
@@ -0,0 +1,168 @@
+# analysis_model/llm_output.py
+# LLM의 구조화된(JSON) 응답을 파싱하고 검증하는 공용 모듈
+# 모든 에이전트가 같은 스키마 정의와 검증기를 사용하며,
+# 파싱 실패와 비상 모드(fallback) 발생 횟수를 단계(stage)별로 집계한다
+
+import json
+import threading
+from typing import Any, Dict, List
+
+from .llm_ledger import record_llm_call
+
+#######################################################
+# 응답 스키마 정의 (JSON Schema의 일부 문법만 사용)
+## Gemini의 response_schema, Clova의 responseFormat에 그대로 전달할 수 있는 형식
+
+ENTITY_ANALYSIS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "내용": {"type": "string"},
+        "주가_반응": {"type": "string"},
+    },
+    "required": ["내용", "주가_반응"],
+}
+
+BRIEFING_SUMMARY_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {"briefing_summary": {"type": "string"}},
+    "required": ["briefing_summary"],
+}
+
+STRATEGY_SUGGESTION_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {"strategy_suggestion": {"type": "string"}},
+    "required": ["strategy_suggestion"],
+}
+
+def news_selection_schema(result_key: str) -> Dict[str, Any]:
+    """뉴스 선별 결과 스키마 (해외: 'selected_news', 국내: 'selected_domestic_news')"""
+    return {
+        "type": "object",
+        "properties": {
+            result_key: {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "index": {"type": "integer"},
+                        "related_tickers": {"type": "array", "items": {"type": "string"}},
+                    },
+                    "required": ["index", "related_tickers"],
+                },
+            }
+        },
+        "required": [result_key],
+    }
+
+def batched_entity_analysis_schema(entity_keys: List[str]) -> Dict[str, Any]:
+    """엔티티 일괄 분석 결과 스키마 (엔티티 키마다 ENTITY_ANALYSIS_SCHEMA 객체 하나)"""
+    return {
+        "type": "object",
+        "properties": {key: ENTITY_ANALYSIS_SCHEMA for key in entity_keys},
+        "required": list(entity_keys),
+    }
+
+#######################################################
+# 파싱 및 검증
+
+def extract_json_text(response_text: str) -> str:
+    """
+    LLM 응답에서 JSON 부분만 잘라냅니다.
+    ```json ... ``` 마크다운 블록이 있으면 마지막 블록의 내용을, 없으면 가장 바깥쪽 {...}를 사용합니다.
+    """
+    if not response_text:
+        raise ValueError("Empty response.")
+    start_marker = '```json'
+    if start_marker in response_text:
+        json_candidate = response_text[response_text.rfind(start_marker) + len(start_marker):]
+        end_index = json_candidate.find('```')
+        return (json_candidate[:end_index] if end_index != -1 else json_candidate).strip()
+    start_index = response_text.find('{')
+    end_index = response_text.rfind('}') + 1
+    if start_index == -1 or end_index <= start_index:
+        raise ValueError("Could not find a valid JSON object structure in the response.")
+    return response_text[start_index:end_index]
+
+_JSON_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "integer": int,
+    "number": (int, float),
+    "boolean": bool,
+}
+
+def validate_json(data: Any, schema: Dict[str, Any], path: str = "$") -> List[str]:
+    """
+    스키마에 맞지 않는 항목을 오류 메시지 목록으로 반환합니다. (빈 목록이면 유효)
+    type / properties / required / items만 검사합니다.
+    """
+    errors: List[str] = []
+    expected_type = str(schema.get("type", "")).lower()
+    python_type = _JSON_TYPES.get(expected_type)
+    # bool은 int의 하위 클래스이므로 정수/실수 검사에서 제외한다
+    if python_type and (not isinstance(data, python_type) or (expected_type in ("integer", "number") and isinstance(data, bool))):
+        return [f"{path}: expected {expected_type}, got {type(data).__name__}"]
+
+    if expected_type == "object":
+        for key in schema.get("required", []):
+            if key not in data:
+                errors.append(f"{path}: missing required key '{key}'")
+        for key, sub_schema in schema.get("properties", {}).items():
+            if key in data:
+                errors.extend(validate_json(data[key], sub_schema, f"{path}.{key}"))
+    elif expected_type == "array" and "items" in schema:
+        for i, item in enumerate(data):
+            errors.extend(validate_json(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+def parse_json_response(stage: str, response_text: str | None, schema: Dict[str, Any], structured: bool = False) -> Any:
+    """
+    LLM 응답을 JSON으로 파싱하고 스키마를 검증합니다.
+    structured=True는 공급자의 구조화 출력 모드(응답 스키마)로 받은 응답임을 뜻하며, 집계에만 사용됩니다.
+    파싱 또는 검증에 실패하면 ValueError를 발생시킵니다.
+    """
+    _record(stage, "calls")
+    if structured:
+        _record(stage, "structured_calls")
+    try:
+        text = (response_text or "").strip() if structured else extract_json_text(response_text or "")
+        data = json.loads(text)
+    except (json.JSONDecodeError, ValueError) as e:
+        _record(stage, "parse_failures")
+        raise ValueError(f"[{stage}] JSON 파싱 실패: {e}") from e
+
+    errors = validate_json(data, schema)
+    if errors:
+        _record(stage, "validation_failures")
+        raise ValueError(f"[{stage}] 스키마 검증 실패: {'; '.join(errors[:3])}")
+    return data
+
+#######################################################
+# 단계별 집계
+## 파싱 실패/비상 모드 비율을 보고, 구조화 출력으로 사라진 재시도를 확인하기 위함
+
+_stats_lock = threading.Lock()
+_stats: Dict[str, Dict[str, int]] = {}
+_STAT_FIELDS = ("calls", "structured_calls", "parse_failures", "validation_failures", "fallbacks")
+
+def _record(stage: str, field: str) -> None:
+    with _stats_lock:
+        stage_stats = _stats.setdefault(stage, {f: 0 for f in _STAT_FIELDS})
+        stage_stats[field] += 1
+
+def record_fallback(stage: str) -> None:
+    """파싱에 실패하여 비상 모드(기본값, 임시 선택 등)로 대체했음을 기록합니다."""
+    _record(stage, "fallbacks")
+    record_llm_call(None, None, stage, outcome="fallback")
+
+def get_output_stats() -> Dict[str, Dict[str, Any]]:
+    """단계별 호출/실패 횟수와 실패율을 반환합니다."""
+    with _stats_lock:
+        snapshot = {stage: dict(values) for stage, values in _stats.items()}
+    for values in snapshot.values():
+        calls = values["calls"]
+        failures = values["parse_failures"] + values["validation_failures"]
+        values["failure_rate"] = round(failures / calls, 4) if calls else 0.0
+        values["fallback_rate"] = round(values["fallbacks"] / calls, 4) if calls else 0.0
+    return snapshot
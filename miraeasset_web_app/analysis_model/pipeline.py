@@ -0,0 +1,132 @@
+# analysis_model/pipeline.py
+# 분석 에이전트를 의존성 그래프(DAG)로 실행하는 스케줄러
+# 각 단계는 선행 단계가 모두 끝나는 즉시 시작하므로, 서로 독립인 해외/국내 뉴스 분석은 동시에 실행된다
+# 단계의 입력은 "초기 상태 + 조상 단계들의 결과"이고, 결과는 완료 순서가 아니라 단계 선언 순서대로 병합하므로
+# 실행 타이밍과 관계없이 같은 입력에서는 항상 같은 AnalysisState가 만들어진다
+# 이전 실행에서 저장한 단계 결과(체크포인트)를 넘기면 그 단계는 다시 실행하지 않고, 처음으로 결과가 없는 단계부터 이어서 실행한다
+# 취소 토큰이 취소되면 다음 단계를 시작하지 않고 AnalysisCancelled를 발생시킨다
+
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple, TypedDict
+
+from .state import AnalysisState
+from .cancellation import CancelToken
+
+PIPELINE_MAX_WORKERS = 4 # 동시에 실행하는 최대 단계 수
+
+
+class PipelineStage(TypedDict):
+    name: str # 단계 이름 (stage_durations의 키)
+    run: Callable[[AnalysisState], Dict[str, Any]] # 상태를 받아 갱신할 필드를 반환하는 에이전트 함수
+    depends_on: List[str] # 먼저 끝나야 하는 단계 이름
+
+
+class StageAbort(Exception):
+    """단계가 분석을 더 진행할 수 없다고 판단했을 때 발생시키는 예외 (메시지는 사용자에게 그대로 표시)"""
+
+#######################################################
+# 그래프 검사
+
+def _collect_ancestors(stages: List[PipelineStage]) -> Dict[str, Set[str]]:
+    """단계별 조상 단계 집합을 계산합니다. 없는 단계를 참조하거나 순환이 있으면 ValueError를 발생시킵니다."""
+    by_name = {stage["name"]: stage for stage in stages}
+    if len(by_name) != len(stages):
+        raise ValueError("단계 이름이 중복되었습니다.")
+    for stage in stages:
+        unknown = [dep for dep in stage["depends_on"] if dep not in by_name]
+        if unknown:
+            raise ValueError(f"'{stage['name']}' 단계가 없는 단계에 의존합니다: {unknown}")
+
+    ancestors: Dict[str, Set[str]] = {}
+
+    def visit(name: str, path: Tuple[str, ...]) -> Set[str]:
+        if name in path:
+            raise ValueError(f"단계 의존성에 순환이 있습니다: {' -> '.join(path + (name,))}")
+        if name not in ancestors:
+            found: Set[str] = set()
+            for dep in by_name[name]["depends_on"]:
+                found |= {dep} | visit(dep, path + (name,))
+            ancestors[name] = found
+        return ancestors[name]
+
+    for stage in stages:
+        visit(stage["name"], ())
+    return ancestors
+
+def restorable_stages(stages: List[PipelineStage], checkpoints: Optional[Dict[str, Dict[str, Any]]]) -> Set[str]:
+    """체크포인트로 대신할 수 있는 단계 이름을 반환합니다. (자신과 모든 조상 단계의 결과가 저장되어 있어야 함)"""
+    if not checkpoints:
+        return set()
+    ancestors = _collect_ancestors(stages)
+    saved = {stage["name"] for stage in stages if stage["name"] in checkpoints}
+    return {name for name in saved if ancestors[name] <= saved}
+
+#######################################################
+# 실행
+
+def run_stage_graph(
+    initial_state: AnalysisState,
+    stages: List[PipelineStage],
+    on_stage_start: Optional[Callable[[str], None]] = None,
+    on_stage_done: Optional[Callable[[str, float], None]] = None,
+    max_workers: int = PIPELINE_MAX_WORKERS,
+    checkpoints: Optional[Dict[str, Dict[str, Any]]] = None,
+    on_checkpoint: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    cancel_token: Optional[CancelToken] = None,
+) -> Tuple[AnalysisState, Dict[str, float]]:
+    """
+    단계들을 의존성 순서대로 실행하고 (최종 상태, 단계별 소요 시간)을 반환합니다.
+    콜백은 모두 호출한 스레드에서 실행되며, 같은 시점에 끝난 단계는 선언 순서대로 알립니다.
+    단계에서 예외가 발생하면 아직 시작하지 않은 단계는 취소하고 예외를 그대로 전달합니다.
+    checkpoints(단계 이름 -> 결과)로 복원한 단계는 실행하지 않으며 콜백과 소요 시간에도 포함하지 않습니다.
+    on_checkpoint(단계 이름, 결과)는 단계가 끝날 때마다 호출되어, 실패 후 다시 실행할 때 쓸 결과를 저장할 수 있게 합니다.
+    cancel_token이 취소되면 새 단계를 시작하지 않고 AnalysisCancelled를 발생시킵니다. (실행 중인 단계는 스스로 멈추기를 기다림)
+    """
+    ancestors = _collect_ancestors(stages)
+    order = [stage["name"] for stage in stages]
+    by_name = {stage["name"]: stage for stage in stages}
+    updates: Dict[str, Dict[str, Any]] = {name: checkpoints[name] for name in restorable_stages(stages, checkpoints)}
+    durations: Dict[str, float] = {}
+
+    def merged_state(names: Set[str]) -> AnalysisState:
+        state = dict(initial_state)
+        for name in order:
+            if name in names and name in updates:
+                state.update(updates[name])
+        return state  # type: ignore[return-value]
+
+    def run_timed(stage: PipelineStage, state: AnalysisState) -> Tuple[Dict[str, Any], float]:
+        if cancel_token:
+            cancel_token.raise_if_cancelled() # 대기하는 동안 취소된 경우
+        started = time.perf_counter()
+        result = stage["run"](state) or {}
+        return result, time.perf_counter() - started
+
+    pending = [name for name in order if name not in updates]
+    running: Dict[Future, str] = {}
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pipeline")
+    try:
+        while pending or running:
+            if cancel_token:
+                cancel_token.raise_if_cancelled()
+            ready = [name for name in pending if all(dep in updates for dep in by_name[name]["depends_on"])]
+            for name in ready:
+                pending.remove(name)
+                if on_stage_start:
+                    on_stage_start(name)
+                running[pool.submit(run_timed, by_name[name], merged_state(ancestors[name]))] = name
+
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=lambda f: order.index(running[f])):
+                name = running.pop(future)
+                updates[name], durations[name] = future.result()
+                if on_checkpoint:
+                    on_checkpoint(name, updates[name])
+                if on_stage_done:
+                    on_stage_done(name, durations[name])
+    finally:
+        # 실패 시 대기 중인 단계는 취소하고, 실행 중인 단계는 끝나기를 기다리지 않는다
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    return merged_state(set(order)), durations
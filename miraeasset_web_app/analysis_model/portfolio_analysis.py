@@ -0,0 +1,303 @@
+# analysis_model/portfolio_analysis.py
+# 포트폴리오 보유 종목 전체를 하나의 작업으로 분석하는 일괄 분석 모드
+# 종목마다 파이프라인을 따로 실행하면 RAG 검색, 가격 조회, 공통 거시 지표(환율, 코스피) 조회가 종목 수만큼 반복되므로
+# 공유할 수 있는 작업은 모든 종목에 대해 한 번에 실행하고 결과를 종목별 상태에 넣어, 종목별 에이전트가 다시 조회하지 않게 한다
+## 1) 데이터 준비 (종목별, DB만 사용)
+## 2) 해외/국내 RAG 후보 검색: 모든 종목의 임베딩을 한 행렬로 묶어 유사도를 한 번에 계산
+## 3) 뉴스 선별 (종목별 LLM 호출)
+## 4) 가격 조회: 보유 종목 + 뉴스 관련 지표 + 공통 거시 지표를 테이블마다 한 번의 쿼리로 조회한 뒤 시장 데이터 분석 (종목별)
+## 5) 공통 거시 지표의 엔티티 분석: 보유 종목 전체에 대해 지표마다 한 번만 LLM을 호출하고, 결과를 종목별 보고서에 그대로 사용
+## 6) 최종 브리핑 (종목별 LLM 호출) - 끝나는 대로 on_holding_done으로 전달
+## 7) 공통 거시 지표와 보유 종목의 상관관계를 한 번 계산하여 포트폴리오 요약에 포함
+# 단계 사이에는 취소 토큰을 확인하고, 한 종목이 실패해도 나머지 종목은 계속 분석한다
+
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from .state import AnalysisState
+from .cancellation import AnalysisCancelled, CancelToken
+from .pipeline import StageAbort
+from .profiles import get_execution_profile
+from .prefetch import get_prefetched
+from .agents.data_prep_agent import run_data_prep
+from .agents.news_analyst_agent import run_news_analyst, search_relevant_news_rag_batch as search_us_news_candidates_batch
+from .agents.domestic_news_analyst_agent import run_domestic_news_analyst, search_relevant_news_rag_batch as search_domestic_news_candidates_batch
+from .agents.market_correlation_agent import run_market_correlation, get_stock_data_batch, get_correlation_text, price_window
+from .agents.report_synthesizer_agent import run_report_synthesizer, generate_shared_entity_analysis
+
+SHARED_MACRO_TICKERS = {"USDKRW=X": "달러/원 환율", "^KS11": "코스피 지수"} # 모든 보유 종목에 공통으로 분석하는 거시 지표
+SHARED_MACRO_RECENT_DAYS = 30 # 공통 지표 분석에 항상 포함하는 최근 거래일 수 (뉴스 블록에 지표가 없어도 분석할 수 있도록)
+
+# on_holding_done(티커, 최종 상태 또는 None, 오류 메시지 또는 None)
+HoldingDoneCallback = Callable[[str, Optional[AnalysisState], Optional[str]], None]
+
+#######################################################
+# 종목별 단계 실행
+
+def _initial_state(ticker: str, company_name: str, profile_name: str, cancel_token: Optional[CancelToken]) -> AnalysisState:
+    """app.py의 run_full_analysis_pipeline과 같은 초기 상태를 만듭니다."""
+    return {
+        "ticker": ticker,
+        "company_name": company_name,
+        "company_description": None,
+        "financial_health": None,
+        "selected_news": None,
+        "selected_domestic_news": None,
+        "market_analysis_result": None,
+        "final_report": None,
+        "historical_prices": None,
+        "news_event_markers": None,
+        "all_analyzed_tickers": None,
+        "all_us_news": [],
+        "all_domestic_news": [],
+        "us_market_entities": [],
+        "domestic_market_entities": [],
+        "execution_profile": profile_name,
+        "progressive_report": False,
+        "cancel_token": cancel_token,
+    }
+
+def _run_for_holdings(
+    states: Dict[str, AnalysisState],
+    errors: Dict[str, str],
+    stage: str,
+    runs: List[Callable[[AnalysisState], Dict[str, Any]]],
+    on_holding_done: HoldingDoneCallback,
+    on_result: Optional[Callable[[str], None]] = None,
+) -> None:
+    """
+    아직 실패하지 않은 종목마다 runs의 함수들을 실행하고 결과를 종목의 상태에 병합합니다.
+    포트폴리오 분석은 작업 대기열의 작업자 하나를 사용하므로, 단일 종목 분석과 같이 한 종목의 함수들만 동시에 실행하고 종목은 차례로 처리합니다.
+    실패한 종목은 errors에 기록하고 바로 on_holding_done으로 알리며, 이후 단계에서 제외합니다.
+    on_result(티커)는 종목의 모든 함수가 끝나면 호출됩니다.
+    """
+    active = [ticker for ticker in states if ticker not in errors]
+    remaining = {ticker: len(runs) for ticker in active}
+    with ThreadPoolExecutor(max_workers=len(runs), thread_name_prefix="portfolio") as pool:
+        # 같은 종목의 함수들이 동시에 실행되므로 상태는 복사해서 전달하고, 결과는 이 스레드에서만 병합
+        futures = {pool.submit(run, dict(states[ticker])): ticker for ticker in active for run in runs}
+        for future in as_completed(futures):
+            ticker = futures[future]
+            if ticker in errors:
+                continue
+            try:
+                states[ticker].update(future.result() or {})
+            except AnalysisCancelled:
+                raise
+            except Exception as e:
+                errors[ticker] = f"{stage} 단계 실패: {e}"
+                print(f"🚨 [Portfolio] '{ticker}' {errors[ticker]}")
+                on_holding_done(ticker, None, errors[ticker])
+                continue
+            remaining[ticker] -= 1
+            if remaining[ticker] == 0 and on_result:
+                on_result(ticker)
+
+def _data_prep(state: AnalysisState) -> Dict[str, Any]:
+    # 종목 선택 시 미리 실행해둔 결과가 있으면 사용
+    update = get_prefetched(state["ticker"], "data_prep") or run_data_prep(state)
+    if not update.get('company_name', state.get('company_name')):
+        raise StageAbort(f"'{state['ticker']}' 기업의 기본 정보(회사명)를 분석 중 잃었습니다.")
+    return update
+
+def _market_correlation(state: AnalysisState) -> Dict[str, Any]:
+    update = run_market_correlation(state)
+    # 단일 종목 분석과 같이 결과가 없으면 빈 사전으로 초기화
+    if update.get('market_analysis_result') is None:
+        update['market_analysis_result'] = {"news_impact_data": [], "historical_prices": {}, "all_analyzed_tickers": [], "correlation_matrix": {}}
+    return update
+
+#######################################################
+# 공유 작업
+
+def _search_news_candidates(states: Dict[str, AnalysisState], errors: Dict[str, str], profile_name: str) -> None:
+    """
+    모든 종목의 해외/국내 RAG 후보를 한 번의 행렬 연산으로 검색하여 종목별 상태에 넣습니다.
+    DB에 임베딩이 없는 기업은 단건 검색과 같이 빈 후보 목록을 받습니다.
+    """
+    candidate_count = get_execution_profile(profile_name)["news_selection"]["candidate_count"]
+    names = {ticker: state["company_name"] for ticker, state in states.items() if ticker not in errors}
+    for key, search in (("us_news_candidates", search_us_news_candidates_batch), ("domestic_news_candidates", search_domestic_news_candidates_batch)):
+        candidates = search(list(set(names.values())), top_k=candidate_count)
+        for ticker, name in names.items():
+            states[ticker][key] = candidates.get(name, [])
+
+def _load_prices(states: Dict[str, AnalysisState], errors: Dict[str, str]) -> Dict[str, pd.DataFrame]:
+    """
+    보유 종목, 선별된 뉴스의 관련 지표, 공통 거시 지표의 장기 가격을 한 번에 조회하여 종목별 상태에 넣습니다.
+    조회했지만 데이터가 없는 티커는 None으로 넣어 시장 데이터 분석 에이전트가 다시 조회하지 않게 합니다.
+    """
+    tickers: List[str] = list(SHARED_MACRO_TICKERS)
+    for ticker, state in states.items():
+        if ticker in errors:
+            continue
+        tickers.append(ticker)
+        for news in (state.get("selected_news") or []) + (state.get("selected_domestic_news") or []):
+            tickers += news.get("related_metrics", [])
+
+    prices = get_stock_data_batch(tickers, *price_window())
+    preloaded_prices = {ticker: prices.get(ticker) for ticker in tickers}
+    for ticker, state in states.items():
+        if ticker not in errors:
+            state["preloaded_prices"] = preloaded_prices # 읽기 전용으로 모든 종목이 공유
+    return prices
+
+def _recent_price_block(prices: Dict[str, pd.DataFrame], names: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """장기 가격의 최근 구간을 시장 데이터 분석 에이전트의 뉴스 블록과 같은 형식(뉴스 없음)으로 만듭니다."""
+    price_data_by_name: Dict[str, Any] = {}
+    dates: List[str] = []
+    for ticker, name in names.items():
+        df = prices.get(ticker)
+        if df is None or df.empty:
+            continue
+        recent = df.tail(SHARED_MACRO_RECENT_DAYS)
+        start_price, end_price = float(recent['close'].iloc[0]), float(recent['close'].iloc[-1])
+        change = (end_price - start_price) / start_price * 100 if start_price else 0.0
+        price_data_by_name[name] = {
+            "ticker": ticker,
+            "prices": [[str(date), close] for date, close in zip(recent['date'], recent['close'])],
+            "change_summary": f"최근 {len(recent)}거래일 동안 약 {abs(change):.2f}% {'상승' if change >= 0 else '하락'}했습니다.",
+        }
+        dates += [str(recent['date'].iloc[0]), str(recent['date'].iloc[-1])]
+    if not price_data_by_name:
+        return None
+    return {"news_titles": [], "start_date": min(dates), "end_date": max(dates), "price_data_by_name": price_data_by_name}
+
+def _analyze_shared_entities(
+    states: Dict[str, AnalysisState],
+    errors: Dict[str, str],
+    prices: Dict[str, pd.DataFrame],
+    profile_name: str,
+    cancel_token: Optional[CancelToken],
+) -> Dict[str, Dict[str, str]]:
+    """
+    공통 거시 지표마다 보유 종목 전체에 대한 엔티티 분석을 한 번만 생성하여 종목별 상태의 shared_entity_analysis에 넣습니다.
+    종목별 보고서 생성 에이전트는 이 지표들을 다시 분석하지 않으며, 분석에 실패한 지표는 종목별로 분석됩니다.
+    """
+    holdings = {ticker: state["company_name"] for ticker, state in states.items() if ticker not in errors}
+    news_impact_data = [
+        block
+        for ticker in holdings
+        for block in (states[ticker].get("market_analysis_result") or {}).get("news_impact_data", [])
+    ]
+    recent_block = _recent_price_block(prices, {**SHARED_MACRO_TICKERS, **holdings})
+    if recent_block:
+        news_impact_data.append(recent_block)
+
+    # 보고서 에이전트의 LLM 호출에는 실행 프로파일과 취소 토큰만 필요
+    llm_state: AnalysisState = {"execution_profile": profile_name, "cancel_token": cancel_token}
+    shared: Dict[str, Dict[str, str]] = {}
+    for macro_ticker, macro_name in SHARED_MACRO_TICKERS.items():
+        entity_key = f"{macro_name}({macro_ticker})"
+        analysis = generate_shared_entity_analysis(llm_state, entity_key, holdings, news_impact_data)
+        if analysis:
+            shared[entity_key] = analysis
+        else:
+            print(f"    -> 공통 지표 '{entity_key}' 분석에 실패하여 종목별로 분석합니다.")
+    for ticker in holdings:
+        states[ticker]["shared_entity_analysis"] = shared
+    return shared
+
+def _shared_macro_summary(prices: Dict[str, pd.DataFrame], holding_names: Dict[str, str], shared_analysis: Dict[str, Dict[str, str]]) -> Dict[str, Any]:
+    """공통 거시 지표와 각 보유 종목의 장기 가격 상관계수를 계산하고, 한 번 생성한 공통 엔티티 분석을 함께 담습니다."""
+    summary: Dict[str, Any] = {}
+    for macro_ticker, macro_name in SHARED_MACRO_TICKERS.items():
+        macro_df = prices.get(macro_ticker)
+        if macro_df is None or macro_df.empty:
+            print(f"    -> 공통 지표 '{macro_ticker}'의 시계열 데이터를 가져오지 못했습니다.")
+            continue
+        macro_series = macro_df.assign(date=pd.to_datetime(macro_df['date'])).set_index('date')['close'].rename(macro_ticker)
+
+        correlations: Dict[str, Optional[float]] = {}
+        texts: List[str] = []
+        for ticker, name in holding_names.items():
+            df = prices.get(ticker)
+            correlation = None
+            if df is not None and not df.empty:
+                series = df.assign(date=pd.to_datetime(df['date'])).set_index('date')['close'].rename(ticker)
+                df_pair = pd.concat([series, macro_series], axis=1).ffill().bfill()
+                value = df_pair[ticker].corr(df_pair[macro_ticker])
+                correlation = None if pd.isna(value) else round(float(value), 4)
+            correlations[ticker] = correlation
+            texts.append(get_correlation_text(name, macro_name, correlation))
+
+        summary[macro_ticker] = {
+            "name": macro_name,
+            "latest": {"date": macro_df['date'].iloc[-1], "value": float(macro_df['close'].iloc[-1])},
+            "correlations": correlations,
+            "correlation_summary": texts,
+            "analysis": shared_analysis.get(f"{macro_name}({macro_ticker})"),
+        }
+    return summary
+
+#######################################################
+# 실행
+
+def run_portfolio_analysis(
+    holdings: List[Dict[str, str]],
+    profile_name: str,
+    on_status: Callable[[str, int], None],
+    on_holding_done: HoldingDoneCallback,
+    cancel_token: Optional[CancelToken] = None,
+    phase_durations: Optional[Dict[str, float]] = None,
+) -> Dict[str, Any]:
+    """
+    보유 종목 전체를 분석합니다. holdings의 각 항목은 {"ticker", "company_name"(영문, 분석용), "name"(표시용)}입니다.
+    각 종목의 최종 브리핑이 끝나는 대로 on_holding_done(티커, 최종 상태, None)을, 실패하면 on_holding_done(티커, None, 오류)을 호출하고,
+    진행 상황은 on_status(메시지, 진행률)로 알립니다.
+    phase_durations가 주어지면 단계가 끝날 때마다 소요 시간을 기록하므로, 호출자는 종목 결과를 받을 때 그때까지의 단계별 소요 시간을 볼 수 있습니다.
+    반환값: {"shared_macro": 공통 거시 지표 요약, "phase_durations": 단계별 소요 시간, "failed": {티커: 오류}}
+    취소 토큰이 취소되면 AnalysisCancelled를 발생시킵니다.
+    """
+    states: Dict[str, AnalysisState] = {
+        holding["ticker"]: _initial_state(holding["ticker"], holding["company_name"], profile_name, cancel_token)
+        for holding in holdings
+    }
+    errors: Dict[str, str] = {}
+    phase_durations = {} if phase_durations is None else phase_durations
+
+    def run_phase(name: str, message: str, progress: int, run: Callable[[], Any]) -> Any:
+        if cancel_token:
+            cancel_token.raise_if_cancelled()
+        on_status(message, progress)
+        started = time.perf_counter()
+        result = run()
+        phase_durations[name] = time.perf_counter() - started
+        print(f"[Portfolio] {name} 단계 완료 ({phase_durations[name]:.1f}s)")
+        return result
+
+    count = len(states)
+    run_phase("data_prep", f"{count}개 보유 종목 데이터 준비 중...", 10,
+              lambda: _run_for_holdings(states, errors, "데이터 준비", [_data_prep], on_holding_done))
+    run_phase("news_candidates", "보유 종목 관련 뉴스 후보 일괄 검색 중...", 20,
+              lambda: _search_news_candidates(states, errors, profile_name))
+    run_phase("news", "보유 종목별 해외/국내 뉴스 분석 중...", 30,
+              lambda: _run_for_holdings(states, errors, "뉴스 분석", [run_news_analyst, run_domestic_news_analyst], on_holding_done))
+    prices = run_phase("prices", "보유 종목 및 공통 지표 가격 일괄 조회 중...", 50,
+                       lambda: _load_prices(states, errors))
+    run_phase("market_correlation", "보유 종목별 시장 데이터 분석 중...", 55,
+              lambda: _run_for_holdings(states, errors, "시장 데이터 분석", [_market_correlation], on_holding_done))
+    shared_analysis = run_phase("shared_entity_analysis", "공통 거시 지표(환율, 코스피) 분석 중...", 58,
+                                lambda: _analyze_shared_entities(states, errors, prices, profile_name, cancel_token))
+
+    def on_report(ticker: str) -> None:
+        if states[ticker].get("final_report"):
+            on_holding_done(ticker, states[ticker], None)
+        else:
+            errors[ticker] = "최종 보고서 생성 실패"
+            on_holding_done(ticker, None, errors[ticker])
+
+    run_phase("report_synthesizer", "보유 종목별 최종 투자 브리핑 생성 중...", 60,
+              lambda: _run_for_holdings(states, errors, "최종 투자 브리핑 생성", [run_report_synthesizer], on_holding_done, on_result=on_report))
+
+    holding_names = {holding["ticker"]: holding.get("name") or holding["company_name"] for holding in holdings}
+    shared_macro = run_phase("shared_macro", "포트폴리오 요약 생성 중...", 95,
+                             lambda: _shared_macro_summary(prices, holding_names, shared_analysis))
+    return {
+        "shared_macro": shared_macro,
+        "phase_durations": {name: round(sec, 2) for name, sec in phase_durations.items()},
+        "failed": errors,
+    }
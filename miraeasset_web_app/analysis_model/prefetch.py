@@ -0,0 +1,105 @@
+# analysis_model/prefetch.py
+# 종목 선택 시 LLM이 필요 없는 단계를 미리 실행해두는 추측 실행(speculative prefetch) 캐시
+# 사용자가 드롭다운에서 종목을 고르면 "분석 시작"을 누르기 전에 데이터 준비, 해외/국내 RAG 후보 검색,
+# 대상 종목의 가격 조회처럼 DB만 사용하는 작업을 백그라운드에서 실행하고 결과를 짧은 시간 동안 보관한다
+# 실제 파이프라인의 각 단계는 먼저 이 캐시를 확인하고, 없을 때만 직접 조회한다
+# 이 모듈은 에이전트를 import하지 않으며, 미리 실행할 작업은 호출 측(app.py)에서 전달한다
+
+import os
+import copy
+import time
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from cachetools import TTLCache
+
+PREFETCH_ENABLED = os.environ.get("ANALYSIS_PREFETCH", "on").lower() != "off"
+PREFETCH_TTL_SEC = int(os.environ.get("ANALYSIS_PREFETCH_TTL_SEC", "300")) # 미리 가져온 결과 유지 시간 (기본 5분)
+PREFETCH_MAX_SIZE = 256 # 최대 저장 개수 (종목 x 항목)
+PREFETCH_JOIN_TIMEOUT_SEC = 20 # 분석 시작 시 진행 중인 미리 가져오기를 기다리는 최대 시간
+
+_cache: TTLCache = TTLCache(maxsize=PREFETCH_MAX_SIZE, ttl=PREFETCH_TTL_SEC) # (티커, 항목 종류, 항목 파라미터) -> 결과
+_lock = threading.Lock()
+_in_flight: Dict[Tuple[str, Hashable], threading.Event] = {} # 미리 가져오기 중인 (티커, 변형) -> 완료 이벤트
+_stats = {"started": 0, "skipped": 0, "hits": 0, "misses": 0, "failures": 0}
+_local = threading.local() # 미리 가져오기 스레드 표시 (자기 자신의 완료를 기다리지 않도록)
+
+#######################################################
+# 저장 / 조회
+
+def store_prefetched(ticker: str, kind: str, value: Any, param: Hashable = None) -> None:
+    """미리 가져온 결과를 저장합니다. (None은 저장하지 않음)"""
+    if value is None:
+        return
+    with _lock:
+        _cache[(ticker, kind, param)] = value
+
+def get_prefetched(ticker: str, kind: str, param: Hashable = None) -> Optional[Any]:
+    """
+    미리 가져온 결과의 복사본을 반환합니다. (없거나 만료되었으면 None)
+    해당 티커를 미리 가져오는 중이면 (변형과 관계없이) PREFETCH_JOIN_TIMEOUT_SEC까지 끝나기를 기다린 뒤 확인합니다.
+    """
+    if not PREFETCH_ENABLED or getattr(_local, "prefetching", False):
+        return None
+    with _lock:
+        events = [event for (in_flight_ticker, _), event in _in_flight.items() if in_flight_ticker == ticker]
+    deadline = time.monotonic() + PREFETCH_JOIN_TIMEOUT_SEC
+    for event in events:
+        event.wait(timeout=max(0.0, deadline - time.monotonic()))
+    with _lock:
+        value = _cache.get((ticker, kind, param))
+        _stats["hits" if value is not None else "misses"] += 1
+    # 호출 측에서 결과를 수정해도 캐시가 바뀌지 않도록 복사
+    return copy.deepcopy(value) if value is not None else None
+
+#######################################################
+# 백그라운드 실행
+
+def start_prefetch(ticker: str, warm_up: Callable[[], None], variant: Hashable = None) -> str:
+    """
+    warm_up()을 백그라운드 스레드에서 실행합니다.
+    variant는 warm_up이 저장하는 결과를 구분하는 값(예: 실행 프로파일의 RAG 후보 수)이며,
+    같은 (티커, 변형)이 실행 중이거나 최근에 완료되었을 때만 건너뜁니다.
+    반환값: "started" / "in_progress"(이미 실행 중) / "cached"(최근에 완료됨) / "disabled"
+    """
+    if not PREFETCH_ENABLED:
+        return "disabled"
+    run_key = (ticker, variant)
+    with _lock:
+        if run_key in _in_flight:
+            _stats["skipped"] += 1
+            return "in_progress"
+        if _cache.get((ticker, "_complete", variant)):
+            _stats["skipped"] += 1
+            return "cached"
+        event = threading.Event()
+        _in_flight[run_key] = event
+        _stats["started"] += 1
+
+    def run() -> None:
+        _local.prefetching = True # warm_up 안에서 호출되는 get_prefetched는 캐시를 건너뛰고 직접 조회
+        try:
+            warm_up()
+            store_prefetched(ticker, "_complete", True, param=variant)
+            print(f"[Prefetch] '{ticker}' 미리 가져오기 완료")
+        except Exception as e:
+            # 미리 가져오기는 최적화일 뿐이므로 실패해도 실제 분석은 직접 조회한다
+            print(f"[Prefetch] '{ticker}' 미리 가져오기 실패: {e}")
+            with _lock:
+                _stats["failures"] += 1
+        finally:
+            with _lock:
+                _in_flight.pop(run_key, None)
+            event.set()
+
+    threading.Thread(target=run, daemon=True).start()
+    return "started"
+
+def get_prefetch_stats() -> Dict[str, Any]:
+    """미리 가져오기 실행/적중 횟수와 현재 저장 개수를 반환합니다."""
+    with _lock:
+        stats: Dict[str, Any] = dict(_stats)
+        stats["size"] = len(_cache)
+        stats["in_flight"] = [f"{ticker}:{variant}" if variant is not None else ticker for ticker, variant in _in_flight]
+    stats["enabled"] = PREFETCH_ENABLED
+    return stats
@@ -0,0 +1,111 @@
+# analysis_model/profiles.py
+# 분석 파이프라인 실행 프로파일
+# 단계별로 사용할 모델, 추론(thinking) 예산, 검색 도구, 후보 뉴스 수, 출력 길이를 묶어서 정의하고
+# 프로파일마다 목표 종단 지연시간(초)을 두어 파이프라인이 준수 여부를 기록하도록 한다
+
+from typing import Any, Dict, List, Optional, TypedDict
+
+
+class NewsSelectionSettings(TypedDict):
+    """뉴스 분석 에이전트(RAG + Gemini 선별) 설정"""
+    model: str # Gemini 모델명
+    thinking_budget: int # 추론 토큰 예산 (-1: 모델 자동, 0: 추론 끔)
+    use_grounding: bool # Google 검색 도구 사용 여부
+    candidate_count: int # RAG로 1차 추출할 후보 뉴스 수
+
+
+class ReportSettings(TypedDict):
+    """최종 보고서 생성 에이전트(Clova) 설정"""
+    max_tokens: int # Clova 호출 1회당 최대 출력 토큰
+    mode: Optional[str] # 엔티티 분석 실행 방식 ("per_entity" / "batched"), None이면 환경변수 기본값
+
+
+class ExecutionProfile(TypedDict):
+    """실행 프로파일 하나의 구조"""
+    label: str # UI 표시용 이름
+    target_latency_sec: float # 목표 종단 지연시간 (초)
+    news_selection: NewsSelectionSettings
+    report: ReportSettings
+
+
+EXECUTION_PROFILES: Dict[str, ExecutionProfile] = {
+    # 빠른 분석: 경량 모델, 추론 없음, 후보 축소, 엔티티 일괄 분석
+    "fast": {
+        "label": "빠른 분석",
+        "target_latency_sec": 45,
+        "news_selection": {
+            "model": "gemini-2.5-flash-lite",
+            "thinking_budget": 0,
+            "use_grounding": False,
+            "candidate_count": 10,
+        },
+        "report": {"max_tokens": 2048, "mode": "batched"},
+    },
+    # 기본 분석: 기존 파이프라인과 동일한 구성
+    "balanced": {
+        "label": "기본 분석",
+        "target_latency_sec": 120,
+        "news_selection": {
+            "model": "gemini-2.5-flash",
+            "thinking_budget": -1,
+            "use_grounding": True,
+            "candidate_count": 15,
+        },
+        "report": {"max_tokens": 4096, "mode": None},
+    },
+    # 심층 분석: 후보 확대, 엔티티 개별 분석
+    "deep": {
+        "label": "심층 분석",
+        "target_latency_sec": 240,
+        "news_selection": {
+            "model": "gemini-2.5-flash",
+            "thinking_budget": -1,
+            "use_grounding": True,
+            "candidate_count": 20,
+        },
+        "report": {"max_tokens": 4096, "mode": "per_entity"},
+    },
+}
+
+DEFAULT_EXECUTION_PROFILE = "balanced"
+
+
+def get_execution_profile(name: Optional[str]) -> ExecutionProfile:
+    """이름에 해당하는 실행 프로파일을 반환합니다. (없거나 잘못된 이름이면 기본 프로파일)"""
+    return EXECUTION_PROFILES.get(name or DEFAULT_EXECUTION_PROFILE, EXECUTION_PROFILES[DEFAULT_EXECUTION_PROFILE])
+
+
+def resolve_profile_name(name: Optional[str]) -> str:
+    """요청으로 받은 프로파일 이름을 검증하여, 사용할 프로파일 이름을 반환합니다."""
+    return name if name in EXECUTION_PROFILES else DEFAULT_EXECUTION_PROFILE
+
+
+def list_execution_profiles() -> List[Dict[str, Any]]:
+    """UI 선택 목록용 프로파일 요약을 반환합니다."""
+    return [
+        {
+            "name": name,
+            "label": profile["label"],
+            "target_latency_sec": profile["target_latency_sec"],
+            "is_default": name == DEFAULT_EXECUTION_PROFILE,
+        }
+        for name, profile in EXECUTION_PROFILES.items()
+    ]
+
+
+def evaluate_latency(profile_name: str, elapsed_sec: float, stage_durations: Dict[str, float]) -> Dict[str, Any]:
+    """
+    파이프라인 실행 시간을 프로파일의 목표 지연시간과 비교하여 로그를 남기고 결과를 반환합니다.
+    """
+    target = get_execution_profile(profile_name)["target_latency_sec"]
+    within_target = elapsed_sec <= target
+    stages_text = ", ".join(f"{stage} {sec:.1f}s" for stage, sec in stage_durations.items())
+    status = "목표 준수" if within_target else "목표 초과"
+    print(f"[실행 프로파일] '{profile_name}' {status}: {elapsed_sec:.1f}s / 목표 {target}s ({stages_text})")
+    return {
+        "name": profile_name,
+        "target_latency_sec": target,
+        "elapsed_sec": round(elapsed_sec, 2),
+        "within_target": within_target,
+        "stage_durations": {stage: round(sec, 2) for stage, sec in stage_durations.items()},
+    }
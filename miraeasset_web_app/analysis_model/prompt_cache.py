@@ -0,0 +1,143 @@
+# analysis_model/prompt_cache.py
+# Gemini 컨텍스트 캐싱(Context Caching)으로 고정 프롬프트 앞부분을 재사용하는 모듈
+# 뉴스 선별 프롬프트의 역할 설명, 지시사항, METRICS_MAP 기반 "US ENTITY LIST"는 요청마다 동일하므로
+# 공급자 측 캐시에 한 번 등록해두고, 요청마다 바뀌는 뒷부분(기업 정보, 후보 뉴스)만 전송한다
+# 검색 도구(Google Search grounding)는 캐시에 함께 등록한다 (캐시를 사용하는 요청에는 도구를 따로 지정할 수 없음)
+# 캐시를 만들 수 없거나 캐시로 호출이 실패하면 전체 프롬프트를 그대로 보내는 방식으로 대체한다
+
+import os
+import time
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from google import genai
+from google.genai import types
+
+from .llm_ledger import record_llm_call
+from .cancellation import AnalysisCancelled, CancelToken
+
+PROMPT_CACHE_TTL_SEC = int(os.environ.get("GEMINI_PROMPT_CACHE_TTL_SEC", "3600")) # 캐시 유지 시간 (기본 1시간)
+PROMPT_CACHE_REFRESH_MARGIN_SEC = 60 # 만료 이 시간 전부터는 새 캐시를 만든다
+PROMPT_CACHE_RETRY_SEC = 600 # 캐시 생성 실패 후 다시 시도하기까지의 대기 시간
+PROMPT_CACHE_ENABLED = os.environ.get("GEMINI_PROMPT_CACHE", "on").lower() != "off"
+
+_lock = threading.Lock()
+_handles: Dict[Tuple[str, str], Tuple[str, float]] = {} # (모델, 앞부분+도구 해시) -> (캐시 이름, 만료 시각)
+_unavailable_until: Dict[Tuple[str, str], float] = {} # 캐시 생성에 실패한 키 -> 재시도 가능 시각
+
+#######################################################
+# 캐시 핸들 관리
+
+def _prefix_key(model: str, prefix_text: str, tools: Optional[List[types.Tool]] = None) -> Tuple[str, str]:
+    # 같은 앞부분이라도 도구 구성이 다르면 다른 캐시를 사용한다
+    tools_text = "".join(tool.model_dump_json(exclude_none=True) for tool in tools or [])
+    return (model, hashlib.sha256((prefix_text + tools_text).encode("utf-8")).hexdigest()[:16])
+
+def get_prefix_cache(client: genai.Client, model: str, prefix_text: str, display_name: str, tools: Optional[List[types.Tool]] = None) -> Optional[str]:
+    """
+    고정 프롬프트 앞부분(과 도구)의 캐시 이름을 반환합니다.
+    캐시가 없거나 곧 만료되면 새로 만들고, 만들 수 없으면 None을 반환합니다. (일반 프롬프트로 대체)
+    """
+    if not PROMPT_CACHE_ENABLED:
+        return None
+    key = _prefix_key(model, prefix_text, tools)
+    now = time.time()
+    with _lock:
+        handle = _handles.get(key)
+        if handle and handle[1] - PROMPT_CACHE_REFRESH_MARGIN_SEC > now:
+            return handle[0]
+        if _unavailable_until.get(key, 0) > now:
+            return None
+
+    try:
+        cached = client.caches.create(
+            model=model,
+            config=types.CreateCachedContentConfig(
+                display_name=display_name,
+                contents=[types.Content(role="user", parts=[types.Part.from_text(text=prefix_text)])],
+                tools=tools or None,
+                ttl=f"{PROMPT_CACHE_TTL_SEC}s",
+            ),
+        )
+    except Exception as e:
+        # 최소 토큰 수 미달, 모델 미지원, 권한 문제 등 - 한동안 캐시 없이 호출한다
+        print(f"[Prompt Cache] '{display_name}' 캐시 생성 실패, 일반 프롬프트로 호출합니다. ({e})")
+        with _lock:
+            _unavailable_until[key] = now + PROMPT_CACHE_RETRY_SEC
+        return None
+
+    expire_at = cached.expire_time.timestamp() if cached.expire_time else now + PROMPT_CACHE_TTL_SEC
+    with _lock:
+        _handles[key] = (cached.name, expire_at)
+    print(f"[Prompt Cache] '{display_name}' 고정 프롬프트 캐시를 등록했습니다. ({cached.name})")
+    return cached.name
+
+def invalidate_prefix_cache(cache_name: str) -> None:
+    """호출에 실패한 캐시 핸들을 버려서, 다음 요청에서 새로 만들도록 합니다."""
+    with _lock:
+        for key in [k for k, (name, _) in _handles.items() if name == cache_name]:
+            del _handles[key]
+
+#######################################################
+# 캐시를 사용한 스트리밍 호출
+
+def _stream_text(client: genai.Client, model: str, text: str, config: types.GenerateContentConfig, stage: str, cancel_token: Optional[CancelToken] = None) -> str:
+    """Gemini 스트리밍 응답을 하나의 문자열로 합치고, 호출 결과를 LLM 장부에 기록합니다. (분석이 취소되면 AnalysisCancelled)"""
+    started = time.perf_counter()
+    usage = None
+    try:
+        response_stream = client.models.generate_content_stream(
+            model=model,
+            contents=[types.Content(role="user", parts=[types.Part.from_text(text=text)])],
+            config=config,
+        )
+        response_text = ""
+        for chunk in response_stream:
+            if cancel_token and cancel_token.is_cancelled():
+                record_llm_call("gemini", model, stage, latency_sec=time.perf_counter() - started, outcome="cancelled")
+                cancel_token.raise_if_cancelled()
+            usage = chunk.usage_metadata or usage
+            response_text += chunk.text or ""
+    except AnalysisCancelled:
+        raise
+    except Exception:
+        record_llm_call("gemini", model, stage, latency_sec=time.perf_counter() - started, outcome="error")
+        raise
+    record_llm_call(
+        "gemini", model, stage,
+        prompt_tokens=usage.prompt_token_count if usage else None,
+        completion_tokens=usage.candidates_token_count if usage else None,
+        cached_tokens=usage.cached_content_token_count if usage else None,
+        latency_sec=time.perf_counter() - started,
+    )
+    return response_text
+
+def generate_with_prefix_cache(
+    client: genai.Client,
+    model: str,
+    prefix_text: str,
+    tail_text: str,
+    config: types.GenerateContentConfig,
+    display_name: str,
+    cancel_token: Optional[CancelToken] = None,
+) -> str:
+    """
+    고정 앞부분(prefix_text)은 캐시로, 뒷부분(tail_text)만 전송하여 응답 텍스트를 반환합니다.
+    config의 도구(tools)는 캐시에 함께 등록하고, 캐시를 사용하는 요청에서는 도구를 빼고 보냅니다.
+    캐시로 호출이 실패하면(만료, 삭제 등) 캐시를 버리고 전체 프롬프트로 한 번 더 호출합니다.
+    cancel_token이 취소되면 호출하지 않거나 스트리밍을 중단하고 AnalysisCancelled를 발생시킵니다.
+    """
+    if cancel_token:
+        cancel_token.raise_if_cancelled()
+    cache_name = get_prefix_cache(client, model, prefix_text, display_name, config.tools)
+    if cache_name:
+        try:
+            cached_config = config.model_copy(update={"cached_content": cache_name, "tools": None})
+            return _stream_text(client, model, tail_text, cached_config, display_name, cancel_token)
+        except AnalysisCancelled:
+            raise
+        except Exception as e:
+            print(f"[Prompt Cache] 캐시({cache_name})로 호출 실패, 전체 프롬프트로 다시 호출합니다. ({e})")
+            invalidate_prefix_cache(cache_name)
+    return _stream_text(client, model, prefix_text + tail_text, config, display_name, cancel_token)
@@ -0,0 +1,208 @@
+# analysis_model/result_cache.py
+# 완료된 분석 결과('analysis_complete' 데이터)를 재사용하는 캐시
+# 키는 (티커, 실행 프로파일, 데이터 버전)이며, 데이터 버전은 뉴스/가격 테이블의 최신 시점(워터마크)으로 만든다
+# 스크래퍼나 가격 수집으로 새 데이터가 들어오면 데이터 버전이 바뀌므로 이전 결과는 자동으로 무효가 된다
+# 메모리(LRU)를 먼저 확인하고, ANALYSIS_RESULT_CACHE_DIR가 설정되어 있으면 디스크(JSON 파일)도 확인한다
+# ANALYSIS_RESULT_TABLE이 설정되어 있으면 Supabase 테이블도 확인하므로, 다른 곳(batch_reports.py)에서 미리 만든 보고서를 서버가 사용할 수 있다
+## 테이블 형식: ticker text, profile text, data_version text, payload jsonb, updated_at timestamptz (ticker, profile이 기본 키)
+
+import os
+import re
+import json
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+from cachetools import LRUCache
+
+RESULT_CACHE_ENABLED = os.environ.get("ANALYSIS_RESULT_CACHE", "on").lower() != "off"
+RESULT_CACHE_MAX_SIZE = int(os.environ.get("ANALYSIS_RESULT_CACHE_SIZE", "64")) # 메모리에 보관할 최대 결과 수
+RESULT_CACHE_DIR = os.environ.get("ANALYSIS_RESULT_CACHE_DIR", "") # 비어 있으면 디스크 저장을 사용하지 않음
+RESULT_CACHE_TABLE = os.environ.get("ANALYSIS_RESULT_TABLE", "") # 비어 있으면 Supabase 테이블 저장을 사용하지 않음
+
+_cache: LRUCache = LRUCache(maxsize=RESULT_CACHE_MAX_SIZE) # (티커, 프로파일) -> (데이터 버전, 결과)
+_lock = threading.Lock()
+_stats = {"memory_hits": 0, "disk_hits": 0, "table_hits": 0, "misses": 0, "stale": 0, "stores": 0}
+_table_client = None # 테이블 저장에 사용할 Supabase 클라이언트 (use_supabase_table로 지정)
+
+#######################################################
+# 데이터 버전
+
+def make_data_version(watermarks: Dict[str, Any]) -> str:
+    """테이블별 최신 시점(워터마크)을 하나의 데이터 버전 문자열로 만듭니다."""
+    encoded = json.dumps(watermarks, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:16]
+
+def fetch_data_version(supabase_client: Any, ticker: str) -> Optional[str]:
+    """
+    분석에 쓰이는 테이블의 최신 시점(워터마크)으로 데이터 버전을 만듭니다.
+    - 해외/국내 뉴스 요약: 가장 최근 publish_date와 전체 행 수 (같은 날짜에 추가된 뉴스도 반영)
+    - 대상 종목 가격, 주요지표: 가장 최근 날짜
+    스크래퍼나 가격 수집으로 새 데이터가 들어오면 값이 바뀌어 저장된 분석 결과가 무효가 됩니다.
+    DB에 연결할 수 없거나 조회에 실패하면 None을 반환합니다. (캐시를 사용하지 않음)
+    """
+    if supabase_client is None:
+        return None
+
+    price_table = "korean_stocks" if ticker.endswith('.KS') or ticker.endswith('.KQ') else "us_stocks"
+    try:
+        watermarks: Dict[str, Any] = {}
+        for news_table in ("financial_news_summary", "ko_financial_news_summary"):
+            res = supabase_client.table(news_table).select("publish_date", count="exact").order("publish_date", desc=True).limit(1).execute()
+            watermarks[news_table] = [res.data[0]["publish_date"] if res.data else None, res.count]
+        res = supabase_client.table(price_table).select("time").eq("ticker", ticker).order("time", desc=True).limit(1).execute()
+        watermarks[price_table] = res.data[0]["time"] if res.data else None
+        res = supabase_client.table("financial_indices").select("date").order("date", desc=True).limit(1).execute()
+        watermarks["financial_indices"] = res.data[0]["date"] if res.data else None
+    except Exception as e:
+        print(f"[Result Cache] 데이터 버전 조회 실패: {e}")
+        return None
+    return make_data_version(watermarks)
+
+#######################################################
+# 저장하는 결과 형식 ('analysis_complete' 이벤트 데이터)
+
+def build_result_payload(state: Dict[str, Any], portfolio_summary: Dict[str, Any], execution_profile: Dict[str, Any]) -> Dict[str, Any]:
+    """파이프라인의 최종 상태에서 프론트엔드에 전달할 분석 결과를 만듭니다."""
+    # market_analysis_result에서 correlation_matrix 추출
+    #### 이젠 사용하지 않음
+    market_analysis_result = state.get("market_analysis_result") or {}
+    return {
+        'report': state.get("final_report"),
+        'portfolio_summary': portfolio_summary,
+        'selected_news': state.get("selected_news", []),
+        'selected_domestic_news': state.get("selected_domestic_news", []),
+        'historical_prices': state.get("historical_prices", {}), # 장기 데이터
+        'short_term_prices': state.get("short_term_prices", {}), # 단기 데이터
+        'news_event_markers': state.get("news_event_markers", {}), # 기업, 지표명
+        'all_analyzed_tickers': state.get("all_analyzed_tickers", []), # 티커 목록
+        'correlation_matrix': market_analysis_result.get("correlation_matrix", {}),
+        'ko_company_description': state.get("ko_company_description", "기업 설명 정보를 불러오지 못했습니다."), # 국문 기업 설명문 (최종보고서용)
+        'execution_profile': execution_profile, # 실행 프로파일 및 지연시간
+        'message': '분석 완료!'
+    }
+
+#######################################################
+# 디스크 저장소
+
+def _disk_path(ticker: str, profile_name: str) -> Optional[str]:
+    """(티커, 프로파일)의 결과 파일 경로를 반환합니다. (디스크 저장을 사용하지 않으면 None)"""
+    if not RESULT_CACHE_DIR:
+        return None
+    safe_ticker = re.sub(r"[^A-Za-z0-9._-]", "_", ticker)
+    return os.path.join(RESULT_CACHE_DIR, f"{safe_ticker}__{profile_name}.json")
+
+def _read_disk(ticker: str, profile_name: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    path = _disk_path(ticker, profile_name)
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            entry = json.load(f)
+        return entry["data_version"], entry["payload"]
+    except (OSError, json.JSONDecodeError, KeyError) as e:
+        print(f"[Result Cache] '{path}' 읽기 실패: {e}")
+        return None
+
+def _write_disk(ticker: str, profile_name: str, data_version: str, payload: Dict[str, Any]) -> None:
+    path = _disk_path(ticker, profile_name)
+    if not path:
+        return
+    try:
+        os.makedirs(RESULT_CACHE_DIR, exist_ok=True)
+        # 임시 파일에 쓴 뒤 교체하여, 다른 프로세스가 쓰다 만 파일을 읽지 않도록 함
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"data_version": data_version, "payload": payload}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    except (OSError, TypeError, ValueError) as e:
+        print(f"[Result Cache] '{path}' 저장 실패: {e}")
+
+#######################################################
+# Supabase 테이블 저장소
+
+def use_supabase_table(supabase_client: Any) -> None:
+    """ANALYSIS_RESULT_TABLE 테이블 저장에 사용할 Supabase 클라이언트를 지정합니다."""
+    global _table_client
+    _table_client = supabase_client
+
+def _read_table(ticker: str, profile_name: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+    if not RESULT_CACHE_TABLE or _table_client is None:
+        return None
+    try:
+        res = _table_client.table(RESULT_CACHE_TABLE).select("data_version, payload").eq("ticker", ticker).eq("profile", profile_name).limit(1).execute()
+    except Exception as e:
+        print(f"[Result Cache] '{RESULT_CACHE_TABLE}' 테이블 조회 실패: {e}")
+        return None
+    if not res.data:
+        return None
+    return res.data[0]["data_version"], res.data[0]["payload"]
+
+def _write_table(ticker: str, profile_name: str, data_version: str, payload: Dict[str, Any]) -> None:
+    if not RESULT_CACHE_TABLE or _table_client is None:
+        return
+    try:
+        _table_client.table(RESULT_CACHE_TABLE).upsert({
+            "ticker": ticker,
+            "profile": profile_name,
+            "data_version": data_version,
+            "payload": payload,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }, on_conflict="ticker,profile").execute()
+    except Exception as e:
+        print(f"[Result Cache] '{RESULT_CACHE_TABLE}' 테이블 저장 실패: {e}")
+
+#######################################################
+# 조회 / 저장
+
+def get_cached_result(ticker: str, profile_name: str, data_version: str) -> Optional[Dict[str, Any]]:
+    """
+    같은 데이터 버전으로 완료된 분석 결과가 있으면 반환합니다. (없으면 None)
+    (티커, 프로파일)마다 가장 최근 결과 하나만 보관하므로, 데이터 버전이 다르면 오래된 결과로 보고 버립니다.
+    """
+    if not RESULT_CACHE_ENABLED:
+        return None
+    key = (ticker, profile_name)
+    with _lock:
+        entry = _cache.get(key)
+        if entry is not None and entry[0] == data_version:
+            _stats["memory_hits"] += 1
+            return entry[1]
+
+    stale = False
+    for tier, read in (("disk_hits", _read_disk), ("table_hits", _read_table)):
+        entry = read(ticker, profile_name)
+        if entry is not None and entry[0] == data_version:
+            with _lock:
+                _cache[key] = entry # 디스크/테이블에서 찾은 결과는 메모리에도 올려둠
+                _stats[tier] += 1
+            return entry[1]
+        stale = stale or entry is not None
+
+    with _lock:
+        if stale or key in _cache:
+            _cache.pop(key, None)
+            _stats["stale"] += 1
+        _stats["misses"] += 1
+    return None
+
+def store_result(ticker: str, profile_name: str, data_version: str, payload: Dict[str, Any]) -> None:
+    """완료된 분석 결과를 데이터 버전과 함께 저장합니다. (같은 티커/프로파일의 이전 결과는 덮어씀)"""
+    if not RESULT_CACHE_ENABLED:
+        return
+    with _lock:
+        _cache[(ticker, profile_name)] = (data_version, payload)
+        _stats["stores"] += 1
+    _write_disk(ticker, profile_name, data_version, payload)
+    _write_table(ticker, profile_name, data_version, payload)
+
+def get_result_cache_stats() -> Dict[str, Any]:
+    """분석 결과 캐시의 적중(메모리/디스크)/미스/무효화 횟수와 현재 저장 개수를 반환합니다."""
+    with _lock:
+        stats: Dict[str, Any] = dict(_stats)
+        stats["size"] = len(_cache)
+    stats["enabled"] = RESULT_CACHE_ENABLED
+    stats["disk_dir"] = RESULT_CACHE_DIR or None
+    stats["table"] = RESULT_CACHE_TABLE if _table_client is not None else None
+    return stats
@@ -6,6 +6,8 @@
 from __future__ import annotations
 from typing import TypedDict, List, Dict, Any, Optional
 
+from .cancellation import CancelToken
+
 # 아래의 class는 데이터를 어떻게 구성해야하는지에 대한 설계도이다.
 class SelectedNews(TypedDict):
     """뉴스 분석 에이전트가 선별한 개별 뉴스 정보를 담는 구조"""
@@ -87,6 +89,16 @@ class AnalysisState(TypedDict):
     selected_domestic_news: List[DomesticNews] | None # 선택된 국내 뉴스
     market_analysis_result: MarketAnalysisResult | None # 주식 상관관계와 주가 데이터
     final_report: FinalReport | None # 최종 분석 보고서
+    report_mode: Optional[str] # 엔티티 분석 실행 방식 ("per_entity" / "batched"), 없으면 환경변수 기본값 사용
+    execution_profile: Optional[str] # 실행 프로파일 이름 ("fast" / "balanced" / "deep"), profiles.py 참고
+    progressive_report: bool # 점진적 보고서 모드 (초안을 먼저 보내고 최종 보고서로 대체)
+    cancel_token: Optional[CancelToken] # 분석 취소 토큰 (요청한 클라이언트가 모두 연결을 끊으면 취소됨), cancellation.py 참고
+
+    # 포트폴리오 일괄 분석에서 여러 종목을 한 번에 처리한 결과 (portfolio_analysis.py 참고, 없으면 에이전트가 직접 조회)
+    us_news_candidates: Optional[List[Dict[str, Any]]] # 해외 뉴스 RAG 후보
+    domestic_news_candidates: Optional[List[Dict[str, Any]]] # 국내 뉴스 RAG 후보
+    preloaded_prices: Optional[Dict[str, Any]] # 장기(2년) 가격 {티커: 데이터프레임 또는 None(데이터 없음)}
+    shared_entity_analysis: Optional[Dict[str, Dict[str, str]]] # 공통 거시 지표의 엔티티 분석 {엔티티 키: {"내용", "주가_반응"}}, 모든 종목이 같은 결과 사용
 
     # 그래프 시각화를 위해 추가된 필드
     historical_prices: Optional[Dict[str, List[Dict[str, Any]]]] # 티커별 {'date': 'YYYY-MM-DD', 'close': float} 리스트
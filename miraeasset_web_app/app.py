@@ -2,11 +2,12 @@ import os
 import json
 from dotenv import load_dotenv
 from flask import Flask, render_template, request, jsonify, current_app
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms
 import sys
 import threading
+import itertools
 import time
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
 
 # 프로젝트 루트를 Python Path에 추가
 # analysis_model의 함수들을 모듈로 임포트.
@@ -19,10 +20,22 @@ load_dotenv()
 # analysis_model의 AI 에이전트 함수들을 불러온다
 from analysis_model.state import AnalysisState, MarketAnalysisResult
 from analysis_model.agents.data_prep_agent import run_data_prep
-from analysis_model.agents.news_analyst_agent import run_news_analyst
-from analysis_model.agents.domestic_news_analyst_agent import run_domestic_news_analyst
-from analysis_model.agents.market_correlation_agent import run_market_correlation
-from analysis_model.agents.report_synthesizer_agent import run_report_synthesizer
+from analysis_model.agents.news_analyst_agent import run_news_analyst, search_relevant_news_rag as search_us_news_candidates
+from analysis_model.agents.domestic_news_analyst_agent import run_domestic_news_analyst, search_relevant_news_rag as search_domestic_news_candidates
+from analysis_model.agents.market_correlation_agent import run_market_correlation, get_stock_data_from_supabase, price_window
+from analysis_model.agents.report_synthesizer_agent import run_report_synthesizer, build_draft_report
+from analysis_model.llm_output import get_output_stats
+from analysis_model.profiles import list_execution_profiles, resolve_profile_name, evaluate_latency, get_execution_profile
+from analysis_model.entity_memo import get_entity_memo_stats
+from analysis_model.hedging import get_hedging_stats
+from analysis_model.llm_ledger import get_daily_usage
+from analysis_model.pipeline import PipelineStage, StageAbort, run_stage_graph, restorable_stages
+from analysis_model.prefetch import start_prefetch, store_prefetched, get_prefetched, get_prefetch_stats
+from analysis_model.result_cache import fetch_data_version, build_result_payload, get_cached_result, store_result, get_result_cache_stats, use_supabase_table
+from analysis_model.job_queue import submit_job, get_job_queue_stats
+from analysis_model.checkpoints import save_checkpoint, load_checkpoints, clear_checkpoints, get_checkpoint_stats
+from analysis_model.cancellation import CancelToken, AnalysisCancelled
+from analysis_model.portfolio_analysis import run_portfolio_analysis
 
 
 # Flask 애플리케이션 및 SocketIO 초기화
@@ -67,6 +80,7 @@ else:
     try:
         supabase_client_global: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
         print("Supabase client initialized for app.py.")
+        use_supabase_table(supabase_client_global) # ANALYSIS_RESULT_TABLE이 설정되어 있으면 미리 만든 보고서 조회
 
         # 기업건전성 보고서가 있는 기업만 조회 (존재하는 기업만 분석을 가능하게하기 위함)
         def _initialize_financial_statement_cache():
@@ -284,6 +298,10 @@ def index():
 @app.route('/portfolio_summary', methods=['GET'])
 def get_full_portfolio_summary():
     """모든 보유 주식의 현재가 및 손익을 계산하여 반환합니다."""
+    return jsonify(_build_portfolio_overview())
+
+def _build_portfolio_overview() -> Dict[str, Any]:
+    """보유 주식별 현재가/손익과 포트폴리오 전체 손익을 계산합니다. (포트폴리오 전체 분석의 요약에도 사용)"""
     full_summary = []
     total_purchase_value = 0
     total_current_value = 0
@@ -324,7 +342,7 @@ def get_full_portfolio_summary():
     total_profit_loss_percentage = (total_profit_loss / total_purchase_value) * 100 if total_purchase_value != 0 else 0
 
     # 계산한 포트폴리오 정보를 반환
-    return jsonify({
+    return {
         "stocks": full_summary,
         "total_portfolio_summary": {
             "total_purchase_value": round(total_purchase_value, 2),
@@ -332,7 +350,7 @@ def get_full_portfolio_summary():
             "total_profit_loss": round(total_profit_loss, 2),
             "total_profit_loss_percentage": round(total_profit_loss_percentage, 2)
         }
-    })
+    }
 
 # 기업, 주요지표 요약문 조회 (한글번역본)
 @app.route('/stock_info/<ticker>', methods=['GET'])
@@ -395,6 +413,76 @@ def get_analyzable_stocks_list():
     """
     return jsonify(_financial_statement_companies) # 이미 캐시된 리스트 반환
 
+## LLM 구조화 출력 집계 조회 (단계별 파싱 실패율, 비상 모드 비율)
+@app.route('/llm_output_stats', methods=['GET'])
+def get_llm_output_stats():
+    """각 LLM 호출 단계의 JSON 파싱 실패 및 비상 모드(fallback) 발생 횟수를 반환합니다."""
+    return jsonify(get_output_stats())
+
+## 엔티티 분석 메모 캐시 조회 (적중률, 저장 개수)
+@app.route('/entity_memo_stats', methods=['GET'])
+def get_entity_memo_stats_route():
+    """엔티티 분석 메모 캐시의 적중/미스 횟수와 현재 저장 개수를 반환합니다."""
+    return jsonify(get_entity_memo_stats())
+
+## LLM 헤징 현황 조회 (헤징 발생 횟수, 공급자별 첫 토큰 지연시간)
+@app.route('/hedging_stats', methods=['GET'])
+def get_hedging_stats_route():
+    """보고서 생성 호출의 헤징 발생/보조 공급자 승리 횟수와 공급자별 첫 토큰 p50/p95를 반환합니다."""
+    return jsonify(get_hedging_stats())
+
+## LLM 호출 장부 조회 (일별 토큰/지연시간 집계, 남은 일일 할당량 추정)
+@app.route('/llm_ledger', methods=['GET'])
+def get_llm_ledger():
+    """최근 n일(기본 7일)의 LLM 호출 일별 집계와 공급자/모델별 남은 할당량 추정치를 반환합니다."""
+    days = request.args.get('days', default=7, type=int)
+    return jsonify(get_daily_usage(max(1, min(days, 90))))
+
+## 종목 선택 시 DB 조회 단계 미리 실행 (데이터 준비, 해외/국내 RAG 후보 검색, 가격 조회)
+@app.route('/prefetch/<ticker>', methods=['POST'])
+def prefetch_ticker(ticker: str):
+    """
+    드롭다운에서 종목이 선택되면 '분석 시작' 전에 LLM이 필요 없는 단계를 백그라운드에서 실행합니다.
+    결과는 잠시 보관되며, 분석 파이프라인의 각 단계가 직접 조회하는 대신 사용합니다.
+    """
+    if ticker not in _financial_statement_tickers_set:
+        return jsonify({"status": "unsupported"}), 404
+    profile_name = resolve_profile_name(request.args.get('profile'))
+    # RAG 후보는 프로파일의 후보 수마다 따로 저장되므로, 후보 수가 다른 프로파일을 선택하면 다시 미리 가져온다
+    candidate_count = get_execution_profile(profile_name)["news_selection"]["candidate_count"]
+    status = start_prefetch(ticker, lambda: _warm_up_ticker(ticker, profile_name), variant=candidate_count)
+    return jsonify({"status": status}), 202 if status == "started" else 200
+
+## 미리 가져오기 현황 조회 (실행/적중 횟수, 저장 개수)
+@app.route('/prefetch_stats', methods=['GET'])
+def get_prefetch_stats_route():
+    """종목 선택 시 미리 가져오기의 실행/건너뜀/실패 횟수와 분석 단계의 적중/미스 횟수를 반환합니다."""
+    return jsonify(get_prefetch_stats())
+
+## 분석 결과 캐시 조회 (메모리/디스크 적중, 데이터 버전 변경으로 인한 무효화 횟수)
+@app.route('/result_cache_stats', methods=['GET'])
+def get_result_cache_stats_route():
+    """완료된 분석 결과 캐시의 적중/미스/무효화 횟수와 현재 저장 개수를 반환합니다."""
+    return jsonify(get_result_cache_stats())
+
+## 분석 작업 대기열 조회 (실행/대기 중인 분석, 평균 분석 시간, 거절 횟수)
+@app.route('/analysis_queue_stats', methods=['GET'])
+def get_analysis_queue_stats_route():
+    """분석 작업자 수, 실행/대기 중인 분석, 평균 분석 시간과 처리/거절 횟수를 반환합니다."""
+    return jsonify(get_job_queue_stats())
+
+## 분석 단계 체크포인트 조회 (저장/복원 횟수)
+@app.route('/checkpoint_stats', methods=['GET'])
+def get_checkpoint_stats_route():
+    """실패한 분석을 이어서 실행하기 위한 단계별 체크포인트의 저장/복원 횟수와 보관 중인 분석 수를 반환합니다."""
+    return jsonify(get_checkpoint_stats())
+
+## 실행 프로파일 목록 조회 (분석 속도/깊이 선택 드롭다운을 채우는 데 사용)
+@app.route('/execution_profiles', methods=['GET'])
+def get_execution_profiles():
+    """선택 가능한 실행 프로파일 목록(이름, 표시명, 목표 지연시간)을 반환합니다."""
+    return jsonify(list_execution_profiles())
+
 #######################################################################
 # SocketIO 이벤트 핸들러 설정
 
@@ -408,19 +496,46 @@ def test_connect():
 @socketio.on('disconnect') #연결 끊음
 def test_disconnect():
     print('Client disconnected')
+    # 결과를 받을 클라이언트가 더 없으면 진행 중인 분석을 취소하여 LLM 할당량과 작업자를 반환
+    with _running_analyses_lock:
+        _unsubscribe_client(request.sid, "클라이언트 연결 종료")
+
+## 진행 중인 분석 목록 (같은 종목/프로파일 요청은 새로 실행하지 않고 진행 중인 분석의 room에 합류)
+_running_analyses: Dict[str, Dict[str, Any]] = {} # 분석 room 이름 -> {"clients": 결과를 받을 클라이언트 sid 집합, "cancel_token": 취소 토큰}
+_client_rooms: Dict[str, str] = {} # 클라이언트 sid -> 구독 중인 분석 room
+_running_analyses_lock = threading.Lock()
+_analysis_job_ids = itertools.count(1) # 작업 대기열의 작업 이름 (취소된 분석과 같은 room의 새 분석을 구분)
+
+def _unsubscribe_client(sid: str, reason: str) -> None:
+    """
+    클라이언트의 분석 구독을 해제하고, 남은 구독자가 없으면 분석을 취소합니다. (_running_analyses_lock을 잡은 상태에서 호출)
+    취소된 분석은 목록에서 바로 빼므로, 같은 종목을 다시 요청하면 멈추는 중인 분석에 합류하지 않고 새로 시작합니다.
+    """
+    room = _client_rooms.pop(sid, None)
+    record = _running_analyses.get(room) if room else None
+    if record is None:
+        return
+    record["clients"].discard(sid)
+    if not record["clients"]:
+        _running_analyses.pop(room, None)
+        record["cancel_token"].cancel(reason)
+        print(f"[백엔드] '{room}' 분석을 받을 클라이언트가 없어 취소합니다. ({reason})")
 
 @socketio.on('start_analysis_request') # 프론트엔드에서 분석 시작 요청을 받음
 def handle_start_analysis_request(data):
     """
     클라이언트(웹 브라우저)로부터 'start_analysis_request' 이벤트를 수신합니다.
     이 이벤트는 사용자가 '분석 시작' 버튼을 클릭했을 때 발생합니다.
+    같은 종목을 같은 실행 프로파일로 분석 중이면 새 분석을 시작하지 않고, 진행 중인 분석의 진행 상황과 결과를 함께 받습니다.
     """
     ticker = data.get('ticker') # 티커를 기준으로 분석 시작
     if not ticker:
         emit('status_update', {'message': '오류: 티커가 필요합니다.', 'progress': -1})
         return
+    profile_name = resolve_profile_name(data.get('profile')) # 실행 프로파일 (없거나 잘못되면 기본값)
+    progressive = bool(data.get('progressive', False)) # 점진적 보고서 모드 (초안 먼저 전달)
 
-    print(f"웹 요청: '{ticker}' 기업에 대한 전체 분석 파이프라인을 시작합니다.")
+    print(f"웹 요청: '{ticker}' 기업에 대한 전체 분석 파이프라인을 시작합니다. (실행 프로파일: {profile_name})")
     
     # Flask 애플리케이션 컨텍스트를 수동으로 활성화하여 백그라운드 스레드에서 Flask 기능을 사용할 수 있게 함
     with app.app_context():
@@ -432,15 +547,200 @@ def handle_start_analysis_request(data):
             })
             return
 
-        threading.Thread(target=run_full_analysis_pipeline, args=(ticker, request.sid)).start()
+        # 같은 데이터로 이미 완료된 분석이 있으면 작업 대기열을 거치지 않고 바로 전달
+        ## 포트폴리오 요약(현재가, 수익률)은 방금 조회한 값으로 교체
+        data_version = fetch_data_version(supabase_client_global, ticker)
+        cached_result = get_cached_result(ticker, profile_name, data_version) if data_version else None
+        if cached_result:
+            _leave_other_analyses(None)
+            print(f"[백엔드] '{ticker}' 저장된 분석 결과를 전달합니다. (데이터 버전: {data_version})")
+            emit('analysis_complete', {**cached_result, 'portfolio_summary': _build_analysis_portfolio_summary(ticker), 'cached': True})
+            return
+
+        # 점진적 모드는 초안을 보내는 단계가 추가되므로, 모드가 다른 요청은 같은 분석을 공유하지 않음
+        room = f"analysis:{ticker}:{profile_name}:{'progressive' if progressive else 'full'}"
+        _join_or_start_analysis(
+            room, f"'{ticker}'",
+            lambda cancel_token: run_full_analysis_pipeline(ticker, room, profile_name, progressive, cancel_token),
+        )
+
+@socketio.on('start_portfolio_analysis_request') # 프론트엔드에서 포트폴리오 전체 분석 요청을 받음
+def handle_start_portfolio_analysis_request(data):
+    """
+    portfolio.json의 모든 보유 종목을 하나의 작업으로 분석합니다. (analysis_model/portfolio_analysis.py)
+    종목별 브리핑은 끝나는 대로 'portfolio_holding_report'로, 포트폴리오 요약은 마지막에 'portfolio_analysis_complete'로 전달합니다.
+    같은 실행 프로파일의 포트폴리오 분석이 진행 중이면 합류합니다.
+    """
+    profile_name = resolve_profile_name((data or {}).get('profile'))
+    print(f"웹 요청: 포트폴리오 전체 분석을 시작합니다. (실행 프로파일: {profile_name})")
+    with app.app_context():
+        room = f"analysis:portfolio:{profile_name}"
+        _join_or_start_analysis(
+            room, "포트폴리오 전체",
+            lambda cancel_token: run_full_portfolio_analysis(room, profile_name, cancel_token),
+        )
+
+def _leave_other_analyses(room: Optional[str]) -> None:
+    """
+    요청한 클라이언트가 room 외에 이전에 요청한 분석의 이벤트를 더 이상 받지 않게 하고 구독을 해제합니다.
+    (다른 구독자가 없으면 그 분석은 취소, socketio 이벤트 핸들러 안에서 호출)
+    """
+    for joined in rooms():
+        if joined.startswith("analysis:") and joined != room:
+            leave_room(joined)
+    sid = request.sid
+    with _running_analyses_lock:
+        if _client_rooms.get(sid) != room:
+            _unsubscribe_client(sid, "다른 분석 요청")
+
+def _join_or_start_analysis(room: str, label: str, run: Callable[[CancelToken], None]) -> None:
+    """
+    요청한 클라이언트를 분석 room에 넣고, 진행 중인 분석이 없으면 run(취소 토큰)을 작업 대기열에 제출합니다.
+    (socketio 이벤트 핸들러 안에서 호출)
+    """
+    _leave_other_analyses(room)
+
+    sid = request.sid
+    with _running_analyses_lock:
+        join_room(room)
+        _client_rooms[sid] = room
+        record = _running_analyses.get(room)
+        if record is not None:
+            record["clients"].add(sid)
+            print(f"웹 요청: {label} 분석이 이미 진행 중이어서 합류합니다. (참여 {len(record['clients'])}명)")
+            emit('status_update', {'message': '같은 분석이 이미 진행 중입니다. 진행 중인 분석 결과를 함께 받습니다.', 'progress': 10})
+            return
+        cancel_token = CancelToken()
+        _running_analyses[room] = {"clients": {sid}, "cancel_token": cancel_token}
+
+        # 정해진 수의 작업자로만 실행하고, 나머지는 대기열에서 순번과 예상 대기 시간을 받으며 기다림
+        position = submit_job(
+            f"{room}#{next(_analysis_job_ids)}",
+            lambda: _run_shared_analysis(room, label, run, cancel_token),
+            lambda position, eta_sec: socketio.emit('status_update', {
+                'message': f"분석 대기 중... ({position}번째, 예상 대기 약 {max(1, round(eta_sec / 60))}분)",
+                'progress': 5,
+                'queue_position': position,
+                'eta_sec': eta_sec,
+            }, room=room),
+        )
+        if position is None:
+            # 대기열이 가득 차면 모두를 느리게 만드는 대신 새 요청을 거절
+            _running_analyses.pop(room, None)
+            _client_rooms.pop(sid, None)
+            leave_room(room)
+            print(f"웹 요청: 분석 대기열이 가득 차 {label} 분석 요청을 거절했습니다.")
+            emit('status_update', {'message': '현재 분석 요청이 많아 처리할 수 없습니다. 잠시 후 다시 시도해주세요.', 'progress': -1})
+
+def _run_shared_analysis(room: str, label: str, run: Callable[[CancelToken], None], cancel_token: CancelToken) -> None:
+    """분석을 실행하고, 끝나면 room을 닫아 이후 요청은 새 분석(또는 분석 결과 캐시)으로 처리되게 합니다."""
+    try:
+        if cancel_token.is_cancelled():
+            # 대기열에서 기다리는 동안 모든 클라이언트가 떠났으면 바로 작업자를 반환
+            print(f"[백엔드] {label} 분석이 시작 전에 취소되었습니다. ({cancel_token.reason})")
+            return
+        run(cancel_token)
+    finally:
+        with _running_analyses_lock:
+            record = _running_analyses.get(room)
+            # 취소된 분석은 이미 목록에서 빠졌고, 같은 room에서 새 분석이 시작되었을 수 있으므로 자기 기록일 때만 정리
+            if record is not None and record["cancel_token"] is cancel_token:
+                _running_analyses.pop(room)
+                for sid in record["clients"]:
+                    if _client_rooms.get(sid) == room:
+                        _client_rooms.pop(sid)
+                socketio.close_room(room)
+                clients = len(record["clients"])
+            else:
+                clients = 0
+        if clients > 1:
+            print(f"[백엔드] {label} 분석 결과를 {clients}개 클라이언트가 함께 받았습니다.")
 
 #######################################################################
 # AI 에이전트 파이프라인
 
+# 종목 선택 시 미리 실행하는 함수 (prefetch 스레드에서 실행)
+def _warm_up_ticker(ticker: str, profile_name: str) -> None:
+    """
+    분석 파이프라인 중 DB만 사용하는 작업(데이터 준비, 해외/국내 RAG 후보 검색, 대상 종목 가격 조회)을
+    실행하여 결과를 미리 가져오기 캐시에 저장합니다. 키는 파이프라인에서 조회할 때와 같은 값을 사용합니다.
+    """
+    with app.app_context():
+        company_name = _get_company_name_from_db(ticker)
+    if not company_name:
+        return
+
+    prep = run_data_prep({"ticker": ticker, "company_name": company_name})
+    company_name = prep.get("company_name")
+    if not company_name:
+        return # 파이프라인에서도 중단될 상태이므로 저장하지 않음
+    store_prefetched(ticker, "data_prep", prep)
+
+    # 후보 수는 실행 프로파일마다 다르므로 키에 포함 (다른 프로파일로 분석하면 직접 검색)
+    candidate_count = get_execution_profile(profile_name)["news_selection"]["candidate_count"]
+    # 검색 오류 시 빈 목록이 반환되므로, 빈 결과는 저장하지 않고 분석 시 다시 검색하도록 함
+    store_prefetched(ticker, "us_rag", search_us_news_candidates(company_name, top_k=candidate_count) or None, param=(company_name, candidate_count))
+    store_prefetched(ticker, "domestic_rag", search_domestic_news_candidates(company_name, top_k=candidate_count) or None, param=(company_name, candidate_count))
+
+    window = price_window()
+    store_prefetched(ticker, "prices", get_stock_data_from_supabase(ticker, *window), param=window)
+
+# 분석 결과에 포함할 대상 종목의 포트폴리오 요약
+def _build_analysis_portfolio_summary(ticker: str) -> Dict[str, Any]:
+    """분석 결과와 함께 보낼 대상 종목의 포트폴리오 요약(보유 여부, 현재가, 손익)을 만듭니다."""
+    # portfolio_summary에 is_portfolio_holding 플래그 추가
+    is_portfolio_holding = False
+    selected_stock_portfolio_info = None
+    for stock_data in _cached_portfolio_initial_data:
+        if stock_data.get('ticker') == ticker:
+            selected_stock_portfolio_info = stock_data
+            is_portfolio_holding = True
+            break
+    portfolio_summary = {
+        "ticker": ticker,
+        "is_portfolio_holding": is_portfolio_holding
+    }
+
+    # 기업건전성 보고서가 존재한다면    
+    if is_portfolio_holding:
+        summary_from_db = get_stock_price_and_info(
+            ticker,
+            selected_stock_portfolio_info.get('purchase_price', 0),
+            selected_stock_portfolio_info.get('quantity', 0)
+        )
+        portfolio_summary.update(summary_from_db)
+        # 포트폴리오 요약의 이름은 portfolio.json에 있는 이름을 사용 (UI를 위해)
+        portfolio_summary['name'] = selected_stock_portfolio_info.get('name') 
+        # 만약 portfolio.json에 이름이 없으면 financial_statements 캐시에서 가져옴 (한국어일 수 있음)
+        if not portfolio_summary['name'] or portfolio_summary['name'] == ticker:
+            for fs_company in _financial_statement_companies:
+                if fs_company['ticker'] == ticker:
+                    portfolio_summary['name'] = fs_company['name']
+                    break
+    else:
+        # 포트폴리오에 없는 주식인 경우, 회사 이름은 UI 표시를 위해 financial_statements 캐시에서 가져옴
+        display_name_from_fs = ticker
+        for fs_company in _financial_statement_companies:
+            if fs_company['ticker'] == ticker:
+                display_name_from_fs = fs_company['name']
+                break
+        
+        # 최소한의 정보만 제공하고, purchase_price, quantity 등은 None
+        portfolio_summary.update({
+            "message": "선택된 주식의 포트폴리오 정보(구매가, 수량)를 찾을 수 없습니다.",
+            "name": display_name_from_fs, 
+            "current_price": get_stock_price_and_info(ticker).get('current_price', 'N/A') # 현재 가격은 가져와서 표시
+        })
+        print(f"선택된 주식의 포트폴리오 정보(구매가, 수량)를 찾을 수 없습니다: {ticker}")
+    return portfolio_summary
+
 # 파이프라인 실행 함수
-def run_full_analysis_pipeline(ticker: str, sid: str):
+def run_full_analysis_pipeline(ticker: str, room: str, profile_name: str, progressive: bool = False, cancel_token: Optional[CancelToken] = None):
     """
-    전체 분석 파이프라인을 실행하고 진행 상황을 클라이언트에 emit합니다.
+    전체 분석 파이프라인을 실행하고 진행 상황을 room(같은 분석을 요청한 클라이언트들)에 emit합니다.
+    profile_name의 실행 프로파일에 따라 단계별 모델/출력 길이를 정하고, 목표 지연시간 준수 여부를 기록합니다.
+    progressive가 True이면 시장 데이터 분석 직후 템플릿 기반 초안('draft_report')을 먼저 보냅니다.
+    cancel_token이 취소되면 다음 단계를 시작하지 않고 결과도 전달/저장하지 않습니다. (완료된 단계의 체크포인트는 유지)
     """
     with app.app_context():
         # 기업명 불러오기
@@ -450,7 +750,7 @@ def run_full_analysis_pipeline(ticker: str, sid: str):
         if not company_name_for_analysis:
             error_msg = f"'{ticker}'에 대한 분석 가능한 영문 회사 이름을 찾을 수 없습니다. (Supabase의 korean_stocks/us_stocks 데이터 확인 필요)"
             print(f"🚨 {error_msg}")
-            socketio.emit('status_update', {'message': error_msg, 'progress': -1}, room=sid)
+            socketio.emit('status_update', {'message': error_msg, 'progress': -1}, room=room)
             return
 
 
@@ -471,154 +771,263 @@ def run_full_analysis_pipeline(ticker: str, sid: str):
             "all_domestic_news": [], # 전체 국내 뉴스
             "us_market_entities": [], # 해외 뉴스 관련 기업, 지표
             "domestic_market_entities": [], # 국내 뉴스 관련 기업, 지표
+            "execution_profile": profile_name, # 실행 프로파일
+            "progressive_report": progressive, # 점진적 보고서 모드
+            "cancel_token": cancel_token, # 취소 토큰 (모든 클라이언트가 떠나면 취소)
         }
         current_state = initial_state.copy()
         
-        # portfolio_summary에 is_portfolio_holding 플래그 추가
-        is_portfolio_holding = False
-        selected_stock_portfolio_info = None
-        for stock_data in _cached_portfolio_initial_data:
-            if stock_data.get('ticker') == ticker:
-                selected_stock_portfolio_info = stock_data
-                is_portfolio_holding = True
-                break
-        portfolio_summary = {
-            "ticker": ticker,
-            "is_portfolio_holding": is_portfolio_holding
-        }
-
-        # 기업건전성 보고서가 존재한다면    
-        if is_portfolio_holding:
-            summary_from_db = get_stock_price_and_info(
-                ticker,
-                selected_stock_portfolio_info.get('purchase_price', 0),
-                selected_stock_portfolio_info.get('quantity', 0)
-            )
-            portfolio_summary.update(summary_from_db)
-            # 포트폴리오 요약의 이름은 portfolio.json에 있는 이름을 사용 (UI를 위해)
-            portfolio_summary['name'] = selected_stock_portfolio_info.get('name') 
-            # 만약 portfolio.json에 이름이 없으면 financial_statements 캐시에서 가져옴 (한국어일 수 있음)
-            if not portfolio_summary['name'] or portfolio_summary['name'] == ticker:
-                for fs_company in _financial_statement_companies:
-                    if fs_company['ticker'] == ticker:
-                        portfolio_summary['name'] = fs_company['name']
-                        break
-        else:
-            # 포트폴리오에 없는 주식인 경우, 회사 이름은 UI 표시를 위해 financial_statements 캐시에서 가져옴
-            display_name_from_fs = ticker
-            for fs_company in _financial_statement_companies:
-                if fs_company['ticker'] == ticker:
-                    display_name_from_fs = fs_company['name']
-                    break
-            
-            # 최소한의 정보만 제공하고, purchase_price, quantity 등은 None
-            portfolio_summary.update({
-                "message": "선택된 주식의 포트폴리오 정보(구매가, 수량)를 찾을 수 없습니다.",
-                "name": display_name_from_fs, 
-                "current_price": get_stock_price_and_info(ticker).get('current_price', 'N/A') # 현재 가격은 가져와서 표시
-            })
-            print(f"선택된 주식의 포트폴리오 정보(구매가, 수량)를 찾을 수 없습니다: {ticker}")
+        portfolio_summary = _build_analysis_portfolio_summary(ticker)
+
+        # 요청을 받을 때 분석 결과 캐시를 확인하지만, 대기열에서 기다리는 동안 같은 종목의 결과가 만들어졌을 수 있으므로 다시 확인
+        ## 포트폴리오 요약(현재가, 수익률)은 방금 조회한 값으로 교체
+        data_version = fetch_data_version(supabase_client_global, ticker)
+        cached_result = get_cached_result(ticker, profile_name, data_version) if data_version else None
+        if cached_result:
+            print(f"[백엔드] '{ticker}' 저장된 분석 결과를 전달합니다. (데이터 버전: {data_version})")
+            socketio.emit('analysis_complete', {**cached_result, 'portfolio_summary': portfolio_summary, 'cached': True}, room=room)
+            return
 
 
-        try:
-            # 1. 데이터 준비 (이제 run_data_prep은 이미 company_name이 설정된 상태의 state를 받음)
-            socketio.emit('status_update', {'message': '데이터 준비 중...', 'progress': 10}, room=sid)
-            time.sleep(1)
-            updated_state_from_data_prep = run_data_prep(current_state)
-            current_state.update(updated_state_from_data_prep)
-            print("[백엔드] 데이터 준비 완료")
-
-            # 이전의 `if not current_state.get('company_name')` 체크는 이제 거의 불필요하지만,
+        # 분석 단계 의존성 그래프
+        ## 데이터 준비 -> (해외 뉴스, 국내 뉴스 동시 실행) -> 시장 데이터 분석 -> [초안] -> 최종 브리핑
+        def data_prep_stage(state: AnalysisState) -> Dict[str, Any]:
+            # 종목 선택 시 미리 실행해둔 결과가 있으면 사용
+            update = get_prefetched(ticker, "data_prep") or run_data_prep(state)
             # 혹시 `run_data_prep` 내부에서 이름을 `None`으로 덮어쓸 경우를 대비한 최종 방어.
-            if not current_state.get('company_name'):
-                error_msg = f"'{ticker}' 기업의 기본 정보(회사명)를 분석 중 잃었습니다."
-                print(f"🚨 {error_msg}")
-                socketio.emit('status_update', {'message': error_msg, 'progress': -1}, room=sid)
-                return 
-
-            # 2. 해외 뉴스 분석 (이제 AnalysisState.company_name이 영문(선호) 이름으로 전달됨)
-            # 뉴스 에이전트는 이 company_name을 사용하여 Supabase 벡터 검색을 수행해야 함 -> 정상 작동
-            socketio.emit('status_update', {'message': '해외 뉴스 분석 중...', 'progress': 30}, room=sid)
-            time.sleep(1)
-            updated_state_from_news = run_news_analyst(current_state) #RAG
-            current_state.update(updated_state_from_news)
-            print("[백엔드] 해외 뉴스 분석 완료")
-
-            # 3. 국내 뉴스 분석 (동일)
-            socketio.emit('status_update', {'message': '국내 뉴스 분석 중...', 'progress': 50}, room=sid)
-            time.sleep(1)
-            updated_state_from_domestic_news = run_domestic_news_analyst(current_state) #RAG
-            current_state.update(updated_state_from_domestic_news)
-            print("[백엔드] 국내 뉴스 분석 완료")
-
-            # 4. 시장 데이터 분석
+            if not update.get('company_name', state.get('company_name')):
+                raise StageAbort(f"'{ticker}' 기업의 기본 정보(회사명)를 분석 중 잃었습니다.")
+            return update
+
+        def market_correlation_stage(state: AnalysisState) -> Dict[str, Any]:
             # run_market_correlation은 티커를 기반으로 시계열 데이터를 가져오므로,
             # 이 단계에서 "시계열 데이터를 가져오지 못했습니다" 오류는 해당 티커의 가격 데이터가 DB에 없는 것임.
-            socketio.emit('status_update', {'message': '시장 데이터 분석 중...', 'progress': 70}, room=sid)
-            time.sleep(1)
-            updated_state_from_market_correlation = run_market_correlation(current_state)
-            current_state.update(updated_state_from_market_correlation)
-            print("[백엔드] 시장 데이터 분석 완료")
-
+            update = run_market_correlation(state)
             # market_analysis_result가 None인 경우 빈 사전으로 초기화
-            if current_state.get('market_analysis_result') is None:
-                current_state['market_analysis_result'] = {
+            if update.get('market_analysis_result') is None:
+                update['market_analysis_result'] = {
                     "news_impact_data": [], 
                     "historical_prices": {}, 
                     "all_analyzed_tickers": [], 
                     "correlation_matrix": {}
                 }
                 print("⚠️ market_analysis_result가 None이어서 빈 사전으로 초기화합니다.")
+            return update
+
+        def draft_report_stage(state: AnalysisState) -> Dict[str, Any]:
+            # 점진적 보고서 모드: LLM 호출 없이 만든 초안을 먼저 보내고, 최종 보고서는 이어서 생성
+            socketio.emit('draft_report', {
+                'report': build_draft_report(state),
+                'selected_news': state.get("selected_news", []),
+                'selected_domestic_news': state.get("selected_domestic_news", []),
+            }, room=room)
+            print(f"[백엔드] 초안 보고서 전달 완료 ({time.perf_counter() - pipeline_started:.1f}s)")
+            return {}
+
+        def report_synthesizer_stage(state: AnalysisState) -> Dict[str, Any]:
+            # 보고서 섹션은 생성되는 대로 클라이언트에 스트리밍
+            return run_report_synthesizer(
+                state,
+                on_section_delta=lambda section, delta: socketio.emit('report_section_delta', {'section': section, 'delta': delta}, room=room),
+                on_section_done=lambda section, content: socketio.emit('report_section_done', {'section': section, 'content': content}, room=room),
+            )
 
+        stages: List[PipelineStage] = [
+            {"name": "data_prep", "run": data_prep_stage, "depends_on": []},
+            {"name": "us_news", "run": run_news_analyst, "depends_on": ["data_prep"]}, #RAG
+            {"name": "domestic_news", "run": run_domestic_news_analyst, "depends_on": ["data_prep"]}, #RAG
+            {"name": "market_correlation", "run": market_correlation_stage, "depends_on": ["us_news", "domestic_news"]},
+        ]
+        if progressive:
+            stages.append({"name": "draft_report", "run": draft_report_stage, "depends_on": ["market_correlation"]})
+        stages.append({
+            "name": "report_synthesizer",
+            "run": report_synthesizer_stage,
+            # 초안이 먼저 도착해야 스트리밍되는 섹션이 초안을 덮어쓴다
+            "depends_on": ["draft_report" if progressive else "market_correlation"],
+        })
+
+        # 진행 상황은 단계가 실제로 시작/완료될 때 전달 (진행률 = 완료된 단계 비율)
+        stage_messages = {
+            "data_prep": "데이터 준비 중...",
+            "us_news": "해외 뉴스 분석 중...",
+            "domestic_news": "국내 뉴스 분석 중...",
+            "market_correlation": "시장 데이터 분석 중...",
+            "report_synthesizer": "최종 투자 브리핑 생성 중...",
+        }
+        # 이전에 실패한 같은 분석(같은 데이터 버전)의 체크포인트가 있으면 처음으로 결과가 없는 단계부터 이어서 실행
+        checkpoint_key = (ticker, profile_name, data_version) if data_version else None
+        # 초안 단계는 결과 없이 클라이언트에 초안을 보내는 단계이므로 다시 시도할 때도 항상 실행하고,
+        # 최종 보고서 단계는 성공하면 분석 결과 캐시에 저장되고 실패하면 다시 실행해야 하므로 둘 다 저장/복원하지 않음
+        uncheckpointed_stages = {"draft_report", "report_synthesizer"}
+        checkpoints = {
+            name: update
+            for name, update in (load_checkpoints(checkpoint_key) if checkpoint_key else {}).items()
+            if name not in uncheckpointed_stages
+        }
+        restored = restorable_stages(stages, checkpoints)
+        if restored:
+            print(f"[백엔드] '{ticker}' 이전 실행의 체크포인트로 {sorted(restored)} 단계를 건너뜁니다.")
 
-            # 5. 최종 투자 브리핑 생성
-            socketio.emit('status_update', {'message': '최종 투자 브리핑 생성 중...', 'progress': 90}, room=sid)
-            time.sleep(1)
-            updated_state_from_report_synthesizer = run_report_synthesizer(current_state)
-            current_state.update(updated_state_from_report_synthesizer)
-            print("[백엔드] 최종 투자 브리핑 생성 완료")
+        def on_checkpoint(name: str, update: Dict[str, Any]) -> None:
+            if checkpoint_key and name not in uncheckpointed_stages:
+                save_checkpoint(checkpoint_key, name, update)
 
-            # 프론트엔드에 출력할 데이터 전달
-            final_report = current_state.get("final_report")
-            selected_news_for_frontend = current_state.get("selected_news", [])
-            selected_domestic_news_for_frontend = current_state.get("selected_domestic_news", [])
-            
-            # 새롭게 추가된 데이터 필드를 추출
-            historical_prices = current_state.get("historical_prices", {}) # 장기 데이터
-            short_term_prices = current_state.get("short_term_prices", {}) # 단기 데이터
-            news_event_markers = current_state.get("news_event_markers", {}) # 기업, 지표명
-            all_analyzed_tickers = current_state.get("all_analyzed_tickers", []) # 티커 목록
-            
-            # market_analysis_result에서 correlation_matrix 추출
-            #### 이젠 사용하지 않음
-            market_analysis_result = current_state.get("market_analysis_result", {})
-            correlation_matrix = market_analysis_result.get("correlation_matrix", {})
-            
-            # 국문 기업 설명을 상태(state)에서 가져오가
-            ko_company_description = current_state.get("ko_company_description", "기업 설명 정보를 불러오지 못했습니다.")
-
-            if final_report:
-                socketio.emit('analysis_complete', {
-                    'report': final_report,
-                    'portfolio_summary': portfolio_summary,
-                    'selected_news': selected_news_for_frontend,
-                    'selected_domestic_news': selected_domestic_news_for_frontend,
-                    'historical_prices': historical_prices,
-                    'short_term_prices': short_term_prices,
-                    'news_event_markers': news_event_markers,
-                    'all_analyzed_tickers': all_analyzed_tickers,
-                    'correlation_matrix': correlation_matrix,
-                    'ko_company_description': ko_company_description, # 국문 기업 설명문 (최종보고서용)
-                    'message': '분석 완료!'
-                }, room=sid)
+        running_stages: List[str] = []
+        completed_stages: List[str] = list(restored)
+
+        def current_progress() -> int:
+            return 10 + int(80 * len(completed_stages) / len(stages))
+
+        def on_stage_start(name: str) -> None:
+            running_stages.append(name)
+            if name in stage_messages:
+                socketio.emit('status_update', {'message': stage_messages[name], 'progress': current_progress()}, room=room)
+
+        def on_stage_done(name: str, elapsed: float) -> None:
+            running_stages.remove(name)
+            completed_stages.append(name)
+            print(f"[백엔드] {name} 단계 완료 ({elapsed:.1f}s)")
+            # 아직 실행 중인 단계가 있으면 그 단계의 메시지로 진행률만 갱신
+            still_running = [stage for stage in running_stages if stage in stage_messages]
+            if still_running and not (cancel_token and cancel_token.is_cancelled()):
+                socketio.emit('status_update', {'message': stage_messages[still_running[-1]], 'progress': current_progress()}, room=room)
+
+        # 단계별 소요 시간 (실행 프로파일의 목표 지연시간과 비교)
+        pipeline_started = time.perf_counter()
+
+        try:
+            try:
+                current_state, stage_durations = run_stage_graph(
+                    current_state, stages, on_stage_start, on_stage_done,
+                    checkpoints=checkpoints, on_checkpoint=on_checkpoint, cancel_token=cancel_token,
+                )
+            except StageAbort as abort:
+                print(f"🚨 {abort}")
+                socketio.emit('status_update', {'message': str(abort), 'progress': -1}, room=room)
+                return
+            except AnalysisCancelled as cancelled:
+                # 결과를 받을 클라이언트가 없으므로 알리지 않음 (다시 요청하면 체크포인트부터 이어서 실행)
+                print(f"[백엔드] '{ticker}' 분석 취소: {cancelled} (완료 단계: {completed_stages})")
+                return
+            if cancel_token and cancel_token.is_cancelled():
+                # 마지막 단계가 끝난 뒤에 취소된 경우에도 결과를 전달/저장하지 않음
+                print(f"[백엔드] '{ticker}' 분석이 완료 직후 취소되어 결과를 전달하지 않습니다.")
+                return
+
+            # 실행 프로파일의 목표 지연시간 준수 여부 기록
+            latency_report = evaluate_latency(profile_name, time.perf_counter() - pipeline_started, stage_durations)
+
+            # 프론트엔드에 출력할 데이터 전달 (batch_reports.py가 미리 만드는 보고서와 같은 형식)
+            if current_state.get("final_report"):
+                result_payload = build_result_payload(current_state, portfolio_summary, latency_report)
+                socketio.emit('analysis_complete', result_payload, room=room)
+                # 분석을 시작할 때의 데이터 버전으로 저장 (분석 중 새 데이터가 들어왔다면 다음 요청에서 다시 분석)
+                if data_version:
+                    store_result(ticker, profile_name, data_version, result_payload)
+                    clear_checkpoints(checkpoint_key)
             else:
-                socketio.emit('status_update', {'message': '오류: 최종 보고서 생성 실패.', 'progress': -1}, room=sid)
+                socketio.emit('status_update', {
+                    'message': '오류: 최종 보고서 생성 실패.',
+                    'progress': -1,
+                    'failed_stage': 'report_synthesizer',
+                    'retryable': checkpoint_key is not None, # 체크포인트가 있으면 '실패한 단계부터 다시 시도' 제공
+                }, room=room)
 
         except Exception as e:
             print(f"🚨 분석 중 오류 발생: {e}")
             import traceback
             traceback.print_exc()
-            socketio.emit('status_update', {'message': f"분석 중 오류 발생: {str(e)}", 'progress': -1}, room=sid)
+            socketio.emit('status_update', {
+                'message': f"분석 중 오류 발생: {str(e)}",
+                'progress': -1,
+                'failed_stage': running_stages[0] if running_stages else None, # 실패 시점에 실행 중이던 단계
+                'retryable': checkpoint_key is not None,
+            }, room=room)
+
+#######################################################################
+# 포트폴리오 전체 분석
+
+def run_full_portfolio_analysis(room: str, profile_name: str, cancel_token: Optional[CancelToken] = None):
+    """
+    portfolio.json의 분석 가능한 보유 종목을 한 번에 분석하고 결과를 room에 emit합니다.
+    같은 데이터 버전의 분석 결과가 있는 종목은 저장된 결과를 바로 보내고, 나머지 종목만 공유 작업과 함께 분석합니다.
+    각 종목의 결과는 단일 종목 분석과 같은 형식('analysis_complete' 데이터)이며 분석 결과 캐시에도 저장합니다.
+    """
+    with app.app_context():
+        started = time.perf_counter()
+        overview = _build_portfolio_overview()
+        stocks = {stock['ticker']: stock for stock in overview['stocks']}
+        socketio.emit('portfolio_analysis_started', {
+            'holdings': [{'ticker': stock['ticker'], 'name': stock['name'], 'is_analyzable': stock['is_analyzable']} for stock in overview['stocks']],
+        }, room=room)
+
+        holding_results: Dict[str, Dict[str, Any]] = {} # 티커 -> {status, briefing_summary 또는 error}
+        data_versions: Dict[str, Optional[str]] = {}
+        holdings: List[Dict[str, str]] = []
+        for ticker, stock in stocks.items():
+            if not stock['is_analyzable']:
+                holding_results[ticker] = {'status': 'skipped', 'error': '재무제표 분석 데이터가 없어 분석하지 않았습니다.'}
+                continue
+            portfolio_summary = {**stock, 'is_portfolio_holding': True}
+            data_versions[ticker] = fetch_data_version(supabase_client_global, ticker)
+            cached_result = get_cached_result(ticker, profile_name, data_versions[ticker]) if data_versions[ticker] else None
+            if cached_result:
+                socketio.emit('portfolio_holding_report', {'ticker': ticker, 'result': {**cached_result, 'portfolio_summary': portfolio_summary, 'cached': True}}, room=room)
+                holding_results[ticker] = {'status': 'cached', 'briefing_summary': (cached_result.get('report') or {}).get('briefing_summary')}
+                continue
+            company_name = _get_company_name_from_db(ticker)
+            if not company_name:
+                holding_results[ticker] = {'status': 'failed', 'error': '분석 가능한 영문 회사 이름을 찾을 수 없습니다.'}
+                socketio.emit('portfolio_holding_report', {'ticker': ticker, 'error': holding_results[ticker]['error']}, room=room)
+                continue
+            holdings.append({'ticker': ticker, 'company_name': company_name, 'name': stock['name']})
+
+        if not holdings and not holding_results:
+            socketio.emit('status_update', {'message': '분석할 포트폴리오 보유 종목이 없습니다.', 'progress': -1}, room=room)
+            return
+
+        def on_status(message: str, progress: int) -> None:
+            socketio.emit('status_update', {'message': message, 'progress': progress}, room=room)
+
+        def on_holding_done(ticker: str, state: Optional[AnalysisState], error: Optional[str]) -> None:
+            if state is None:
+                holding_results[ticker] = {'status': 'failed', 'error': error}
+                socketio.emit('portfolio_holding_report', {'ticker': ticker, 'error': error}, room=room)
+                return
+            # 종목별 소요 시간은 공유 작업과 구분할 수 없으므로 목표 지연시간 판정 대신 그때까지의 포트폴리오 단계별 소요 시간을 기록
+            portfolio_profile = {'name': profile_name, 'portfolio': True, 'phase_durations': {name: round(sec, 2) for name, sec in phase_durations.items()}}
+            result_payload = build_result_payload(state, {**stocks[ticker], 'is_portfolio_holding': True}, portfolio_profile)
+            socketio.emit('portfolio_holding_report', {'ticker': ticker, 'result': result_payload}, room=room)
+            holding_results[ticker] = {'status': 'done', 'briefing_summary': (state.get('final_report') or {}).get('briefing_summary')}
+            if data_versions.get(ticker):
+                store_result(ticker, profile_name, data_versions[ticker], result_payload)
+
+        phase_durations: Dict[str, float] = {}
+        shared_result: Dict[str, Any] = {"shared_macro": {}, "phase_durations": {}}
+        if holdings:
+            try:
+                shared_result = run_portfolio_analysis(holdings, profile_name, on_status, on_holding_done, cancel_token, phase_durations)
+            except AnalysisCancelled as cancelled:
+                # 결과를 받을 클라이언트가 없으므로 알리지 않음 (완료된 종목의 결과는 이미 분석 결과 캐시에 저장됨)
+                print(f"[백엔드] 포트폴리오 전체 분석 취소: {cancelled}")
+                return
+            except Exception as e:
+                print(f"🚨 포트폴리오 전체 분석 중 오류 발생: {e}")
+                import traceback
+                traceback.print_exc()
+                socketio.emit('status_update', {'message': f"포트폴리오 분석 중 오류 발생: {str(e)}", 'progress': -1}, room=room)
+                return
+
+        elapsed = time.perf_counter() - started
+        print(f"[백엔드] 포트폴리오 전체 분석 완료: {len(stocks)}개 종목, {elapsed:.1f}s ({shared_result['phase_durations']})")
+        socketio.emit('portfolio_analysis_complete', {
+            'total_portfolio_summary': overview['total_portfolio_summary'],
+            'holdings': [{'ticker': ticker, 'name': stocks[ticker]['name'], **holding_results.get(ticker, {'status': 'failed'})} for ticker in stocks],
+            'shared_macro': shared_result['shared_macro'],
+            'execution_profile': {'name': profile_name, 'elapsed_sec': round(elapsed, 2), 'phase_durations': shared_result['phase_durations']},
+            'message': '포트폴리오 분석 완료!'
+        }, room=room)
 
 #######################################################################
 # 애플리케이션 실행
@@ -0,0 +1,240 @@
+# batch_reports.py
+# Flask/Socket.IO 없이 분석 파이프라인을 여러 종목에 대해 미리 실행하는 배치 스크립트
+# 포트폴리오(portfolio.json) 보유 종목과 financial_statements의 모든 종목을 분석하여 분석 결과 캐시에 저장한다
+# 아침 데이터 수집(가격, 지표, 뉴스)이 끝난 직후 실행하면, 사용자가 요청할 때 저장된 보고서를 바로 받을 수 있다
+# 서버와 다른 곳(깃허브 Actions 등)에서 실행할 때는 ANALYSIS_RESULT_TABLE을 설정하여 Supabase 테이블에 저장한다
+# 웹 앱과 같은 LLM API 키를 사용하므로, 공급자별 요청 예산을 다 쓰면 새 종목을 시작하지 않고 실행을 멈춘다
+## 사용 예: python batch_reports.py --profile balanced --workers 2 --limit 20
+
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from analysis_model.state import AnalysisState
+from analysis_model.agents.data_prep_agent import run_data_prep, supabase_client
+from analysis_model.agents.news_analyst_agent import run_news_analyst
+from analysis_model.agents.domestic_news_analyst_agent import run_domestic_news_analyst
+from analysis_model.agents.market_correlation_agent import run_market_correlation
+from analysis_model.agents.report_synthesizer_agent import run_report_synthesizer
+from analysis_model.profiles import resolve_profile_name, evaluate_latency
+from analysis_model.llm_ledger import count_requests, has_quota
+from analysis_model.pipeline import PipelineStage, StageAbort, run_stage_graph
+from analysis_model.result_cache import (
+    RESULT_CACHE_DIR, RESULT_CACHE_TABLE, fetch_data_version, build_result_payload,
+    get_cached_result, store_result, use_supabase_table,
+)
+
+PORTFOLIO_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'portfolio.json')
+
+# 배치 한 번이 사용할 수 있는 공급자별 최대 LLM 요청 수 (일일 할당량의 나머지는 사용자 요청을 위해 남겨 둠)
+## 예: BATCH_LLM_BUDGETS='{"gemini": 100, "clova": 60}'
+BATCH_LLM_BUDGETS: Dict[str, int] = {"gemini": 100, "clova": 60}
+BATCH_LLM_BUDGETS.update(json.loads(os.environ.get("BATCH_LLM_BUDGETS", "{}")))
+BATCH_CALLS_PER_TICKER = 10 # 종목 하나에 필요한 공급자별 요청 수 추정치 (완료된 종목이 생기면 실제 평균으로 대체)
+
+#######################################################################
+# 분석 대상 종목
+
+def load_batch_tickers(portfolio_only: bool = False) -> List[str]:
+    """포트폴리오 보유 종목을 먼저, 그 다음 financial_statements의 나머지 종목을 중복 없이 반환합니다."""
+    tickers: List[str] = []
+    try:
+        with open(PORTFOLIO_FILE, 'r', encoding='utf-8') as f:
+            tickers += [stock['ticker'] for stock in json.load(f) if stock.get('ticker')]
+    except (FileNotFoundError, json.JSONDecodeError) as e:
+        print(f"경고: {PORTFOLIO_FILE} 파일을 읽을 수 없습니다. ({e})")
+
+    analyzable = {row['ticker'] for row in supabase_client.table("financial_statements").select("ticker").execute().data}
+    # 기업건전성 보고서가 없는 종목은 서버에서도 분석하지 않으므로 제외
+    tickers = [ticker for ticker in tickers if ticker in analyzable]
+    if not portfolio_only:
+        tickers += sorted(analyzable)
+    return list(dict.fromkeys(tickers))
+
+def lookup_company_name(ticker: str) -> Optional[str]:
+    """분석 에이전트가 사용할 영문 회사 이름을 korean_stocks/us_stocks에서 조회합니다. (app.py의 _get_company_name_from_db와 같은 기준)"""
+    table = "korean_stocks" if ticker.endswith('.KS') or ticker.endswith('.KQ') else "us_stocks"
+    res = supabase_client.table(table).select("company_name").eq('ticker', ticker).limit(1).execute()
+    if res.data and (res.data[0].get('company_name') or '').strip():
+        return res.data[0]['company_name'].strip()
+    return None
+
+#######################################################################
+# LLM 요청 예산
+
+class BatchBudget:
+    """
+    배치 시작 이후 장부에 기록된 공급자별 요청 수로 새 종목을 시작할 수 있는지 판단합니다.
+    실행 중인 종목의 요청은 아직 다 기록되지 않았으므로 종목당 예상 요청 수만큼 미리 잡아 둡니다.
+    한 번이라도 예산이 부족하면 이후 종목은 모두 시작하지 않습니다.
+    """
+
+    def __init__(self, budgets: Dict[str, int]):
+        self.budgets = budgets
+        self.started_at = datetime.now(timezone.utc)
+        self.exhausted = False
+        self._running = 0
+        self._finished = 0
+        self._lock = threading.Lock()
+
+    def _calls_per_ticker(self, provider: str) -> int:
+        if not self._finished:
+            return BATCH_CALLS_PER_TICKER
+        return max(1, -(-count_requests(self.started_at).get(provider, 0) // self._finished)) # 올림
+
+    def acquire(self) -> bool:
+        """예산이 남아 있으면 종목 하나를 실행 중으로 잡고 True를 반환합니다."""
+        with self._lock:
+            if not self.exhausted:
+                for provider, budget in self.budgets.items():
+                    reserve = self._calls_per_ticker(provider) * (self._running + 1)
+                    if not has_quota(provider, budget, self.started_at, reserve):
+                        print(f"[Batch] '{provider}' LLM 요청 예산({budget}건)이 부족하여 남은 종목을 시작하지 않습니다.")
+                        self.exhausted = True
+                        break
+            if self.exhausted:
+                return False
+            self._running += 1
+            return True
+
+    def release(self) -> None:
+        """실행이 끝난 종목을 예산 계산에 반영합니다."""
+        with self._lock:
+            self._running -= 1
+            self._finished += 1
+
+#######################################################################
+# 종목 하나 분석
+
+def run_batch_report(ticker: str, profile_name: str, budget: BatchBudget, force: bool = False) -> str:
+    """
+    종목 하나를 분석하여 결과 캐시에 저장하고 처리 결과를 반환합니다.
+    반환값: "done" / "cached"(같은 데이터 버전의 결과가 이미 있음) / "skipped"(회사명, 데이터 버전 없음) / "budget"(LLM 요청 예산 부족) / "failed"
+    """
+    if budget.exhausted:
+        return "budget"
+    data_version = fetch_data_version(supabase_client, ticker)
+    if not data_version:
+        print(f"[Batch] '{ticker}' 데이터 버전을 조회할 수 없어 건너뜁니다.")
+        return "skipped"
+    if not force and get_cached_result(ticker, profile_name, data_version):
+        print(f"[Batch] '{ticker}' 최신 데이터로 만든 보고서가 이미 있습니다.")
+        return "cached"
+
+    company_name = lookup_company_name(ticker)
+    if not company_name:
+        print(f"[Batch] '{ticker}'의 영문 회사 이름을 찾을 수 없어 건너뜁니다.")
+        return "skipped"
+    if not budget.acquire():
+        return "budget"
+    try:
+        return _run_pipeline(ticker, company_name, profile_name, data_version)
+    finally:
+        budget.release()
+
+def _run_pipeline(ticker: str, company_name: str, profile_name: str, data_version: str) -> str:
+    """app.py와 같은 단계 그래프로 종목을 분석하고 결과를 저장합니다."""
+
+    # app.py의 run_full_analysis_pipeline과 같은 초기 상태
+    initial_state: AnalysisState = {
+        "ticker": ticker,
+        "company_name": company_name,
+        "company_description": None,
+        "financial_health": None,
+        "selected_news": None,
+        "selected_domestic_news": None,
+        "market_analysis_result": None,
+        "final_report": None,
+        "historical_prices": None,
+        "news_event_markers": None,
+        "all_analyzed_tickers": None,
+        "all_us_news": [],
+        "all_domestic_news": [],
+        "us_market_entities": [],
+        "domestic_market_entities": [],
+        "execution_profile": profile_name,
+        "progressive_report": False,
+        "cancel_token": None, # 배치는 취소하지 않음
+    }
+
+    def data_prep_stage(state: AnalysisState) -> Dict[str, Any]:
+        update = run_data_prep(state)
+        if not update.get('company_name', state.get('company_name')):
+            raise StageAbort(f"'{ticker}' 기업의 기본 정보(회사명)를 분석 중 잃었습니다.")
+        return update
+
+    stages: List[PipelineStage] = [
+        {"name": "data_prep", "run": data_prep_stage, "depends_on": []},
+        {"name": "us_news", "run": run_news_analyst, "depends_on": ["data_prep"]},
+        {"name": "domestic_news", "run": run_domestic_news_analyst, "depends_on": ["data_prep"]},
+        {"name": "market_correlation", "run": run_market_correlation, "depends_on": ["us_news", "domestic_news"]},
+        {"name": "report_synthesizer", "run": run_report_synthesizer, "depends_on": ["market_correlation"]},
+    ]
+
+    started = time.perf_counter()
+    try:
+        final_state, stage_durations = run_stage_graph(initial_state, stages)
+    except Exception as e:
+        print(f"🚨 [Batch] '{ticker}' 분석 실패: {e}")
+        return "failed"
+    if not final_state.get("final_report"):
+        print(f"🚨 [Batch] '{ticker}' 최종 보고서 생성 실패")
+        return "failed"
+
+    latency_report = evaluate_latency(profile_name, time.perf_counter() - started, stage_durations)
+    # 포트폴리오 요약은 서버가 결과를 전달할 때 현재가로 다시 만들어 교체한다
+    payload = build_result_payload(final_state, {"ticker": ticker}, latency_report)
+    store_result(ticker, profile_name, data_version, payload)
+    print(f"✅ [Batch] '{ticker}' 보고서 저장 완료 ({latency_report['elapsed_sec']}s)")
+    return "done"
+
+#######################################################################
+# 실행
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="포트폴리오 및 분석 가능한 종목의 투자 브리핑을 미리 생성하여 분석 결과 캐시에 저장합니다.")
+    parser.add_argument("--profile", default=None, help="실행 프로파일 (fast / balanced / deep, 기본값: balanced)")
+    parser.add_argument("--tickers", nargs="*", help="분석할 티커 (지정하지 않으면 포트폴리오 + financial_statements 전체)")
+    parser.add_argument("--portfolio-only", action="store_true", help="포트폴리오 보유 종목만 분석")
+    parser.add_argument("--limit", type=int, default=None, help="분석할 최대 종목 수 (포트폴리오 종목부터)")
+    parser.add_argument("--workers", type=int, default=2, help="동시에 분석할 종목 수")
+    parser.add_argument("--gemini-budget", type=int, default=BATCH_LLM_BUDGETS["gemini"], help="이번 실행에서 사용할 최대 Gemini 요청 수")
+    parser.add_argument("--clova-budget", type=int, default=BATCH_LLM_BUDGETS["clova"], help="이번 실행에서 사용할 최대 CLOVA 요청 수")
+    parser.add_argument("--force", action="store_true", help="같은 데이터 버전의 보고서가 있어도 다시 생성")
+    args = parser.parse_args()
+
+    if not RESULT_CACHE_DIR and not RESULT_CACHE_TABLE:
+        print("오류: ANALYSIS_RESULT_CACHE_DIR 또는 ANALYSIS_RESULT_TABLE 환경 변수를 설정해야 서버가 결과를 사용할 수 있습니다.")
+        return 1
+    use_supabase_table(supabase_client)
+
+    profile_name = resolve_profile_name(args.profile)
+    tickers = args.tickers or load_batch_tickers(args.portfolio_only)
+    if args.limit is not None:
+        tickers = tickers[:args.limit]
+    budget = BatchBudget({**BATCH_LLM_BUDGETS, "gemini": args.gemini_budget, "clova": args.clova_budget})
+    print(f"[Batch] {len(tickers)}개 종목의 보고서를 생성합니다. (실행 프로파일: {profile_name}, 동시 실행: {args.workers}, LLM 요청 예산: {budget.budgets})")
+
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        outcomes = list(pool.map(lambda ticker: run_batch_report(ticker, profile_name, budget, args.force), tickers))
+
+    summary: Dict[str, List[str]] = {}
+    for ticker, outcome in zip(tickers, outcomes):
+        summary.setdefault(outcome, []).append(ticker)
+    print(f"[Batch] 완료: {json.dumps({outcome: len(items) for outcome, items in summary.items()}, ensure_ascii=False)}")
+    if summary.get("budget"):
+        print(f"[Batch] LLM 요청 예산 부족으로 시작하지 않은 종목: {len(summary['budget'])}개")
+    if summary.get("failed"):
+        print(f"[Batch] 실패한 종목: {summary['failed']}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
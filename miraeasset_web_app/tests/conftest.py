@@ -0,0 +1,9 @@
+# tests/conftest.py
+# app.py와 같이 analysis_model을 최상위 패키지로 import할 수 있도록 miraeasset_web_app 폴더를 경로에 추가한다
+# 에이전트 모듈은 import 시 Supabase/LLM 클라이언트를 만들므로 테스트에서는 가져오지 않고, 외부 호출은 가짜 객체로 대신한다
+## 실행: python -m pytest -q miraeasset_web_app/tests
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
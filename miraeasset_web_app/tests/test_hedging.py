@@ -0,0 +1,147 @@
+# tests/test_hedging.py
+# 헤징 임계 시간(p95, 기본값, 하한), 주/보조 공급자 중 결과를 사용할 쪽의 선택, 분석 취소 처리
+
+import threading
+
+import pytest
+
+from analysis_model import hedging
+from analysis_model.cancellation import AnalysisCancelled, CancelToken
+
+
+@pytest.fixture(autouse=True)
+def fresh_hedging_state(monkeypatch):
+    monkeypatch.setattr(hedging, "_first_token_samples", {})
+    monkeypatch.setattr(hedging, "_stats", {"calls": 0, "hedged": 0, "secondary_wins": 0, "failures": 0})
+    monkeypatch.setattr(hedging, "HEDGING_ENABLED", True)
+
+
+def immediate(text, calls):
+    """바로 토큰을 내고 text를 반환하는 가짜 공급자"""
+    def fn(on_token, cancel_event):
+        calls.append(text)
+        on_token(text)
+        return text
+    return fn
+
+def stalled(calls, cancelled, result="primary"):
+    """취소되거나 2초가 지날 때까지 토큰 없이 멈춰 있는 가짜 공급자"""
+    def fn(on_token, cancel_event):
+        calls.append(result)
+        if cancel_event.wait(2):
+            cancelled.set()
+            return None
+        return result
+    return fn
+
+
+def test_threshold_uses_default_until_enough_samples():
+    for _ in range(hedging.HEDGE_MIN_SAMPLES - 1):
+        hedging.record_first_token_latency("clova", 3.0)
+    assert hedging.hedge_threshold("clova") == hedging.HEDGE_DEFAULT_THRESHOLD_SEC
+
+
+def test_threshold_is_p95_of_samples():
+    for value in range(1, 101):
+        hedging.record_first_token_latency("clova", float(value))
+    assert hedging.hedge_threshold("clova") == 95.0
+
+
+def test_threshold_has_lower_bound():
+    for _ in range(hedging.HEDGE_MIN_SAMPLES):
+        hedging.record_first_token_latency("clova", 0.01)
+    assert hedging.hedge_threshold("clova") == hedging.HEDGE_MIN_THRESHOLD_SEC
+
+
+def test_fast_primary_is_not_hedged():
+    calls = []
+    result = hedging.hedged_call("report", ("clova", immediate("primary", calls)), ("gemini", immediate("secondary", calls)))
+
+    assert result == "primary"
+    assert calls == ["primary"]
+    assert hedging._stats["hedged"] == 0
+
+
+def test_slow_primary_is_hedged_and_secondary_wins(monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGE_DEFAULT_THRESHOLD_SEC", 0.05)
+    calls, tokens, cancelled = [], [], threading.Event()
+
+    result = hedging.hedged_call(
+        "report", ("clova", stalled(calls, cancelled)), ("gemini", immediate("secondary", calls)), on_token=tokens.append,
+    )
+
+    assert result == "secondary"
+    assert tokens == ["secondary"] # 먼저 토큰을 낸 공급자의 토큰만 전달
+    assert cancelled.wait(1) # 진 쪽의 호출은 취소
+    assert hedging._stats["hedged"] == 1
+    assert hedging._stats["secondary_wins"] == 1
+
+
+def test_empty_primary_result_hedges_before_threshold(monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGE_DEFAULT_THRESHOLD_SEC", 30)
+    calls = []
+
+    result = hedging.hedged_call("report", ("clova", lambda on_token, cancel_event: None), ("gemini", immediate("secondary", calls)))
+
+    assert result == "secondary"
+
+
+def test_no_secondary_waits_for_primary(monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGE_DEFAULT_THRESHOLD_SEC", 0.01)
+
+    def slow_primary(on_token, cancel_event):
+        cancel_event.wait(0.1)
+        return "primary"
+
+    assert hedging.hedged_call("report", ("clova", slow_primary)) == "primary"
+
+
+def test_both_failing_returns_none(monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGE_DEFAULT_THRESHOLD_SEC", 0.01)
+    failing = lambda on_token, cancel_event: None
+
+    assert hedging.hedged_call("report", ("clova", failing), ("gemini", failing)) is None
+    assert hedging._stats["failures"] == 1
+
+
+def cancel_after(cancel_token, seconds):
+    timer = threading.Timer(seconds, cancel_token.cancel, args=("연결 종료",))
+    timer.start()
+    return timer
+
+
+def test_cancel_after_first_token_raises_instead_of_returning_partial_text():
+    cancel_token = CancelToken()
+
+    def streaming(on_token, cancel_event):
+        on_token("부분 ")
+        cancel_event.wait(2)
+        return "부분 응답"
+
+    cancel_after(cancel_token, 0.05)
+    with pytest.raises(AnalysisCancelled):
+        hedging.hedged_call("report", ("clova", streaming), ("gemini", streaming), cancel_token=cancel_token)
+
+
+def test_cancel_during_hedge_is_not_counted_as_failure(monkeypatch):
+    monkeypatch.setattr(hedging, "HEDGE_DEFAULT_THRESHOLD_SEC", 0.05)
+    calls, cancelled, cancel_token = [], threading.Event(), CancelToken()
+
+    cancel_after(cancel_token, 0.15)
+    with pytest.raises(AnalysisCancelled):
+        hedging.hedged_call(
+            "report", ("clova", stalled(calls, cancelled)), ("gemini", stalled(calls, threading.Event(), "secondary")),
+            cancel_token=cancel_token,
+        )
+
+    assert cancelled.wait(1)
+    assert hedging._stats["hedged"] == 1
+    assert hedging._stats["failures"] == 0
+
+
+def test_cancel_without_secondary_raises():
+    calls, cancelled, cancel_token = [], threading.Event(), CancelToken()
+
+    cancel_after(cancel_token, 0.05)
+    with pytest.raises(AnalysisCancelled):
+        hedging.hedged_call("report", ("clova", stalled(calls, cancelled)), cancel_token=cancel_token)
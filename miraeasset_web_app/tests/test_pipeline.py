@@ -0,0 +1,88 @@
+# tests/test_pipeline.py
+# 단계 그래프 실행: 완료 순서와 관계없는 선언 순서 병합, 조상 단계 결과만 입력으로 전달, 그래프 검사, 체크포인트 복원
+
+import time
+
+import pytest
+
+from analysis_model.pipeline import run_stage_graph, restorable_stages
+
+
+def writer(value, delay=0.0):
+    """delay초 뒤 {"value": value}를 반환하는 단계"""
+    def run(state):
+        time.sleep(delay)
+        return {"value": value}
+    return run
+
+def stages_with_delays(first_delay, second_delay):
+    return [
+        {"name": "first", "run": writer("first", first_delay), "depends_on": []},
+        {"name": "second", "run": writer("second", second_delay), "depends_on": []},
+    ]
+
+
+@pytest.mark.parametrize("first_delay, second_delay", [(0.1, 0.0), (0.0, 0.1)])
+def test_merge_follows_declaration_order_not_completion_order(first_delay, second_delay):
+    final_state, durations = run_stage_graph({"ticker": "AAPL"}, stages_with_delays(first_delay, second_delay))
+
+    assert final_state["value"] == "second" # 나중에 선언된 단계의 결과가 이긴다
+    assert final_state["ticker"] == "AAPL"
+    assert set(durations) == {"first", "second"}
+
+
+def test_stage_input_contains_only_ancestor_results():
+    seen = {}
+
+    def reader(state):
+        seen["value"] = state.get("value")
+        return {}
+
+    stages = stages_with_delays(0.0, 0.05) + [{"name": "reader", "run": reader, "depends_on": ["first"]}]
+    run_stage_graph({}, stages)
+
+    assert seen["value"] == "first" # 조상이 아닌 'second'의 결과는 보이지 않는다
+
+
+def test_completion_callbacks_use_declaration_order_for_simultaneous_stages():
+    done = []
+    stages = stages_with_delays(0.0, 0.0)
+    stages.append({"name": "last", "run": writer("last"), "depends_on": ["first", "second"]})
+
+    run_stage_graph({}, stages, on_stage_done=lambda name, elapsed: done.append(name))
+
+    assert done[-1] == "last"
+    assert sorted(done[:2]) == ["first", "second"]
+
+
+@pytest.mark.parametrize("stages, message", [
+    ([{"name": "a", "run": writer("a"), "depends_on": ["missing"]}], "없는 단계"),
+    ([{"name": "a", "run": writer("a"), "depends_on": ["b"]}, {"name": "b", "run": writer("b"), "depends_on": ["a"]}], "순환"),
+])
+def test_invalid_graphs_are_rejected(stages, message):
+    with pytest.raises(ValueError, match=message):
+        run_stage_graph({}, stages)
+
+
+def test_checkpointed_stages_are_restored_without_running():
+    ran = []
+
+    def tracked(name):
+        def run(state):
+            ran.append(name)
+            return {name: True}
+        return run
+
+    stages = [
+        {"name": "prep", "run": tracked("prep"), "depends_on": []},
+        {"name": "news", "run": tracked("news"), "depends_on": ["prep"]},
+        {"name": "report", "run": tracked("report"), "depends_on": ["news"]},
+    ]
+    # 조상(prep)의 체크포인트가 없는 단계(news)는 복원하지 않는다
+    assert restorable_stages(stages, {"news": {"news": True}}) == set()
+
+    final_state, durations = run_stage_graph({}, stages, checkpoints={"prep": {"prep": "saved"}})
+
+    assert ran == ["news", "report"]
+    assert final_state["prep"] == "saved"
+    assert "prep" not in durations
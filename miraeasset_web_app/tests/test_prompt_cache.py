@@ -0,0 +1,146 @@
+# tests/test_prompt_cache.py
+# 고정 프롬프트 캐시의 재사용, 만료 전 갱신, 생성 실패 시 재시도 대기, 전체 프롬프트 대체 호출
+
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+import pytest
+from google.genai import types
+
+from analysis_model import prompt_cache
+
+MODEL = "gemini-2.5-flash"
+PREFIX = "고정 지시사항 " * 10
+TAIL = "후보 뉴스 목록"
+
+
+class FakeCaches:
+    def __init__(self, clock, ttl_sec=3600, fail=False):
+        self.clock = clock
+        self.ttl_sec = ttl_sec
+        self.fail = fail
+        self.created = []
+        self.configs = []
+
+    def create(self, model, config):
+        if self.fail:
+            raise RuntimeError("cached content is too small")
+        name = f"cachedContents/{len(self.created) + 1}"
+        self.configs.append(config)
+        self.created.append(name)
+        expire_time = datetime.fromtimestamp(self.clock["now"] + self.ttl_sec, tz=timezone.utc)
+        return SimpleNamespace(name=name, expire_time=expire_time)
+
+
+class FakeModels:
+    def __init__(self, fail_cached=False):
+        self.fail_cached = fail_cached
+        self.calls = [] # (보낸 텍스트, cached_content)
+        self.configs = []
+
+    def generate_content_stream(self, model, contents, config):
+        text = contents[0].parts[0].text
+        self.calls.append((text, config.cached_content))
+        self.configs.append(config)
+        if config.cached_content and self.fail_cached:
+            raise RuntimeError("cached content not found")
+        return iter([SimpleNamespace(text="응답", usage_metadata=None)])
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    current = {"now": 1_000_000.0}
+    monkeypatch.setattr(prompt_cache.time, "time", lambda: current["now"])
+    monkeypatch.setattr(prompt_cache, "_handles", {})
+    monkeypatch.setattr(prompt_cache, "_unavailable_until", {})
+    monkeypatch.setattr(prompt_cache, "PROMPT_CACHE_ENABLED", True)
+    monkeypatch.setattr(prompt_cache, "record_llm_call", lambda *args, **kwargs: None)
+    return current
+
+
+def make_client(clock, **cache_options):
+    return SimpleNamespace(caches=FakeCaches(clock, **cache_options), models=FakeModels())
+
+
+def test_cache_is_reused_until_refresh_margin(clock):
+    client = make_client(clock, ttl_sec=600)
+
+    first = prompt_cache.get_prefix_cache(client, MODEL, PREFIX, "news")
+    clock["now"] += 600 - prompt_cache.PROMPT_CACHE_REFRESH_MARGIN_SEC - 1
+    second = prompt_cache.get_prefix_cache(client, MODEL, PREFIX, "news")
+
+    assert first == second == "cachedContents/1"
+    assert client.caches.created == ["cachedContents/1"]
+
+
+def test_cache_is_recreated_near_expiry(clock):
+    client = make_client(clock, ttl_sec=600)
+
+    prompt_cache.get_prefix_cache(client, MODEL, PREFIX, "news")
+    clock["now"] += 600 - prompt_cache.PROMPT_CACHE_REFRESH_MARGIN_SEC + 1
+    refreshed = prompt_cache.get_prefix_cache(client, MODEL, PREFIX, "news")
+
+    assert refreshed == "cachedContents/2"
+
+
+def test_failed_creation_waits_before_retrying(clock):
+    client = make_client(clock, fail=True)
+
+    assert prompt_cache.get_prefix_cache(client, MODEL, PREFIX, "news") is None
+    client.caches.fail = False
+    clock["now"] += prompt_cache.PROMPT_CACHE_RETRY_SEC - 1
+    assert prompt_cache.get_prefix_cache(client, MODEL, PREFIX, "news") is None
+    clock["now"] += 2
+    assert prompt_cache.get_prefix_cache(client, MODEL, PREFIX, "news") == "cachedContents/1"
+
+
+def test_cached_call_sends_only_the_tail(clock):
+    client = make_client(clock)
+
+    text = prompt_cache.generate_with_prefix_cache(client, MODEL, PREFIX, TAIL, types.GenerateContentConfig(), "news")
+
+    assert text == "응답"
+    assert client.models.calls == [(TAIL, "cachedContents/1")]
+
+
+def test_failed_cached_call_falls_back_to_full_prompt(clock):
+    client = make_client(clock)
+    client.models.fail_cached = True
+
+    text = prompt_cache.generate_with_prefix_cache(client, MODEL, PREFIX, TAIL, types.GenerateContentConfig(), "news")
+
+    assert text == "응답"
+    assert client.models.calls == [(TAIL, "cachedContents/1"), (PREFIX + TAIL, None)]
+    assert prompt_cache._handles == {} # 실패한 캐시는 버려서 다음 요청에서 새로 만든다
+
+
+def test_tools_are_registered_with_the_cache(clock):
+    client = make_client(clock)
+    config = types.GenerateContentConfig(tools=[types.Tool(google_search=types.GoogleSearch())])
+
+    prompt_cache.generate_with_prefix_cache(client, MODEL, PREFIX, TAIL, config, "news")
+
+    assert client.caches.configs[0].tools == config.tools
+    assert client.models.calls == [(TAIL, "cachedContents/1")]
+    assert client.models.configs[0].tools is None # 캐시를 사용하는 요청에는 도구를 보내지 않는다
+
+
+def test_tools_use_a_separate_cache(clock):
+    client = make_client(clock)
+    grounded = types.GenerateContentConfig(tools=[types.Tool(google_search=types.GoogleSearch())])
+
+    prompt_cache.generate_with_prefix_cache(client, MODEL, PREFIX, TAIL, types.GenerateContentConfig(), "news")
+    prompt_cache.generate_with_prefix_cache(client, MODEL, PREFIX, TAIL, grounded, "news")
+
+    assert client.caches.created == ["cachedContents/1", "cachedContents/2"]
+
+
+def test_fallback_keeps_tools_on_the_full_prompt(clock):
+    client = make_client(clock)
+    client.models.fail_cached = True
+    config = types.GenerateContentConfig(tools=[types.Tool(google_search=types.GoogleSearch())])
+
+    prompt_cache.generate_with_prefix_cache(client, MODEL, PREFIX, TAIL, config, "news")
+
+    assert client.models.calls[-1] == (PREFIX + TAIL, None)
+    assert client.models.configs[-1].tools == config.tools
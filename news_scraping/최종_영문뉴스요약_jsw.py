@@ -1,6 +1,7 @@
 #라이브러리
 ##기본 작업
 import os
+import sys
 import pandas as pd
 import numpy as np
 import time
@@ -26,6 +27,24 @@ from google import genai
 from google.genai import types
 
 
+###########################################################
+# 0. 공용 모듈 (LLM 호출 기록, 동시 실행, 임베딩 캐시, 요약본 일괄 임베딩, 본문 압축, 일괄 요약)
+# 국내 뉴스 스크래퍼, 기업설명 노트북과 같은 코드를 사용하도록 저장소 루트의 scraping_common.py에서 가져온다
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # 저장소 루트 (Docker 이미지에서는 같은 폴더에 복사됨)
+from scraping_common import (
+    record_llm_call, RateLimiter, run_concurrently, save_failures, estimate_tokens, compress_article, summarize_articles,
+    EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE, load_cached_embeddings, save_cached_embeddings, get_summary_embeddings,
+)
+
+# 공급자별 분당 호출 제한 (스레드 간 공유)
+RATE_LIMITERS = {
+    "gemini": RateLimiter(int(os.environ.get("GEMINI_RPM", "10"))), # GEMINI 무료는 1분에 10번 호출 제한걸림
+    "embedding": RateLimiter(int(os.environ.get("GEMINI_EMBEDDING_RPM", "100"))),
+}
+
+# 요약본 임베딩(4. 벡터화)은 문서용(EMBEDDING_TASK_TYPE), 기사 선별의 제목 임베딩(1. 뉴스 리스트 추출)은 질의용으로 캐시에 따로 저장된다
+TITLE_EMBEDDING_TASK_TYPE = "RETRIEVAL_QUERY" # 기사 선별: 제목을 질의로, 기업 설명(문서)과 비교
+
 
 ###########################################################
 # 1. 뉴스 리스트 추출
@@ -149,9 +168,125 @@ target_urls = [
     "https://finance.yahoo.com/topic/electric-vehicles/"
 ]
 
+#########################
+# 관련도 기반 기사 선별
+## 페이지 순서대로 앞의 기사만 요약하면 하루 호출 한도를 관련 없는 기사에 쓰게 되므로
+## 스크랩/요약 전에 제목만으로 분석 대상 기업(company_summary 테이블)과의 관련도를 로컬에서 계산하고
+## 점수가 높은 기사부터 NEWS_ARTICLE_QUOTA개까지만 고른다
+## 점수 = 제목의 기업명/티커 적중 + 제목 임베딩과 기업 설명 임베딩의 최대 코사인 유사도
+NEWS_ARTICLE_QUOTA = int(os.environ.get("NEWS_ARTICLE_QUOTA", "100")) #한번에 100개, 하루에 총 200개 제한 <- gemini 2.5는 무료이용일 경우 하루에 250번 호출 제한
+TITLE_EMBEDDING_RANKING = os.environ.get("TITLE_EMBEDDING_RANKING", "on").lower() != "off" # off면 키워드 적중만 사용
+KEYWORD_HIT_WEIGHT = 1.0
+EMBEDDING_SIMILARITY_WEIGHT = 1.0
+COMPANY_NAME_SUFFIX_PATTERN = re.compile(
+    r"[,.]?\s+(inc|incorporated|corp|corporation|co|company|ltd|limited|plc|holdings?|group|class [a-z])\.?$", re.IGNORECASE
+)
+
+COMPANY_PAGE_SIZE = 1000 # Supabase 한 번의 조회에서 반환하는 최대 행 수
+
+def load_company_universe() -> list[dict]:
+    """company_summary 테이블에서 기업명, 티커, 기업 설명 임베딩을 불러옵니다. (실패 시 빈 목록)"""
+    try:
+        supabase_client = create_client(os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY"))
+        # 기업 수가 최대 행 수를 넘을 수 있으므로 티커 순으로 정렬하여 페이지 단위로 조회
+        rows, offset = [], 0
+        while True:
+            page = supabase_client.table("company_summary").select("company_name, ticker, summary_embedding").order("ticker").range(offset, offset + COMPANY_PAGE_SIZE - 1).execute().data or []
+            rows += page
+            if len(page) < COMPANY_PAGE_SIZE:
+                break
+            offset += COMPANY_PAGE_SIZE
+    except Exception as e:
+        print(f"  [알림] 기업 목록을 불러오지 못했습니다: {e}")
+        return []
+
+    companies = []
+    for row in rows:
+        name = row.get("company_name") or ""
+        while COMPANY_NAME_SUFFIX_PATTERN.search(name): # "Apple Inc." -> "Apple"
+            name = COMPANY_NAME_SUFFIX_PATTERN.sub("", name)
+        embedding = row.get("summary_embedding")
+        if isinstance(embedding, str): # DB에는 문자열로 저장되어 있음
+            embedding = json.loads(embedding)
+        companies.append({
+            "name": name.strip(),
+            "ticker": (row.get("ticker") or "").split(".")[0], # "005930.KS" -> "005930"
+            "embedding": np.array(embedding, dtype=float) if embedding else None,
+        })
+    return companies
+
+def keyword_hit(title: str, companies: list[dict]) -> bool:
+    """제목에 기업명(대소문자 무시) 또는 티커(대문자 3자 이상)가 단어 단위로 들어있는지 확인합니다."""
+    for company in companies:
+        if len(company["name"]) >= 3 and re.search(rf"\b{re.escape(company['name'])}\b", title, re.IGNORECASE):
+            return True
+        if len(company["ticker"]) >= 3 and re.search(rf"\b{re.escape(company['ticker'])}\b", title):
+            return True
+    return False
+
+def embed_titles(titles: list[str], client: genai.Client) -> list[list[float] | None]:
+    """
+    기사 제목을 질의용(RETRIEVAL_QUERY)으로 100개씩 묶어 임베딩합니다. (임베딩 캐시 우선, 실패한 묶음은 None)
+    제목 벡터는 요약본의 문서용 벡터와 섞이지 않도록 캐시에도 질의용 작업 유형으로 저장합니다.
+    """
+    cached = load_cached_embeddings(titles, task_type=TITLE_EMBEDDING_TASK_TYPE)
+    vectors = [cached.get(i) for i in range(len(titles))]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+        batch = missing[start:start + EMBEDDING_BATCH_SIZE]
+        RATE_LIMITERS["embedding"].acquire()
+        started = time.perf_counter()
+        try:
+            result = client.models.embed_content(
+                model=EMBEDDING_MODEL,
+                contents=[titles[i] for i in batch],
+                config=types.EmbedContentConfig(task_type=TITLE_EMBEDDING_TASK_TYPE)
+            )
+        except Exception as e:
+            print(f"  [알림] 제목 임베딩 실패, 해당 기사는 키워드 점수만 사용합니다: {e}")
+            record_llm_call("gemini", "text-embedding-004", "en_title_embedding", latency_sec=time.perf_counter() - started, outcome="error")
+            continue
+        record_llm_call("gemini", "text-embedding-004", "en_title_embedding", latency_sec=time.perf_counter() - started)
+        batch_vectors = [obj.values for obj in result.embeddings]
+        for i, vector in zip(batch, batch_vectors):
+            vectors[i] = vector
+        save_cached_embeddings([(titles[i], vector) for i, vector in zip(batch, batch_vectors)], task_type=TITLE_EMBEDDING_TASK_TYPE)
+    return vectors
+
+def rank_articles(article_list: list[dict], quota: int) -> list[dict]:
+    """
+    기사 목록을 분석 대상 기업과의 관련도 순으로 정렬하여 상위 quota개를 반환합니다.
+    기업 목록을 불러올 수 없으면 기존처럼 페이지 순서대로 자릅니다.
+    """
+    if len(article_list) <= quota:
+        return article_list
+    companies = load_company_universe()
+    if not companies:
+        return article_list[:quota]
+
+    titles = [article["title"] for article in article_list]
+    scores = np.array([KEYWORD_HIT_WEIGHT if keyword_hit(title, companies) else 0.0 for title in titles])
+
+    company_vectors = [company["embedding"] for company in companies if company["embedding"] is not None]
+    if TITLE_EMBEDDING_RANKING and company_vectors:
+        company_matrix = np.vstack(company_vectors)
+        company_matrix /= np.linalg.norm(company_matrix, axis=1, keepdims=True) + 1e-12
+        client = genai.Client(api_key=os.environ.get("GEMINI_API_KEY"))
+        for i, vector in enumerate(embed_titles(titles, client)):
+            if vector is None:
+                continue
+            title_vector = np.array(vector, dtype=float)
+            title_vector /= np.linalg.norm(title_vector) + 1e-12
+            scores[i] += EMBEDDING_SIMILARITY_WEIGHT * float(np.max(company_matrix @ title_vector))
+
+    order = sorted(range(len(article_list)), key=lambda i: scores[i], reverse=True) # 동점이면 페이지 순서 유지
+    selected = [article_list[i] for i in order[:quota]]
+    print(f"관련도 상위 {len(selected)}개 기사를 선택했습니다. (전체 {len(article_list)}개, 키워드 적중 {int((scores[order[:quota]] >= KEYWORD_HIT_WEIGHT).sum())}개)")
+    return selected
+
 # 함수 실행
 news_list = get_all_news_links(target_urls)
-news_list = news_list[:100] #한번에 100개, 하루에 총 200개 제한 <- gemini 2.5는 무료이용일 경우 하루에 250번 호출 제한
+news_list = rank_articles(news_list, NEWS_ARTICLE_QUOTA) # 관련도 높은 기사부터 호출 한도만큼
 
 ##############################################
 # 2. 뉴스 스크랩
@@ -243,7 +378,9 @@ def analyze_news_article(article_text: str, api_key: str) -> str:
     """
     하나의 뉴스 기사 텍스트를 받아 Gemini API로 분석하고 결과를 반환하는 함수.
     보내주신 공식 예제 구조를 그대로 따릅니다.
+    호출 실패는 예외로 전달하여 run_concurrently가 기사별 실패로 기록하도록 합니다.
     """
+    started = time.perf_counter()
     try:
         client = genai.Client(api_key=api_key) # gemini 클라이언트를 생성
         model = "gemini-2.5-flash" # "gemini-2.5-flash" 모델 사용
@@ -290,59 +427,152 @@ ARTICLE TO ANALYZE:
         
         # gemini 작동
         response_chunks = []
+        usage = None
         for chunk in client.models.generate_content_stream(
             model=model,
             contents=contents,
         ):
             response_chunks.append(chunk.text)
-        time.sleep(5) #GEMINI 무료는 1분에 10번 호출 제한걸림
+            usage = chunk.usage_metadata or usage
+        record_llm_call(
+            "gemini", model, "en_news_summary",
+            prompt_tokens=usage.prompt_token_count if usage else None,
+            completion_tokens=usage.candidates_token_count if usage else None,
+            latency_sec=time.perf_counter() - started,
+        )
         
         return "".join(response_chunks)
 
+    except Exception:
+        record_llm_call("gemini", "gemini-2.5-flash", "en_news_summary", latency_sec=time.perf_counter() - started, outcome="error")
+        raise
+
+
+#########################
+# 요약 전 본문 압축
+## 본문 압축(compress_article)은 scraping_common.py의 공용 함수를 사용하고, 여기서는 영문 기사용 문장/단어 분리와 안내 문구만 정의한다
+## 본문이 비었거나 영상만 있는 페이지는 API 호출 전에 제외한다
+ARTICLE_TOKEN_BUDGET = int(os.environ.get("ARTICLE_TOKEN_BUDGET", "1500")) # 기사 하나의 최대 입력 토큰
+MIN_ARTICLE_CHARS = 200 # 이보다 짧은 본문은 요약할 내용이 없는 페이지로 본다
+VIDEO_ONLY_PATTERN = re.compile(r"\b(watch|video|live coverage|click here)\b", re.IGNORECASE)
+BOILERPLATE_PATTERN = re.compile(
+    r"(all rights reserved|sign up for|subscribe to|click here|read more:|for more news|follow us on|terms and privacy)",
+    re.IGNORECASE,
+)
+STOPWORDS = {
+    "the", "and", "for", "that", "with", "this", "from", "are", "was", "were", "has", "have", "had", "its", "but",
+    "not", "will", "would", "could", "said", "says", "also", "than", "they", "their", "which", "about", "into",
+    "more", "been", "after", "over", "there", "what", "when", "who", "his", "her", "can", "our", "you", "your",
+}
+
+def is_empty_article(text) -> bool:
+    """본문이 없거나, 짧은 안내 문구와 영상만 있는 페이지인지 확인합니다."""
+    if not isinstance(text, str) or len(text.strip()) < MIN_ARTICLE_CHARS:
+        return True
+    # 영상 페이지는 본문 대신 짧은 소개 문구만 있다
+    return len(text) < MIN_ARTICLE_CHARS * 3 and bool(VIDEO_ONLY_PATTERN.search(text))
+
+def split_sentences(text: str) -> list[str]:
+    return [s.strip() for s in re.split(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])", text) if s.strip()]
+
+def _words(sentence: str) -> list[str]:
+    return [w for w in re.findall(r"[a-z][a-z'-]{2,}", sentence.lower()) if w not in STOPWORDS]
+
+#########################
+# 여러 기사 일괄 요약
+## 기사마다 호출하면 하루 호출 한도(무료 250회) 때문에 처리 가능한 기사 수가 제한되므로 여러 기사를 한 요청에 묶는다
+## 묶음 구성과 재시도(summarize_articles)는 scraping_common.py의 공용 함수를 사용하고, 여기서는 Gemini 일괄 요약 호출만 정의한다
+SUMMARY_BATCH_TOKEN_BUDGET = int(os.environ.get("SUMMARY_BATCH_TOKEN_BUDGET", "12000")) # 한 요청에 넣는 기사 본문의 토큰 상한
+SUMMARY_BATCH_MAX_ARTICLES = 10 # 한 요청에 넣는 최대 기사 수
+
+def analyze_news_batch(batch: list[tuple[int, str]], api_key: str) -> dict[int, str]:
+    """
+    여러 기사를 한 번의 Gemini 호출로 요약하여 {기사 id: 요약문}을 반환합니다.
+    응답 스키마(JSON 배열)를 지정하며, 실패하면 빈 dict를 반환합니다. (호출 측에서 개별 재시도)
+    """
+    model = "gemini-2.5-flash"
+    articles_text = "\n\n".join(f"### ARTICLE id={article_id} ###\n{text}" for article_id, text in batch)
+    prompt = f"""You are an expert stock analyst. Your task is to analyze several English news articles and provide a summary for EACH article.
+
+### INSTRUCTIONS ###
+1.  Analyze each article for key information relevant to investors (e.g., corporate earnings, new products, M&A, regulatory changes).
+2.  For each article, create a three-sentence summary in English.
+3.  Each summary must explicitly state whether the nuance of the news is positive, negative, or neutral for investors.
+4.  Return a JSON array with exactly one object per article: {{"id": <article id>, "summary": "<three-sentence summary>"}}.
+
+---
+ARTICLES TO ANALYZE:
+---
+
+{articles_text}"""
+    started = time.perf_counter()
+    try:
+        client = genai.Client(api_key=api_key)
+        response = client.models.generate_content(
+            model=model,
+            contents=prompt,
+            config=types.GenerateContentConfig(
+                response_mime_type="application/json",
+                response_schema={
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"id": {"type": "integer"}, "summary": {"type": "string"}},
+                        "required": ["id", "summary"],
+                    },
+                },
+            ),
+        )
+        usage = response.usage_metadata
+        record_llm_call(
+            "gemini", model, "en_news_summary_batch",
+            prompt_tokens=usage.prompt_token_count if usage else None,
+            completion_tokens=usage.candidates_token_count if usage else None,
+            latency_sec=time.perf_counter() - started,
+        )
+        batch_ids = {article_id for article_id, _ in batch}
+        return {
+            item["id"]: item["summary"] for item in json.loads(response.text)
+            if isinstance(item, dict) and item.get("id") in batch_ids and str(item.get("summary", "")).strip()
+        }
     except Exception as e:
-        print(f"An error occurred: {e}")
-        return '{"summary": "Error during analysis."}'
+        print(f"  [일괄 요약 오류] {e}")
+        record_llm_call("gemini", model, "en_news_summary_batch", latency_sec=time.perf_counter() - started, outcome="error")
+        return {}
 
 
 # gemini API 실행
 if __name__ == "__main__":
 
-    df['summary'] = df['content'].apply(lambda content: analyze_news_article(content, api_key=API_KEY))
+    # 빈 페이지/영상 페이지 제외 후 압축한 본문으로 요약
+    empty_mask = df['content'].apply(is_empty_article)
+    if empty_mask.any():
+        print(f"본문이 없거나 영상만 있는 기사 {int(empty_mask.sum())}개를 제외합니다.")
+    df = df[~empty_mask].reset_index(drop=True)
+    compressed = [compress_article(content, ARTICLE_TOKEN_BUDGET, split_sentences, _words, BOILERPLATE_PATTERN) for content in df['content']]
+    print(f"본문 압축: 약 {sum(estimate_tokens(c) for c in df['content'])} → {sum(estimate_tokens(c) for c in compressed)} 토큰")
+
+    summaries, failures = summarize_articles(
+        compressed,
+        lambda content: analyze_news_article(content, api_key=API_KEY),
+        lambda batch: analyze_news_batch(batch, API_KEY),
+        RATE_LIMITERS["gemini"], "en_news_summary", SUMMARY_BATCH_TOKEN_BUDGET, SUMMARY_BATCH_MAX_ARTICLES,
+    )
+    df['summary'] = summaries
 
 ############################################3
 # 4. 벡터화 (임베딩)
-
-def get_summary_embedding(summary_text: str, client: genai.Client) -> list[float] | None:
-    """
-    하나의 요약본 텍스트를 받아 임베딩 벡터를 반환하는 함수.
-    """
-    # 내용이 비어있는지 확인
-    if not summary_text or pd.isna(summary_text):
-        return None
-    
-    try:
-        # 'contents'가 아닌 'content' 파라미터로 단일 텍스트를 전달
-        result = client.models.embed_content(
-            model="models/text-embedding-004",
-            contents=summary_text,
-            config=types.EmbedContentConfig(task_type="RETRIEVAL_DOCUMENT")
-        )
-        # 결과 객체에서 .embedding 속성으로 벡터를 직접 반환
-        vectors = [obj.values for obj in result.embeddings]
-        vectors=vectors[0]
-
-        return vectors
-    
-    except Exception as e:
-        print(f"API Error embedding '{summary_text[:50]}...': {e}")
-        return None
-
+# 요약본 일괄 임베딩(get_summary_embeddings)은 scraping_common.py의 공용 함수를 사용한다
 
 # 임베딩 함수 실행
 if __name__ == "__main__":
     # 클라이언트는 한 번만 생성합니다.
     client = genai.Client(api_key=API_KEY)
-    df['embedding'] = df['summary'].apply(lambda text: get_summary_embedding(text, client))
+    embeddings, embedding_failures = get_summary_embeddings(df['summary'].tolist(), client, RATE_LIMITERS["embedding"], "en_news_embedding")
+    df['embedding'] = embeddings
+
+    # 요약/임베딩에 실패한 기사는 기록해두고 업로드에서 제외 (다음 실행에서 다시 수집됨)
+    df = save_failures(df, failures + embedding_failures)
 
 #################################################3
 # 6. Supabase 데이터베이스에 업로드
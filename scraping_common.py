@@ -0,0 +1,400 @@
+# scraping_common.py
+# 뉴스 스크래퍼(news_scraping, ko_news_scraping)와 기업설명 노트북(주식데이터/기업설명추가_jsw.ipynb)이 함께 사용하는 공용 모듈
+# 각 파일에 같은 코드를 붙여 넣으면 한쪽만 고쳐지는 문제가 생기므로 한 곳에서 관리한다
+## 0. LLM 호출 기록 (ledger)
+## 0-1. 동시 실행 (호출 제한 + 스레드 풀)
+## 0-2. 임베딩 캐시
+## 0-3. 요약본 일괄 임베딩
+## 0-4. 요약 전 본문 압축
+## 0-5. 여러 기사 일괄 요약
+# 스크래퍼 Docker 이미지는 저장소 루트에서 빌드하여 이 파일을 함께 복사한다 (예: docker build -f news_scraping/Dockerfile .)
+
+import os
+import re
+import time
+import json
+import hashlib
+import sqlite3
+import threading
+from collections import deque
+from typing import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from google import genai
+from google.genai import types
+
+
+###########################################################
+# 0. LLM 호출 기록 (ledger)
+# 모든 LLM/임베딩 호출의 토큰, 지연시간, 결과를 JSON Lines 파일에 기록한다
+# 웹 앱(analysis_model/llm_ledger.py)과 같은 형식이므로 LLM_LEDGER_PATH를 공유하면 일별 집계에 함께 포함된다
+LLM_LEDGER_PATH = os.environ.get("LLM_LEDGER_PATH", "llm_ledger.jsonl")
+_ledger_lock = threading.Lock() # 동시 실행 중인 호출들이 같은 파일에 기록하므로
+
+def record_llm_call(provider, model, stage, prompt_tokens=None, completion_tokens=None, latency_sec=None, outcome="success", cached_tokens=None):
+    """LLM 호출 한 건을 장부 파일에 추가합니다. (기록 실패는 무시)"""
+    entry = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "provider": provider, "model": model, "stage": stage,
+        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "cached_tokens": cached_tokens,
+        "latency_sec": round(latency_sec, 3) if latency_sec is not None else None,
+        "outcome": outcome,
+    }
+    try:
+        with _ledger_lock, open(LLM_LEDGER_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"[LLM Ledger] 기록 실패: {e}")
+
+
+###########################################################
+# 0-1. 동시 실행 (호출 제한 + 스레드 풀)
+# 요약/임베딩 호출을 기사마다 순서대로 기다리면 전체 시간이 모든 호출 지연시간의 합이 되므로
+# 공급자별 분당 호출 제한(RateLimiter)을 지키면서 여러 요청을 동시에 보낸다
+# 결과는 입력 순서대로 돌려주고, 실패는 출력만 하고 버리지 않고 기사별로 모아 둔다
+# 공급자별 제한기(RATE_LIMITERS)는 스크래퍼마다 사용하는 공급자가 다르므로 각 스크래퍼에서 만든다
+MAX_CONCURRENCY = int(os.environ.get("SCRAPER_MAX_CONCURRENCY", "4")) # 동시에 보내는 최대 요청 수
+SCRAPER_FAILURES_PATH = os.environ.get("SCRAPER_FAILURES_PATH", "failed_articles.jsonl") # 실패 기사 기록 파일
+
+class RateLimiter:
+    """최근 60초 동안의 호출 수가 분당 제한을 넘지 않도록 대기시키는 제한기 (스레드 간 공유)"""
+
+    def __init__(self, requests_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._calls and now - self._calls[0] >= 60:
+                    self._calls.popleft()
+                if len(self._calls) < self.requests_per_minute:
+                    self._calls.append(now)
+                    return
+                wait = 60 - (now - self._calls[0])
+            time.sleep(wait)
+
+def run_concurrently(fn, items, limiter, stage, max_workers=MAX_CONCURRENCY):
+    """
+    items 각각에 fn을 동시에 실행하고 (입력 순서대로의 결과, 실패 목록)을 반환합니다.
+    실패한 항목의 결과는 None이며, 실패 목록에는 {"index", "stage", "error"}가 담깁니다.
+    """
+    def task(item):
+        limiter.acquire()
+        return fn(item)
+
+    results, failures = [], []
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(task, item) for item in items]
+        for i, future in enumerate(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"  [실패] {stage} #{i}: {e}")
+                results.append(None)
+                failures.append({"index": i, "stage": stage, "error": str(e)})
+    return results, failures
+
+def save_failures(df, failures):
+    """실패 목록에 기사 제목/링크를 붙여 파일에 기록하고, 실패한 기사를 제외한 DataFrame을 반환합니다."""
+    if not failures:
+        return df
+    ts = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    with open(SCRAPER_FAILURES_PATH, "a", encoding="utf-8") as f:
+        for failure in failures:
+            row = df.iloc[failure["index"]]
+            f.write(json.dumps({"ts": ts, "title": row["title"], "url": row["url"], **failure}, ensure_ascii=False) + "\n")
+    failed = sorted({failure["index"] for failure in failures})
+    print(f"⚠️ {len(failed)}개 기사 처리에 실패하여 업로드에서 제외합니다. (상세: {SCRAPER_FAILURES_PATH})")
+    return df.drop(df.index[failed]).reset_index(drop=True)
+
+
+###########################################################
+# 0-2. 임베딩 캐시
+# 재실행, 중복 요약, 다시 만든 기업 설명처럼 같은 텍스트를 다시 임베딩하지 않도록
+# (모델, 작업 유형, 텍스트 sha256) -> 벡터를 로컬 SQLite 파일에 저장하고 임베딩 호출 전에 먼저 조회한다
+# 스크래퍼와 기업설명 노트북이 EMBEDDING_CACHE_PATH를 공유하면 서로의 결과도 재사용된다
+EMBEDDING_MODEL = "models/text-embedding-004"
+EMBEDDING_TASK_TYPE = "RETRIEVAL_DOCUMENT" # 검색용 문서 임베딩
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3")
+EMBEDDING_BATCH_SIZE = 100 # embed_content 한 번에 보낼 수 있는 최대 텍스트 수
+_embedding_cache_lock = threading.Lock() # 동시 실행 중인 임베딩 호출들이 같은 파일을 사용하므로
+
+def _open_embedding_cache():
+    conn = sqlite3.connect(EMBEDDING_CACHE_PATH, timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS embedding_cache ("
+        "model TEXT, task_type TEXT, text_sha256 TEXT, vector TEXT, created_at TEXT, "
+        "PRIMARY KEY (model, task_type, text_sha256))"
+    )
+    return conn
+
+def _text_sha256(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def load_cached_embeddings(texts: list[str], task_type: str = EMBEDDING_TASK_TYPE) -> dict[int, list[float]]:
+    """텍스트 목록 중 작업 유형이 같은 캐시에 있는 것의 {목록 위치: 벡터}를 반환합니다. (캐시를 열 수 없으면 빈 dict)"""
+    hashes = [_text_sha256(text) for text in texts]
+    found = {}
+    try:
+        with _embedding_cache_lock:
+            conn = _open_embedding_cache()
+            try:
+                unique = list(set(hashes))
+                for start in range(0, len(unique), 500): # SQLite 변수 개수 제한을 고려해 나눠서 조회
+                    chunk = unique[start:start + 500]
+                    rows = conn.execute(
+                        f"SELECT text_sha256, vector FROM embedding_cache WHERE model = ? AND task_type = ? AND text_sha256 IN ({','.join('?' * len(chunk))})",
+                        [EMBEDDING_MODEL, task_type, *chunk],
+                    ).fetchall()
+                    found.update({text_hash: json.loads(vector) for text_hash, vector in rows})
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"[Embedding Cache] 조회 실패: {e}")
+        return {}
+    return {i: found[text_hash] for i, text_hash in enumerate(hashes) if text_hash in found}
+
+def save_cached_embeddings(pairs: list[tuple[str, list[float]]], task_type: str = EMBEDDING_TASK_TYPE) -> None:
+    """(텍스트, 벡터) 목록을 작업 유형별 캐시에 저장합니다. (저장 실패는 임베딩 결과에 영향을 주지 않음)"""
+    created_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    rows = [(EMBEDDING_MODEL, task_type, _text_sha256(text), json.dumps(list(vector)), created_at) for text, vector in pairs]
+    try:
+        with _embedding_cache_lock:
+            conn = _open_embedding_cache()
+            try:
+                with conn: # 정상 종료 시 commit
+                    conn.executemany("INSERT OR REPLACE INTO embedding_cache VALUES (?, ?, ?, ?, ?)", rows)
+            finally:
+                conn.close()
+    except sqlite3.Error as e:
+        print(f"[Embedding Cache] 저장 실패: {e}")
+
+
+###########################################################
+# 0-3. 요약본 일괄 임베딩
+# embed_content는 텍스트 목록을 한 번에 받을 수 있으므로, 요약본마다 호출하지 않고
+# EMBEDDING_BATCH_SIZE개씩 묶어 호출한 뒤 벡터를 원래 행 순서에 맞춰 돌려준다
+# stage는 장부와 실패 목록에 남길 단계 이름이며 (예: "en_news_embedding"), 묶음 호출은 "<stage>_batch"로 기록한다
+
+def get_summary_embedding(summary_text: str, client: genai.Client, stage: str) -> list[float] | None:
+    """
+    하나의 요약본 텍스트를 받아 임베딩 벡터를 반환합니다. (빈 텍스트는 None)
+    호출 실패는 예외로 전달하여 run_concurrently가 기사별 실패로 기록하도록 합니다.
+    """
+    if not isinstance(summary_text, str) or not summary_text.strip(): # None, NaN 포함
+        return None
+
+    # 이미 임베딩한 텍스트는 캐시에서 반환
+    cached = load_cached_embeddings([summary_text]).get(0)
+    if cached is not None:
+        return cached
+
+    started = time.perf_counter()
+    try:
+        result = client.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=summary_text,
+            config=types.EmbedContentConfig(task_type=EMBEDDING_TASK_TYPE)
+        )
+    except Exception:
+        record_llm_call("gemini", "text-embedding-004", stage, latency_sec=time.perf_counter() - started, outcome="error")
+        raise
+    record_llm_call("gemini", "text-embedding-004", stage, latency_sec=time.perf_counter() - started)
+    vector = result.embeddings[0].values
+    save_cached_embeddings([(summary_text, vector)])
+    return vector
+
+def embed_batch(texts: list[str], client: genai.Client, stage: str) -> list[list[float]]:
+    """텍스트 목록을 한 번의 호출로 임베딩하여 같은 순서의 벡터 목록을 반환합니다. (실패 시 예외)"""
+    started = time.perf_counter()
+    try:
+        result = client.models.embed_content(
+            model=EMBEDDING_MODEL,
+            contents=texts,
+            config=types.EmbedContentConfig(task_type=EMBEDDING_TASK_TYPE)
+        )
+    except Exception:
+        record_llm_call("gemini", "text-embedding-004", f"{stage}_batch", latency_sec=time.perf_counter() - started, outcome="error")
+        raise
+    record_llm_call("gemini", "text-embedding-004", f"{stage}_batch", latency_sec=time.perf_counter() - started)
+    vectors = [obj.values for obj in result.embeddings]
+    if len(vectors) != len(texts):
+        raise ValueError(f"임베딩 개수 불일치: 요청 {len(texts)}개, 응답 {len(vectors)}개")
+    save_cached_embeddings(list(zip(texts, vectors))) # 묶음마다 바로 저장하여 중단 후 재실행해도 다시 호출하지 않음
+    return vectors
+
+def get_summary_embeddings(texts: list[str | None], client: genai.Client, limiter: RateLimiter, stage: str) -> tuple[list[list[float] | None], list[dict]]:
+    """
+    요약본 목록을 EMBEDDING_BATCH_SIZE개씩 묶어 임베딩하고 (입력 순서대로의 벡터, 실패 목록)을 반환합니다.
+    빈 텍스트는 호출 없이 None이며, 실패한 묶음은 텍스트별로 다시 호출하여 끝까지 실패한 행만 실패 목록에 남깁니다.
+    임베딩 캐시에 있는 텍스트는 호출하지 않습니다.
+    """
+    vectors = [None] * len(texts)
+    valid = [i for i, text in enumerate(texts) if isinstance(text, str) and text.strip()]
+
+    cached = load_cached_embeddings([texts[i] for i in valid])
+    for position, vector in cached.items():
+        vectors[valid[position]] = vector
+    if cached:
+        print(f"임베딩 캐시에서 {len(cached)}개를 재사용합니다.")
+    valid = [i for position, i in enumerate(valid) if position not in cached]
+    batches = [valid[start:start + EMBEDDING_BATCH_SIZE] for start in range(0, len(valid), EMBEDDING_BATCH_SIZE)]
+    print(f"요약본 {len(valid)}개를 {len(batches)}개 요청으로 임베딩합니다.")
+    results, _ = run_concurrently(
+        lambda batch: embed_batch([texts[i] for i in batch], client, stage), batches, limiter, f"{stage}_batch"
+    )
+    retry = []
+    for batch, result in zip(batches, results):
+        if result is None:
+            retry.extend(batch)
+            continue
+        for i, vector in zip(batch, result):
+            vectors[i] = vector
+
+    # 실패한 묶음만 텍스트별로 재시도
+    if not retry:
+        return vectors, []
+    print(f"임베딩에 실패한 묶음의 요약본 {len(retry)}개를 개별 임베딩합니다.")
+    retried, failures = run_concurrently(
+        lambda text: get_summary_embedding(text, client, stage), [texts[i] for i in retry], limiter, stage
+    )
+    for i, vector in zip(retry, retried):
+        vectors[i] = vector
+    for failure in failures:
+        failure["index"] = retry[failure["index"]] # 재시도 목록 위치 -> 행 위치
+    return vectors, failures
+
+
+###########################################################
+# 0-4. 요약 전 본문 압축
+# 본문 전체를 그대로 보내면 긴 기사와 광고/저작권 안내 문구가 입력 토큰과 지연시간을 대부분 차지하므로
+# 외부 라이브러리 없이 "앞부분 가중치 + 키워드 빈도" 문장 점수로 중요한 문장만 남겨 기사당 토큰 예산에 맞춘다
+# 문장/단어 분리와 안내 문구 패턴은 언어마다 다르므로 각 스크래퍼가 넘긴다
+LEAD_SENTENCES = 3 # 앞부분 가중치를 주는 문장 수 (기사는 핵심을 앞에 쓰는 경우가 많음)
+LEAD_WEIGHT = 0.5
+KEYWORD_COUNT = 20 # 문장 점수 계산에 사용하는 상위 빈도 단어 수
+
+def estimate_tokens(text: str) -> int:
+    """토크나이저 없이 토큰 수를 근사합니다. (영문 약 4자당 1토큰, 한글 등 그 외 문자는 1자당 1토큰)"""
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    return ascii_chars // 4 + (len(text) - ascii_chars) + 1
+
+def _truncate_to_tokens(text: str, token_budget: int) -> str:
+    """estimate_tokens 기준으로 token_budget을 넘지 않도록 앞부분만 남깁니다."""
+    used = 0.0
+    for end, ch in enumerate(text):
+        used += 0.25 if ord(ch) < 128 else 1.0
+        if used > token_budget:
+            return text[:end]
+    return text
+
+def compress_article(
+    text: str,
+    token_budget: int,
+    split_sentences: Callable[[str], list[str]],
+    words: Callable[[str], list[str]],
+    boilerplate_pattern: re.Pattern,
+) -> str:
+    """
+    기사 본문을 토큰 예산 안으로 줄입니다. (예산 안이면 안내 문장만 제거)
+    문장 점수 = 상위 키워드 빈도 합(문장 길이로 정규화) + 앞부분 가중치 이며,
+    점수가 높은 문장부터 예산이 찰 때까지 고른 뒤 원래 순서대로 이어 붙입니다.
+    split_sentences는 본문을 문장 목록으로, words는 문장을 (불용어를 제외한) 단어 목록으로 나눕니다.
+    """
+    sentences = [s for s in split_sentences(text) if not boilerplate_pattern.search(s)]
+    if not sentences:
+        return text
+    if estimate_tokens(" ".join(sentences)) <= token_budget:
+        return " ".join(sentences)
+
+    frequency: dict[str, int] = {}
+    for sentence in sentences:
+        for word in words(sentence):
+            frequency[word] = frequency.get(word, 0) + 1
+    keywords = dict(sorted(frequency.items(), key=lambda item: item[1], reverse=True)[:KEYWORD_COUNT])
+    top_frequency = max(keywords.values(), default=1)
+
+    scores = []
+    for position, sentence in enumerate(sentences):
+        sentence_words = words(sentence)
+        keyword_score = sum(keywords.get(w, 0) for w in sentence_words) / (top_frequency * max(len(sentence_words), 1) ** 0.5)
+        lead_score = LEAD_WEIGHT / (position + 1) if position < LEAD_SENTENCES else 0.0
+        scores.append((keyword_score + lead_score, position))
+
+    selected, used_tokens = [], 0
+    for _, position in sorted(scores, reverse=True):
+        tokens = estimate_tokens(sentences[position])
+        if used_tokens + tokens > token_budget:
+            continue
+        selected.append(position)
+        used_tokens += tokens
+    if not selected: # 첫 문장 하나가 예산보다 긴 경우
+        return _truncate_to_tokens(sentences[0], token_budget)
+    return " ".join(sentences[position] for position in sorted(selected))
+
+
+###########################################################
+# 0-5. 여러 기사 일괄 요약
+# 기사마다 호출하면 호출 수(일일 한도)와 대기시간이 기사 수만큼 늘어나므로
+# 토큰 예산 안에서 여러 기사를 한 요청에 묶고, 기사 id별 요약을 받는다
+# 요약 호출은 공급자마다 다르므로 각 스크래퍼가 기사 하나 / 여러 기사 요약 함수를 넘기며,
+# 일괄 응답에서 빠진 기사만 기사 하나 요약 함수로 개별 재시도한다
+SUMMARY_MODE = os.environ.get("NEWS_SUMMARY_MODE", "batched") # "batched": 일괄 요약, "single": 기사마다 호출
+
+def build_summary_batches(contents: list[str], token_budget: int, max_articles: int) -> list[list[int]]:
+    """기사 인덱스를 토큰 예산과 최대 기사 수에 맞춰 묶습니다. (예산보다 긴 기사는 단독 배치)"""
+    batches, current, current_tokens = [], [], 0
+    for i, content in enumerate(contents):
+        tokens = estimate_tokens(content or "")
+        if current and (current_tokens + tokens > token_budget or len(current) >= max_articles):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def summarize_articles(
+    contents: list[str],
+    summarize_one: Callable[[str], str],
+    summarize_batch: Callable[[list[tuple[int, str]]], dict[int, str]],
+    limiter: RateLimiter,
+    stage: str,
+    batch_token_budget: int,
+    batch_max_articles: int,
+) -> tuple[list[str | None], list[dict]]:
+    """
+    기사 본문 목록을 동시에 요약합니다. (SUMMARY_MODE에 따라 일괄 또는 개별 호출)
+    summarize_one(본문)은 요약문을 반환하거나 예외를 발생시키고,
+    summarize_batch([(기사 id, 본문), ...])는 {기사 id: 요약문}을 반환합니다. (실패 시 빈 dict)
+    반환값: (입력 순서대로의 요약문, 실패 목록) - 실패한 기사의 요약문은 None
+    """
+    if SUMMARY_MODE != "batched":
+        return run_concurrently(summarize_one, contents, limiter, stage)
+
+    summaries: list[str | None] = [None] * len(contents)
+    batches = build_summary_batches(contents, batch_token_budget, batch_max_articles)
+    print(f"기사 {len(contents)}개를 {len(batches)}개 요청으로 일괄 요약합니다.")
+    results, _ = run_concurrently(
+        lambda batch: summarize_batch([(i, contents[i]) for i in batch]), batches, limiter, f"{stage}_batch"
+    )
+    for batch, result in zip(batches, results):
+        for i in batch:
+            summaries[i] = (result or {}).get(i)
+
+    # 일괄 응답에서 빠진 기사만 개별 재시도
+    missing = [i for i, summary in enumerate(summaries) if summary is None]
+    if not missing:
+        return summaries, []
+    print(f"일괄 응답에서 빠진 기사 {len(missing)}개를 개별 요약합니다.")
+    retried, failures = run_concurrently(summarize_one, [contents[i] for i in missing], limiter, stage)
+    for i, summary in zip(missing, retried):
+        summaries[i] = summary
+    for failure in failures:
+        failure["index"] = missing[failure["index"]] # 재시도 목록 위치 -> 기사 위치
+    return summaries, failures